@@ -0,0 +1,46 @@
+import argparse
+import pickle
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from games.stocks.dataset import PriceWindowDataset
+
+# usage (from the repository root, after python -m games.stocks.convert_stock_data):
+#   python -m benchmarks.stocks_dataset
+#
+# what a materialized TensorDataset of every window would hold against the lazy dataset, and DataLoader throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lazy windowed dataset against materializing every window")
+    parser.add_argument("--window", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--batches", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = PriceWindowDataset(window=args.window)
+    built = time.perf_counter() - start
+    x, y = dataset[0]
+    materialized = len(dataset) * (x.numel() + y.numel()) * x.element_size()
+    print(f"{len(dataset)} windows of {tuple(x.shape)} over {len(dataset.tickers)} tickers, index built in {1000 * built:.1f} ms")
+    print(f"materialized: {materialized / 2**20:.0f} MiB, lazy: {dataset.samples.nbytes / 2**20:.2f} MiB index, "
+          f"{len(pickle.dumps(dataset)) / 2**10:.0f} KiB pickled per worker")
+
+    print(f"{'workers':>7} {'samples/s':>10}")
+    for workers in args.workers:
+        loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True, num_workers=workers, generator=torch.Generator().manual_seed(0))
+        samples = 0
+        start = time.perf_counter()
+        for i, (x, y) in enumerate(loader):
+            samples += len(x)
+            if i + 1 == args.batches:
+                break
+        print(f"{workers:>7} {samples / (time.perf_counter() - start):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
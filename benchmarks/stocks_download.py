@@ -0,0 +1,52 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from games.stocks.download import FakeProvider, StockDownloader
+
+# usage (from the repository root):
+#   python -m benchmarks.stocks_download
+#
+# offline, FakeProvider sleeps `latency` per call in place of the network round trip
+# serial is the notebook loop: every shard fetched one after the other on every run
+
+
+def run(tickers, start: str, end: str, now: pd.Timestamp, latency: float, failure_rate: float, workers: int, runs: int):
+    root = tempfile.mkdtemp()
+    try:
+        results = []
+        for _ in range(runs):
+            provider = FakeProvider(latency=latency, failure_rate=failure_rate, now=now)
+            downloader = StockDownloader(provider, root, max_workers=workers, backoff=latency, now=now)
+            started = time.perf_counter()
+            summary = downloader.download(tickers, start, end)
+            results.append((time.perf_counter() - started, provider.calls, summary))
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serial against concurrent and incremental downloads with a fake provider")
+    parser.add_argument("--tickers", type=int, default=4)
+    parser.add_argument("--start", type=str, default="2023-01")
+    parser.add_argument("--end", type=str, default="2024-06")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    tickers = [f"T{i:03d}" for i in range(args.tickers)]
+    now = pd.Timestamp(args.end, tz="America/New_York") + pd.Timedelta(days=14)
+    print(f"{len(tickers)} tickers, {args.start} .. {args.end}, {1000 * args.latency:.0f} ms per call, {100 * args.failure_rate:.0f}% failures")
+    print(f"{'workers':>7} {'first run s':>12} {'calls':>6} {'bars':>8} {'next run s':>11} {'calls':>6}")
+    for workers in args.workers:
+        (first, first_calls, summary), (second, second_calls, _) = run(tickers, args.start, args.end, now, args.latency, args.failure_rate, workers, 2)
+        print(f"{workers:>7} {first:>12.2f} {first_calls:>6} {summary['bars']:>8} {second:>11.2f} {second_calls:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import time
+
+import numpy as np
+
+from games.stocks.features import FEATURES, FeatureEngine, reference_features
+from games.stocks.store import StockStore
+
+# usage (from the repository root, after python -m games.stocks.convert_stock_data):
+#   python -m benchmarks.stocks_features
+#
+# cost of the feature vector for one new bar: the streaming engine against recomputing it over the whole window
+
+
+def from_scratch(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    # the last row of reference_features with numpy, O(window) per bar
+    returns = np.log(close[1:] / close[:-1])
+    close_mean, close_std = close.mean(), close.std()
+    return_mean, return_std = returns.mean(), returns.std()
+    volume_mean, volume_std = volume.mean(), volume.std()
+    vwap = ((high + low + close) / 3 * volume).sum() / volume.sum()
+    return np.array((
+        returns[-1],
+        close[-1] / close_mean - 1,
+        close_std / close_mean,
+        (close[-1] - close_mean) / close_std,
+        return_mean,
+        return_std,
+        (returns[-1] - return_mean) / return_std,
+        close[-1] / vwap - 1,
+        (volume[-1] - volume_mean) / volume_std,
+        (high[-1] - low[-1]) / close[-1],
+    ), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="streaming FeatureEngine against recomputing the features every bar")
+    parser.add_argument("--ticker", type=str, default=None)
+    parser.add_argument("--windows", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    store = StockStore()
+    series = store.load(args.ticker or store.tickers[0])
+    high, low, close, volume = (np.asarray(series[column]) for column in ("high", "low", "close", "volume"))
+    print(f"{series.ticker}, {len(series)} bars, {len(FEATURES)} features")
+    print(f"{'window':>7} {'streaming us/bar':>17} {'numpy us/bar':>13} {'pandas us/bar':>14}")
+    for window in args.windows:
+        window = min(window, len(series) // 2)
+        engine = FeatureEngine(window)
+        start = time.perf_counter()
+        engine.transform(series)
+        streaming = (time.perf_counter() - start) / len(series)
+
+        bars = range(window, len(series))
+        start = time.perf_counter()
+        for i in bars:
+            from_scratch(high[i - window:i], low[i - window:i], close[i - window:i], volume[i - window:i])
+        numpy = (time.perf_counter() - start) / len(bars)
+
+        frame = series.to_frame()
+        samples = bars[::max(len(bars) // 200, 1)]
+        start = time.perf_counter()
+        for i in samples:
+            reference_features(frame.iloc[i - window:i], window).iloc[-1]
+        pandas = (time.perf_counter() - start) / len(samples)
+        print(f"{window:>7} {1e6 * streaming:>17.2f} {1e6 * numpy:>13.2f} {1e6 * pandas:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from games.stocks.download import FakeProvider, StockDownloader
+from games.stocks.envs.live_data import LiveDataEnv
+from games.stocks.feed import FeedClient, FeedServer, MarketReplay
+
+# usage (from the repository root):
+#   python -m benchmarks.stocks_feed
+#
+# replays a month of FakeProvider bars for every ticker in the test file and streams them into LiveDataEnvs,
+# in-process and over the websocket, speed 0 is as fast as possible (nights and weekends are collapsed to a minute)
+# unpaced over the socket the server gets ahead of the envs, its latency is mostly time spent queued
+
+TICKERS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "test"))
+
+
+def build_store(root: str, tickers, month: str):
+    now = pd.Timestamp(month, tz="America/New_York") + pd.offsets.MonthBegin(1) + pd.Timedelta(days=2)
+    StockDownloader(FakeProvider(now=now), root, max_workers=1, now=now).download(tickers, month, month)
+
+
+def run(root: str, tickers, start: pd.Timestamp, end: pd.Timestamp, speed: float, envs: int, window: int, socket: bool, port: int):
+    # one env per ticker, each with its own subscription to that ticker, stepped round robin,
+    # over the socket the subscriptions share one connection
+    tickers = tickers[:envs]
+    replay = MarketReplay(tickers, speed or None, start, end, store_root=root)
+    if socket:
+        server = FeedServer(replay, port=port)
+        thread = threading.Thread(target=asyncio.run, args=(server.serve(replay_delay=1.0), ), daemon=True)
+        thread.start()
+        time.sleep(0.2)
+        # the replay starts replay_delay after the server, once every client subscribed
+        feed = FeedClient(tickers, port=port)
+    else:
+        feed = replay
+    subscriptions = [feed.subscribe([ticker]) for ticker in tickers]
+    environments = [LiveDataEnv(window_size=window, store_root=root, tickers=[ticker], feed=subscription) for ticker, subscription in zip(tickers, subscriptions)]
+    for environment in environments:
+        environment.reset(seed=0)
+
+    latencies = []
+    observed = 0
+    running = list(environments)
+    if socket:
+        while replay.published == 0:
+            time.sleep(0.001)
+    else:
+        replay.start()
+    started = time.perf_counter()
+    while running:
+        for environment in list(running):
+            _, _, terminated, _, info = environment.step(2)
+            observed += info["ticks"]
+            if info["ticks"]:
+                latencies.append(info["latency"])
+            if terminated:
+                running.remove(environment)
+    elapsed = time.perf_counter() - started
+    if socket:
+        feed.close()
+        thread.join(5)
+    return replay.published, observed, elapsed, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="market feed replay into streaming LiveDataEnvs")
+    parser.add_argument("--month", type=str, default="2024-03")
+    parser.add_argument("--days", type=int, default=7, help="replayed from the middle of the month, the first half fills the windows")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[0, 6000])
+    parser.add_argument("--envs", type=int, default=54)
+    parser.add_argument("--window", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=9910)
+    args = parser.parse_args()
+
+    with open(TICKERS) as f:
+        tickers = f.read().split()
+    root = tempfile.mkdtemp()
+    try:
+        build_store(root, tickers, args.month)
+        start = pd.Timestamp(args.month, tz="America/New_York") + pd.Timedelta(days=14)
+        end = start + pd.Timedelta(days=args.days)
+        print(f"{len(tickers)} tickers, {start:%Y-%m-%d} .. {end:%Y-%m-%d}, {args.envs} envs")
+        print(f"{'transport':>10} {'speed':>6} {'ticks/s':>9} {'observed/s':>11} {'latency p50 ms':>15} {'p99 ms':>7} {'max ms':>7}")
+        for speed in args.speeds:
+            for socket in (False, True):
+                published, observed, elapsed, latencies = run(root, tickers, start, end, speed, args.envs, args.window, socket, args.port)
+                p50, p99, worst = 1000 * np.percentile(latencies, [50, 99, 100])
+                print(f"{'socket' if socket else 'in-process':>10} {speed:>6.0f} {published / elapsed:>9.0f} {observed / elapsed:>11.0f} {p50:>15.2f} {p99:>7.2f} {worst:>7.2f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import numpy as np
+
+from games.stocks.envs.live_data import LiveDataEnv
+from games.stocks.envs.vec_env import StocksVecEnv
+
+# usage (from the repository root, after python -m games.stocks.convert_stock_data):
+#   python -m benchmarks.stocks_live_data
+
+
+def steps_per_second(env: LiveDataEnv, seconds: float) -> float:
+    env.reset(seed=0)
+    actions = np.random.default_rng(0).integers(0, 3, size=4096).tolist()
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for action in actions:
+            _, _, terminated, truncated, _ = env.step(action)
+            if terminated or truncated:
+                env.reset()
+        steps += len(actions)
+    return steps / (time.perf_counter() - start)
+
+
+def vec_env_steps_per_second(num_envs: int, window_size: int, seconds: float) -> float:
+    env = StocksVecEnv(num_envs=num_envs, window_size=window_size, seed=0)
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 3, size=(256, num_envs))
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        env.step(actions[steps % len(actions)])
+        steps += 1
+    return steps * num_envs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LiveDataEnv and StocksVecEnv steps per second on one core")
+    parser.add_argument("--window-size", type=int, default=1000)
+    parser.add_argument("--num-envs", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    env = LiveDataEnv(window_size=args.window_size, render_mode=None)
+    print(f"{len(env.tickers)} tickers, window {args.window_size}")
+    print(f"{'env':<20} {'env-steps/s':>12}")
+    print(f"{'LiveDataEnv':<20} {steps_per_second(env, args.seconds):>12.0f}")
+    for num_envs in args.num_envs:
+        rate = vec_env_steps_per_second(num_envs, args.window_size, args.seconds)
+        print(f"{f'StocksVecEnv({num_envs})':<20} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from games.stocks.convert_stock_data import DEFAULT_SOURCE, read_month_pickles
+from games.stocks.store import DEFAULT_ROOT, StockStore, normalize_bars
+
+# usage (from the repository root, after python -m games.stocks.convert_stock_data):
+#   python -m benchmarks.stocks_store
+#
+# cold runs evict the files from the page cache with posix_fadvise first, warm runs read them again right after
+
+def evict(paths):
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def load_pickles(source: str, tickers) -> int:
+    # what every worker did before: unpickle every month, concatenate and drop the repeated minutes
+    rows = 0
+    for ticker in tickers:
+        frame = normalize_bars(read_month_pickles(os.path.join(source, ticker)))
+        rows += len(frame)
+    return rows
+
+
+def load_store(root: str, tickers) -> int:
+    # a fresh store per run, the full close series is read so every page is touched
+    store = StockStore(root)
+    rows = 0
+    for ticker in tickers:
+        series = store.load(ticker)
+        np.sum(series["close"])
+        rows += len(series)
+    return rows
+
+
+def timed(function, paths, cold: bool, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        if cold:
+            evict(paths)
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="loading the minute bars from the month pickles against the memory mapped store")
+    parser.add_argument("--source", type=str, default=DEFAULT_SOURCE)
+    parser.add_argument("--store", type=str, default=DEFAULT_ROOT)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    store = StockStore(args.store)
+    tickers = store.tickers
+    pickles = [path for ticker in tickers for path in glob.glob(os.path.join(args.source, ticker, "*.pkl"))]
+    arrays = [path for ticker in tickers for path in glob.glob(os.path.join(args.store, ticker, "*"))]
+    print(f"{len(tickers)} tickers, {len(pickles)} pickles ({sum(map(os.path.getsize, pickles)) / 2**20:.0f} MiB), "
+          f"store {len(arrays)} files ({sum(map(os.path.getsize, arrays)) / 2**20:.1f} MiB)")
+
+    one = tickers[:1]
+    cases = [
+        (f"pickles, {one[0]}", lambda: load_pickles(args.source, one), [path for path in pickles if f"{os.sep}{one[0]}{os.sep}" in path]),
+        (f"store, {one[0]}", lambda: load_store(args.store, one), [path for path in arrays if f"{os.sep}{one[0]}{os.sep}" in path]),
+        ("pickles, all", lambda: load_pickles(args.source, tickers), pickles),
+        ("store, all", lambda: load_store(args.store, tickers), arrays),
+    ]
+    print(f"{'source':<16} {'cold ms':>10} {'warm ms':>10}")
+    for name, function, paths in cases:
+        cold = timed(function, paths, True, args.repeats)
+        warm = timed(function, paths, False, args.repeats)
+        print(f"{name:<16} {1000 * cold:>10.2f} {1000 * warm:>10.2f}")
+
+    # a range query is two binary searches and a view, most of it is parsing the time strings
+    series = store.load(tickers[0])
+    bounds = {"strings": ("2025-03-03 09:30", "2025-03-04"), "nanoseconds": (int(series.timestamps[1000]), int(series.timestamps[2000]))}
+    for name, (a, b) in bounds.items():
+        start = time.perf_counter()
+        for _ in range(10000):
+            series.range(a, b)
+        print(f"range query ({name}): {1e6 * (time.perf_counter() - start) / 10000:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
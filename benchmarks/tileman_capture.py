@@ -0,0 +1,102 @@
+import argparse
+import random
+import time
+
+from games.tileman.envs import objects
+from benchmarks.tileman_grid import load_reference
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_capture --reference <git revision to compare against>
+
+# turning right from UP, RIGHT, DOWN, LEFT
+RIGHT_TURN = {0: 3, 3: 1, 1: 2, 2: 0}
+
+
+class Timed:
+    # wraps a method and adds up how often it ran and for how long, calls rejected by counts() are not recorded
+    def __init__(self, owner, name: str, counts=lambda *args: True):
+        self.owner = owner
+        self.name = name
+        self.original = getattr(owner, name)
+        self.calls = 0
+        self.seconds = 0.0
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return self.original(*args, **kwargs)
+            finally:
+                if counts(*args):
+                    self.seconds += time.perf_counter() - start
+                    self.calls += 1
+
+        setattr(owner, name, timed)
+
+    def restore(self):
+        setattr(self.owner, self.name, self.original)
+
+
+def run(module, grid_size: int, n_players: int, seconds: float, seed: int = 0):
+    rng = random.Random(seed)
+    game = module.Game(grid_size, grid_size)
+    # every player walks squares out of its territory so it keeps capturing (and enclosing) land
+    plans = {}
+
+    def plan(player):
+        side = rng.randint(2, 12)
+        direction = rng.randrange(4)
+        steps = []
+        for _ in range(4):
+            steps += [direction] * side
+            direction = RIGHT_TURN[direction]
+        return steps
+
+    for _ in range(n_players):
+        game.spawn_random_player()
+
+    # only the calls that actually captured something
+    claims = Timed(module.Game, "update_player_claims", lambda game, player: player.moves_since_capture == 0)
+    kills = Timed(module.Player, "kill")
+    steps = 0
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < seconds:
+            for player in game.players:
+                if not plans.get(id(player)):
+                    plans[id(player)] = plan(player)
+                player.move_direction = module.Directions[plans[id(player)].pop(0)]
+            game.update()
+            while len(game.players) < n_players:
+                game.spawn_random_player()
+            steps += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        claims.restore()
+        kills.restore()
+
+    return steps / elapsed, claims, kills
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tileman capture and death cost on large boards")
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--players", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--reference", type=str, default=None, help="git revision of the engine to compare against")
+    args = parser.parse_args()
+
+    engines = {"current": objects}
+    if args.reference is not None:
+        engines[f"reference ({args.reference})"] = load_reference(args.reference)
+
+    print(f"{args.size}x{args.size} board, {args.players} players")
+    print(f"{'engine':<24} {'steps/s':>10} {'capture us':>11} {'captures':>9} {'kill us':>8} {'kills':>7}")
+    for name, module in engines.items():
+        rate, claims, kills = run(module, args.size, args.players, args.seconds)
+        claims_cost = 1e6 * claims.seconds / max(claims.calls, 1)
+        kill_cost = 1e6 * kills.seconds / max(kills.calls, 1)
+        print(f"{name:<24} {rate:>10.1f} {claims_cost:>11.1f} {claims.calls:>9} {kill_cost:>8.1f} {kills.calls:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+from stable_baselines3.common.vec_env import SubprocVecEnv
+
+from games.tileman.envs.client_vec_env import ClientVecEnv
+from games.tileman.envs.multi_agent_env import ClientPlayerEnv
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_client_vec_env
+#
+# every measurement gets a fresh tile_server.py, all the envs play on that one lock-step server
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def start_server(port: int, *options: str) -> subprocess.Popen:
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "games", "tileman", "tile_server.py"), str(port), *options], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # importing the server alone takes a few seconds, wait until it listens
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"tile_server.py did not come up on port {port}")
+
+
+def make_client(port: int):
+    def _init():
+        return ClientPlayerEnv(port=port)
+    return _init
+
+
+def steps_per_second(env, num_envs: int, seconds: float) -> float:
+    env.reset()
+    rng = np.random.default_rng(0)
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        env.step(rng.integers(0, 4, size=num_envs))
+        steps += 1
+    return steps * num_envs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ClientVecEnv on one event loop against SubprocVecEnv of ClientPlayerEnv")
+    parser.add_argument("--num-envs", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=9960)
+    args = parser.parse_args()
+
+    print(f"{'env':<28} {'env-steps/s':>12}")
+    for num_envs in args.num_envs:
+        for name in ("SubprocVecEnv", "ClientVecEnv"):
+            server = start_server(args.port)
+            try:
+                if name == "ClientVecEnv":
+                    env = ClientVecEnv(num_envs=num_envs, port=args.port)
+                else:
+                    env = SubprocVecEnv([make_client(args.port) for _ in range(num_envs)])
+                rate = steps_per_second(env, num_envs, args.seconds)
+                env.close()
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{f'{name}({num_envs})':<28} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
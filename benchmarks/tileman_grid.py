@@ -0,0 +1,73 @@
+import argparse
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from games.tileman.envs import objects
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_grid --reference <git revision with the List[List[Tile]] grid>
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+OBJECTS_PATH = "games/tileman/envs/objects.py"
+
+
+def load_reference(revision: str):
+    # load games/tileman/envs/objects.py as it was at some git revision so both engines can be compared
+    source = subprocess.check_output(["git", "show", f"{revision}:{OBJECTS_PATH}"], cwd=REPO_ROOT)
+    path = os.path.join(tempfile.mkdtemp(), "reference_objects.py")
+    with open(path, "wb") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("reference_objects", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def steps_per_second(module, grid_size: int, n_players: int, seconds: float, seed: int = 0) -> float:
+    rng = random.Random(seed)
+    game = module.Game(grid_size, grid_size)
+    for _ in range(n_players):
+        game.spawn_random_player()
+
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        # players mostly keep going straight so they leave trails and capture instead of walking into themselves
+        for player in game.players:
+            if rng.random() < 0.2:
+                player.move_direction = module.Directions[rng.randrange(4)]
+        game.update()
+        while len(game.players) < n_players:
+            game.spawn_random_player()
+        steps += 1
+
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tileman Game.update throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 40, 200])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--reference", type=str, default=None, help="git revision of the engine to compare against")
+    args = parser.parse_args()
+
+    engines = {"current": objects}
+    if args.reference is not None:
+        engines[f"reference ({args.reference})"] = load_reference(args.reference)
+
+    print(f"{'engine':<24} {'grid':>9} {'players':>8} {'steps/s':>12}")
+    for grid_size in args.sizes:
+        for name, module in engines.items():
+            rate = steps_per_second(module, grid_size, args.players, args.seconds)
+            print(f"{name:<24} {f'{grid_size}x{grid_size}':>9} {args.players:>8} {rate:>12.1f}")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import websockets
+
+from games.tileman.envs import protocol
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_load_balancer
+#
+# starts tile_load_balancer.py once redirecting and once proxying, then connects, steps and disconnects the
+# clients against it for a few rounds, step latency includes waiting for the other players of the same lock-step server
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+async def get_status(port: int) -> dict:
+    reader, writer = await asyncio.open_connection("localhost", port)
+    writer.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def wait_for_balancer(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await get_status(port)
+        except (OSError, ValueError, IndexError):
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run_client(port: int, steps: int, vision_range: int, latencies: list, connect_times: list):
+    size = 2 * vision_range + 1
+    observation = np.empty((4, size, size), dtype=np.int8)
+    rng = np.random.default_rng()
+    start = time.perf_counter()
+    async with websockets.connect(f"ws://localhost:{port}", open_timeout=300) as client:
+        connect_times.append(time.perf_counter() - start)
+        await client.send(protocol.encode_control(protocol.RESET))
+        protocol.decode_observation(await client.recv(), observation)
+        for _ in range(steps):
+            start = time.perf_counter()
+            await client.send(protocol.encode_action(int(rng.integers(0, 4))))
+            _, _, _, done, _ = protocol.decode_observation(await client.recv(), observation)
+            latencies.append(time.perf_counter() - start)
+            if done:
+                await client.send(protocol.encode_control(protocol.RESET))
+                protocol.decode_observation(await client.recv(), observation)
+
+
+async def load_test(args, proxy: bool):
+    command = [sys.executable, os.path.join(ROOT, "games", "tileman", "tile_load_balancer.py"), "--port", str(args.port), "--max-players-per-server", str(args.max_players_per_server), "--idle-timeout", str(args.idle_timeout)]
+    if proxy:
+        command.append("--proxy")
+    balancer = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_balancer(args.port)
+        latencies, connect_times, peak = [], [], 0
+        for _ in range(args.rounds):
+            await asyncio.gather(*[run_client(args.port, args.steps, args.vision_range, latencies, connect_times) for _ in range(args.clients)])
+            peak = max(peak, len((await get_status(args.port))["servers"]))
+
+        # every client is gone, the children should be reaped down to one
+        await asyncio.sleep(args.idle_timeout + 3)
+        remaining = len((await get_status(args.port))["servers"])
+    finally:
+        balancer.terminate()
+        balancer.wait()
+        # the children are killed by the balancer on exit, give the ports a moment
+        await asyncio.sleep(1)
+
+    latencies = np.array(latencies) * 1000
+    connect_times = np.array(connect_times) * 1000
+    return {
+        "connect p50 ms": np.percentile(connect_times, 50),
+        "step p50 ms": np.percentile(latencies, 50),
+        "step p90 ms": np.percentile(latencies, 90),
+        "step p99 ms": np.percentile(latencies, 99),
+        "peak servers": peak,
+        "servers after idle": remaining,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TileServerLoadBalancer with redirects against the proxy hop")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--max-players-per-server", type=int, default=20)
+    parser.add_argument("--vision-range", type=int, default=5)
+    parser.add_argument("--idle-timeout", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=32600)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.rounds} rounds x {args.steps} steps, {args.max_players_per_server} players per server")
+    for name, proxy in (("redirect", False), ("proxy", True)):
+        results = asyncio.run(load_test(args, proxy))
+        print(f"{name:<9} " + "  ".join(f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}" for key, value in results.items()))
+
+
+if __name__ == "__main__":
+    main()
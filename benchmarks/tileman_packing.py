@@ -0,0 +1,75 @@
+import argparse
+import random
+import time
+
+import numpy as np
+import torch
+
+from games.tileman.envs.objects import Directions, Game
+from games.tileman.envs.packing import PackedObservationExtractor, pack_observation, packed_size, packed_space, unpack_observation
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_packing
+#
+# bytes per observation and for a 1M transition replay buffer (observation and next observation of every transition)
+# as int8 planes against bit-packed, and how fast batches of real game observations are packed and unpacked
+# (numpy, and the torch features extractor)
+
+
+def observations(grid_size: int, players: int, vision_range: int, batch: int) -> np.ndarray:
+    game = Game(grid_size, grid_size, seed=0)
+    rng = random.Random(0)
+    rows = []
+    while len(rows) < batch:
+        for player in game.players:
+            player.move_direction = Directions[rng.randrange(4)]
+        game.update()
+        while len(game.players) < players:
+            game.spawn_random_player()
+        rows.extend(game.get_all_visions(vision_range))
+    return np.stack(rows[:batch])
+
+
+def rate(function, seconds: float) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        function()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 planes against bit-packed tileman observations")
+    parser.add_argument("--vision-ranges", type=int, nargs="+", default=[5, 14])
+    parser.add_argument("--grid-size", type=int, default=40)
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--transitions", type=int, default=1_000_000)
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{'r':>3} {'planes':>6} {'int8 B':>7} {'packed B':>9} {'ratio':>6} {'buffer int8 GB':>15} {'packed GB':>10} {'pack obs/s':>11} {'unpack obs/s':>13} {'torch obs/s':>12}")
+    for vision_range in args.vision_ranges:
+        batch = observations(args.grid_size, args.players, vision_range, args.batch)
+        for planes in (3, 4):
+            planes_batch = np.ascontiguousarray(batch[:, :planes])
+            packed = pack_observation(planes_batch)
+            if not np.array_equal(unpack_observation(packed, planes, vision_range), planes_batch):
+                raise AssertionError("unpacked observations differ from the packed ones")
+            unpacked = np.empty_like(planes_batch)
+            extractor = PackedObservationExtractor(packed_space(planes, vision_range), planes, vision_range)
+            features = torch.as_tensor(packed).float()
+
+            plain = planes_batch[0].nbytes
+            small = packed_size(planes, vision_range)
+            packs = rate(lambda: pack_observation(planes_batch), args.seconds) * args.batch
+            unpacks = rate(lambda: unpack_observation(packed, planes, vision_range, out=unpacked), args.seconds) * args.batch
+            with torch.no_grad():
+                extracted = rate(lambda: extractor(features), args.seconds) * args.batch
+            buffer = 2 * args.transitions / 1e9
+            print(f"{vision_range:>3} {planes:>6} {plain:>7} {small:>9} {plain / small:>5.1f}x {plain * buffer:>15.2f} {small * buffer:>10.2f} {packs:>11.0f} {unpacks:>13.0f} {extracted:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
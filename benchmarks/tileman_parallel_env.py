@@ -0,0 +1,71 @@
+import argparse
+import time
+
+import numpy as np
+from stable_baselines3.common.vec_env import SubprocVecEnv
+
+from benchmarks.tileman_client_vec_env import make_client, start_server
+from games.tileman.envs.client_vec_env import ClientVecEnv
+from games.tileman.envs.parallel_env import TilemanParallelEnv
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_parallel_env
+#
+# agent-steps per second of n agents in one game: TilemanParallelEnv in-process (array and dict api) against
+# a tile_server.py on localhost played by n ClientPlayerEnvs (SubprocVecEnv) or one ClientVecEnv,
+# the same 20x20 board and vision range 5 as tile_server.py
+
+
+def in_process(agents: int, seconds: float, arrays: bool) -> float:
+    env = TilemanParallelEnv(agents, grid_size=20, vision_range=5)
+    env.reset(seed=0)
+    rng = np.random.default_rng(0)
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        actions = rng.integers(0, 4, size=agents)
+        if arrays:
+            env.step_arrays(actions)
+        else:
+            env.step({agent: int(action) for agent, action in zip(env.agents, actions)})
+        steps += 1
+    return steps * agents / (time.perf_counter() - start)
+
+
+def over_server(agents: int, seconds: float, port: int, vectorized: bool) -> float:
+    server = start_server(port)
+    try:
+        env = ClientVecEnv(num_envs=agents, port=port) if vectorized else SubprocVecEnv([make_client(port) for _ in range(agents)])
+        env.reset()
+        rng = np.random.default_rng(0)
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            env.step(rng.integers(0, 4, size=agents))
+            steps += 1
+        rate = steps * agents / (time.perf_counter() - start)
+        env.close()
+    finally:
+        server.terminate()
+        server.wait()
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="in-process TilemanParallelEnv against TileServer + clients")
+    parser.add_argument("--agents", type=int, nargs="+", default=[2, 8, 16])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=9970)
+    args = parser.parse_args()
+
+    print(f"{'agents':>6} {'step_arrays':>12} {'step (dicts)':>13} {'ClientPlayerEnv':>16} {'ClientVecEnv':>13} {'speedup':>8}")
+    for agents in args.agents:
+        arrays = in_process(agents, args.seconds, True)
+        dicts = in_process(agents, args.seconds, False)
+        clients = over_server(agents, args.seconds, args.port, False)
+        vectorized = over_server(agents, args.seconds, args.port, True)
+        print(f"{agents:>6} {arrays:>12.0f} {dicts:>13.0f} {clients:>16.0f} {vectorized:>13.0f} {arrays / max(clients, vectorized):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
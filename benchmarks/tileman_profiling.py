@@ -0,0 +1,56 @@
+import argparse
+import random
+import time
+
+from games.tileman.envs.objects import Directions, Game
+from games.tileman.envs.profiling import Profiler, timed
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_profiling
+#
+# cost of the profiling hooks: Game.update and get_all_visions per tick without a profiler against with one timing
+# every phase (what TileServer(profile=True) does), then the report of the profiled runs
+
+def tick_time(grid_size: int, players: int, vision_range: int, ticks: int, profiler) -> float:
+    game = Game(grid_size, grid_size, seed=0)
+    game.profiler = profiler
+    rng = random.Random(0)
+    elapsed = 0.0
+    for _ in range(ticks):
+        while len(game.players) < players:
+            game.spawn_random_player()
+        alive = [player for player in game.players if player.is_alive]
+        for player in alive:
+            player.move_direction = Directions[rng.randrange(4)]
+        start = time.perf_counter()
+        with timed(profiler, "tick"):
+            with timed(profiler, "update"):
+                game.update()
+            with timed(profiler, "observe"):
+                game.get_all_visions(vision_range, alive)
+        elapsed += time.perf_counter() - start
+    return elapsed / ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tick time with and without the profiling hooks")
+    parser.add_argument("--players", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--grid-size", type=int, default=256)
+    parser.add_argument("--vision-range", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=300)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    profiler = Profiler()
+    print(f"{args.grid_size}x{args.grid_size}, vision range {args.vision_range}, best of {args.repeats}")
+    print(f"{'players':>7} {'off us/tick':>12} {'on us/tick':>11} {'overhead':>9}")
+    for players in args.players:
+        off = min(tick_time(args.grid_size, players, args.vision_range, args.ticks, None) for _ in range(args.repeats))
+        on = min(tick_time(args.grid_size, players, args.vision_range, args.ticks, profiler) for _ in range(args.repeats))
+        print(f"{players:>7} {1e6 * off:>12.0f} {1e6 * on:>11.0f} {100 * (on - off) / off:>8.1f}%")
+    print()
+    print(profiler.report())
+
+
+if __name__ == "__main__":
+    main()
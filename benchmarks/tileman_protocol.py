@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import pickle
+import time
+
+import numpy as np
+import websockets
+
+from games.tileman.envs import protocol
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_protocol
+#
+# compares the old pickled (obs, reward, done, truncated, info) step messages with the binary protocol,
+# the round trip runs a local websocket server that answers every action like TileServer does
+
+
+def pickle_step(observation: np.ndarray) -> bytes:
+    return pickle.dumps((observation, 0.9, False, False, {}))
+
+
+def binary_step(observation: np.ndarray) -> bytes:
+    return protocol.encode_observation(protocol.STEP, 1, observation, 0.9)
+
+
+def codec_seconds(observation: np.ndarray, binary: bool, iterations: int) -> float:
+    out = np.empty_like(observation)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if binary:
+            protocol.decode_request(protocol.encode_action(1))
+            protocol.decode_observation(binary_step(observation), out)
+        else:
+            pickle.loads(pickle.dumps(1))
+            pickle.loads(pickle_step(observation))
+    return (time.perf_counter() - start) / iterations
+
+
+async def round_trip_seconds(observation: np.ndarray, binary: bool, iterations: int, port: int) -> float:
+    async def handler(websocket):
+        async for message in websocket:
+            if binary:
+                protocol.decode_request(message)
+                await websocket.send(binary_step(observation))
+            else:
+                pickle.loads(message)
+                await websocket.send(pickle_step(observation))
+
+    out = np.empty_like(observation)
+    async with websockets.serve(handler, "localhost", port):
+        async with websockets.connect(f"ws://localhost:{port}") as client:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                if binary:
+                    await client.send(protocol.encode_action(1))
+                    protocol.decode_observation(await client.recv(), out)
+                else:
+                    await client.send(pickle.dumps(1))
+                    pickle.loads(await client.recv())
+            return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TileServer wire format: pickle against the binary protocol")
+    parser.add_argument("--vision-ranges", type=int, nargs="+", default=[5, 14])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=9951)
+    args = parser.parse_args()
+
+    print(f"{'format':<8} {'r':>3} {'bytes/step':>11} {'encode+decode us':>17} {'round trip us':>14}")
+    for vision_range in args.vision_ranges:
+        size = 2 * vision_range + 1
+        observation = np.random.default_rng(0).integers(-1, 2, size=(4, size, size)).astype(np.int8)
+        for name, binary, message in (("pickle", False, pickle_step(observation)), ("binary", True, binary_step(observation))):
+            codec = codec_seconds(observation, binary, args.iterations)
+            round_trip = asyncio.run(round_trip_seconds(observation, binary, args.iterations, args.port))
+            print(f"{name:<8} {vision_range:>3} {len(message):>11} {1e6 * codec:>17.2f} {1e6 * round_trip:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
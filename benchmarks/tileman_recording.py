@@ -0,0 +1,79 @@
+import argparse
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from games.tileman.envs import protocol
+from games.tileman.envs.objects import Directions, Game
+from games.tileman.envs.recording import EpisodeRecorder, EpisodeReplayer
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_recording
+#
+# size of a recorded game against keeping every observation (pickled, or as the server sends them), what recording
+# costs per tick, and how long seeking to a random tick of the replay takes
+
+
+def play(game: Game, rng: random.Random, ticks: int, players: int, vision_range: int, observations: bool):
+    pickled = 0
+    sent = 0
+    for _ in range(ticks):
+        for player in game.players:
+            player.move_direction = Directions[rng.randrange(4)]
+        game.update()
+        while len(game.players) < players:
+            game.spawn_random_player()
+        if observations:
+            visions = game.get_all_visions(vision_range)
+            for vision in visions:
+                pickled += len(pickle.dumps(vision))
+                sent += len(protocol.encode_observation(protocol.STEP, 0, vision))
+    return pickled, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="episode recording size, overhead and seek time")
+    parser.add_argument("--grid-size", type=int, default=40)
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--vision-range", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=5000)
+    parser.add_argument("--keyframe-intervals", type=int, nargs="+", default=[0, 100, 1000])
+    parser.add_argument("--seeks", type=int, default=100)
+    args = parser.parse_args()
+
+    game = Game(args.grid_size, args.grid_size, seed=0)
+    pickled, sent = play(game, random.Random(0), args.ticks, args.players, args.vision_range, True)
+    start = time.perf_counter()
+    play(Game(args.grid_size, args.grid_size, seed=0), random.Random(0), args.ticks, args.players, args.vision_range, False)
+    unrecorded = (time.perf_counter() - start) / args.ticks
+
+    print(f"{args.grid_size}x{args.grid_size}, {args.players} players, {args.ticks} ticks, vision range {args.vision_range}")
+    print(f"pickled observations: {pickled / 2**20:.1f} MiB, server messages: {sent / 2**20:.1f} MiB, game without recording {1e6 * unrecorded:.0f} us/tick")
+    print(f"{'keyframes every':>15} {'file KiB':>9} {'bytes/tick':>11} {'record us/tick':>15} {'seek ms':>8}")
+    directory = tempfile.mkdtemp()
+    for interval in args.keyframe_intervals:
+        path = os.path.join(directory, f"game_{interval}.tmrec")
+        game = Game(args.grid_size, args.grid_size, seed=0)
+        recorder = EpisodeRecorder(path, game, interval)
+        start = time.perf_counter()
+        play(game, random.Random(0), args.ticks, args.players, args.vision_range, False)
+        recorder.close()
+        recorded = (time.perf_counter() - start) / args.ticks
+        size = os.path.getsize(path)
+
+        replayer = EpisodeReplayer(path)
+        rng = random.Random(1)
+        start = time.perf_counter()
+        for _ in range(args.seeks):
+            replayer.seek(rng.randrange(replayer.length + 1))
+            replayer.observations(args.vision_range)
+        seek = (time.perf_counter() - start) / args.seeks
+        os.remove(path)
+        print(f"{interval or 'never':>15} {size / 2**10:>9.1f} {size / args.ticks:>11.1f} {1e6 * (recorded - unrecorded):>15.1f} {1000 * seek:>8.2f}")
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
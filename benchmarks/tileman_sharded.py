@@ -0,0 +1,74 @@
+import argparse
+import os
+import random
+import time
+from typing import Tuple
+
+from games.tileman.envs.objects import Directions, Game
+from games.tileman.envs.sharding import ShardedWorld
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_sharded
+#
+# ticks per second of one large board with every agent moving at random and observed every tick, one in-process
+# Game (what a TileServer runs) against a ShardedWorld over 1, 2, 4... worker processes, dead agents respawn
+# the workers only run side by side with as many cores: "1 core/worker" is the rate with the workers' part of the
+# tick taking as long as the slowest worker (ShardedWorld.parallel_time) instead of what it took on this machine,
+# the same as the measured rate when there are enough cores
+
+
+def single_game(size: int, agents: int, vision_range: int, ticks: int) -> float:
+    game = Game(size, size, seed=0)
+    rng = random.Random(0)
+    players = [game.spawn_random_player() for _ in range(agents)]
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for player in players:
+            player.move_direction = Directions[rng.randrange(4)]
+        game.update()
+        game.get_all_visions(vision_range, players)
+        players = [player if player.is_alive else game.spawn_random_player() for player in players]
+    return ticks / (time.perf_counter() - start)
+
+
+def sharded(size: int, agents: int, vision_range: int, ticks: int, workers: int) -> Tuple[float, float]:
+    world = ShardedWorld(size, size, workers, vision_range, capacity=2 * agents, seed=0)
+    try:
+        rng = random.Random(0)
+        indices, _ = world.spawn(agents, observe=False)
+        busy, parallel = sum(world.busy_time), world.parallel_time
+        start = time.perf_counter()
+        for _ in range(ticks):
+            world.step({index: rng.randrange(4) for index in indices}, indices)
+            dead = [index for index in indices if not world.counters[index][0]]
+            if dead:
+                world.remove(*dead)
+                indices = [index for index in indices if world.counters.get(index, (False, ))[0]] + world.spawn(len(dead), observe=False)[0]
+        elapsed = time.perf_counter() - start
+        busy, parallel = sum(world.busy_time) - busy, world.parallel_time - parallel
+        return ticks / elapsed, ticks / (elapsed - busy + parallel)
+    finally:
+        world.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tick rate of a sharded board against the number of workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--agents", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--grid-size", type=int, default=1000)
+    parser.add_argument("--vision-range", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.grid_size}x{args.grid_size}, vision range {args.vision_range}, {os.cpu_count()} cpus")
+    print(f"{'agents':>6} {'workers':>7} {'ticks/s':>8} {'ms/tick':>8} {'vs Game':>8} {'1 core/worker':>14} {'vs Game':>8}")
+    for agents in args.agents:
+        baseline = single_game(args.grid_size, agents, args.vision_range, args.ticks)
+        print(f"{agents:>6} {'Game':>7} {baseline:>8.0f} {1000 / baseline:>8.2f} {1:>7.2f}x")
+        for workers in args.workers:
+            rate, parallel_rate = sharded(args.grid_size, agents, args.vision_range, args.ticks, workers)
+            print(f"{agents:>6} {workers:>7} {rate:>8.0f} {1000 / rate:>8.2f} {rate / baseline:>7.2f}x {parallel_rate:>14.0f} {parallel_rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
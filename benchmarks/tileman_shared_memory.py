@@ -0,0 +1,71 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from benchmarks.tileman_client_vec_env import start_server
+from games.tileman.envs.client_vec_env import ClientVecEnv
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_shared_memory
+#
+# step latency and cpu time of n clients (one ClientVecEnv) on a tile_server.py on this host, observations as
+# websocket frames against written into shared memory rings with only the slot sent over the socket,
+# cpu is per vectorized step, for this process (the clients) and the server process
+
+TICKS_PER_SECOND = os.sysconf("SC_CLK_TCK")
+
+
+def server_cpu(pid: int) -> float:
+    # user + system seconds of another process
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICKS_PER_SECOND
+
+
+def measure(clients: int, shared_memory: bool, seconds: float, port: int, grid_size: int, vision_range: int):
+    server = start_server(port, "--grid-size", str(grid_size), "--vision-range", str(vision_range))
+    try:
+        env = ClientVecEnv(num_envs=clients, vision_range=vision_range, port=port, shared_memory=shared_memory)
+        if shared_memory and not all(session.ring is not None for session in env.sessions):
+            raise RuntimeError("the server did not attach to the rings")
+        env.reset()
+        rng = np.random.default_rng(0)
+        latencies = []
+        server_start, client_start = server_cpu(server.pid), time.process_time()
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            actions = rng.integers(0, 4, size=clients)
+            stepped = time.perf_counter()
+            env.step(actions)
+            latencies.append(time.perf_counter() - stepped)
+        server_time, client_time = server_cpu(server.pid) - server_start, time.process_time() - client_start
+        env.close()
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = np.array(latencies)
+    return len(latencies) / latencies.sum(), latencies, client_time / len(latencies), server_time / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="websocket frames against shared memory observation rings")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=9980)
+    parser.add_argument("--grid-size", type=int, default=40)
+    parser.add_argument("--vision-range", type=int, default=14)
+    args = parser.parse_args()
+
+    print(f"{args.grid_size}x{args.grid_size}, vision range {args.vision_range}")
+    print(f"{'clients':>7} {'transport':>13} {'steps/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'client cpu ms/step':>19} {'server cpu ms/step':>19}")
+    for clients in args.clients:
+        for shared_memory in (False, True):
+            rate, latencies, client_cpu, server_cpu_time = measure(clients, shared_memory, args.seconds, args.port, args.grid_size, args.vision_range)
+            p50, p99 = 1000 * np.percentile(latencies, [50, 99])
+            print(f"{clients:>7} {'shared memory' if shared_memory else 'websocket':>13} {rate:>8.0f} {p50:>7.2f} {p99:>7.2f} {1000 * client_cpu:>19.3f} {1000 * server_cpu_time:>19.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import copy
+import random
+import time
+
+from games.tileman.envs.objects import Directions, Game
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_snapshot
+#
+# clones per second of a game in the middle of play: deepcopy of the whole Game (what a search agent had to do)
+# against Game.snapshot / Game.restore, and one lookahead rollout (clone, a few updates, back) with either
+
+
+def play(game: Game, rng: random.Random, steps: int, players: int):
+    for _ in range(steps):
+        for player in game.players:
+            player.move_direction = Directions[rng.randrange(4)]
+        game.update()
+        while len(game.players) < players:
+            game.spawn_random_player(seed=rng.random())
+
+
+def rate(function, seconds: float) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        function()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="deepcopy against Game.snapshot / Game.restore")
+    parser.add_argument("--grid-size", type=int, default=40)
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--warmup-steps", type=int, default=100)
+    parser.add_argument("--rollout-steps", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{args.grid_size}x{args.grid_size}, rollouts of {args.rollout_steps} updates")
+    print(f"{'players':>7} {'deepcopy/s':>11} {'snapshot/s':>11} {'restore/s':>10} {'speedup':>8} {'deepcopy rollouts/s':>20} {'snapshot rollouts/s':>20}")
+    for players in args.players:
+        rng = random.Random(0)
+        game = Game(args.grid_size, args.grid_size)
+        play(game, rng, args.warmup_steps, players)
+        snapshot = game.snapshot()
+
+        deepcopies = rate(lambda: copy.deepcopy(game), args.seconds)
+        snapshots = rate(game.snapshot, args.seconds)
+        restores = rate(lambda: game.restore(snapshot), args.seconds)
+
+        def deepcopy_rollout():
+            play(copy.deepcopy(game), rng, args.rollout_steps, players)
+
+        def snapshot_rollout():
+            play(game, rng, args.rollout_steps, players)
+            game.restore(snapshot)
+
+        deepcopy_rollouts = rate(deepcopy_rollout, args.seconds)
+        snapshot_rollouts = rate(snapshot_rollout, args.seconds)
+        clone = 1 / (1 / snapshots + 1 / restores)
+        print(f"{players:>7} {deepcopies:>11.0f} {snapshots:>11.0f} {restores:>10.0f} {clone / deepcopies:>7.1f}x {deepcopy_rollouts:>20.0f} {snapshot_rollouts:>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import random
+import time
+
+from games.tileman.envs.objects import Directions, Game, Player
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_spatial_index
+#
+# Game.update time as the number of players grows, with head-on collisions looked up in the occupancy index
+# against the pass over every player it replaced, and Game.players_near against filtering every player
+
+
+def scan_same_location(game: Game, player: Player):
+    # the old update_player_same_location, O(players) for every player that moves
+    claimer = game.grid.claims[player.position.y, player.position.x]
+    for other_player in game.players:
+        if other_player is player or not other_player.is_alive:
+            continue
+        if other_player.position == player.position:
+            if claimer == player.index:
+                other_player.kill(game.grid)
+            elif claimer == other_player.index:
+                player.kill(game.grid)
+            else:
+                player.kill(game.grid)
+                other_player.kill(game.grid)
+            if not player.is_alive:
+                return
+
+
+def tick_time(grid_size: int, players: int, ticks: int, scan: bool) -> float:
+    game = Game(grid_size, grid_size, seed=0)
+    if scan:
+        game.update_player_same_location = lambda player: scan_same_location(game, player)
+    rng = random.Random(0)
+    elapsed = 0.0
+    for _ in range(ticks):
+        while len(game.players) < players:
+            game.spawn_random_player()
+        for player in game.players:
+            player.move_direction = Directions[rng.randrange(4)]
+        start = time.perf_counter()
+        game.update()
+        elapsed += time.perf_counter() - start
+    return elapsed / ticks
+
+
+def query_time(grid_size: int, players: int, radius: int, queries: int, index: bool) -> float:
+    game = Game(grid_size, grid_size, seed=0)
+    while len(game.players) < players:
+        game.spawn_random_player()
+    start = time.perf_counter()
+    for i in range(queries):
+        position = game.players[i % players].position
+        if index:
+            game.players_near(position, radius)
+        else:
+            [player for player in game.players if player.is_alive and abs(player.position.x - position.x) <= radius and abs(player.position.y - position.y) <= radius]
+    return (time.perf_counter() - start) / queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tick and nearby player query time against the number of players")
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 8, 32, 64, 128, 256])
+    parser.add_argument("--grid-size", type=int, default=256)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--radius", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.grid_size}x{args.grid_size}, random moves, dead players respawned every tick, players_near radius {args.radius}")
+    print(f"{'players':>7} {'scan us/tick':>13} {'index us/tick':>14} {'speedup':>8} {'scan us/query':>14} {'index us/query':>15}")
+    for players in args.players:
+        scan = tick_time(args.grid_size, players, args.ticks, True)
+        index = tick_time(args.grid_size, players, args.ticks, False)
+        scan_query = query_time(args.grid_size, players, args.radius, args.queries, False)
+        index_query = query_time(args.grid_size, players, args.radius, args.queries, True)
+        print(f"{players:>7} {1e6 * scan:>13.0f} {1e6 * index:>14.0f} {scan / index:>7.1f}x {1e6 * scan_query:>14.1f} {1e6 * index_query:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
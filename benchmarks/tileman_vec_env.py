@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import numpy as np
+
+from games.tileman.envs.solo_player_env import SoloPlayerEnv
+from games.tileman.envs.vec_env import TilemanVecEnv
+
+# usage (from the repository root):
+#   python -m benchmarks.tileman_vec_env
+
+
+def vec_env_steps_per_second(num_envs: int, grid_size: int, vision_range: int, seconds: float) -> float:
+    env = TilemanVecEnv(num_envs=num_envs, grid_size=grid_size, vision_range=vision_range, seed=0)
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, 4, size=(1024, num_envs))
+
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        env.step(actions[steps % len(actions)])
+        steps += 1
+    return steps * num_envs / (time.perf_counter() - start)
+
+
+def solo_env_steps_per_second(grid_size: int, vision_range: int, seconds: float) -> float:
+    env = SoloPlayerEnv(grid_size=grid_size, vision_range=vision_range)
+    env.reset(seed=0)
+    rng = np.random.default_rng(0)
+
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        _, _, terminated, truncated, _ = env.step(int(rng.integers(0, 4)))
+        if terminated or truncated:
+            env.reset()
+        steps += 1
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TilemanVecEnv throughput against a single SoloPlayerEnv")
+    parser.add_argument("--grid-size", type=int, default=10)
+    parser.add_argument("--vision-range", type=int, default=14)
+    parser.add_argument("--num-envs", type=int, nargs="+", default=[1, 16, 64, 256, 1024])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"{args.grid_size}x{args.grid_size} grid, vision_range={args.vision_range}")
+    print(f"{'env':<24} {'env-steps/s':>12}")
+    rate = solo_env_steps_per_second(args.grid_size, args.vision_range, args.seconds)
+    print(f"{'SoloPlayerEnv':<24} {rate:>12.0f}")
+    for num_envs in args.num_envs:
+        rate = vec_env_steps_per_second(num_envs, args.grid_size, args.vision_range, args.seconds)
+        print(f"{f'TilemanVecEnv({num_envs})':<24} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
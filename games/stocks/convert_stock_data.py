@@ -0,0 +1,49 @@
+import argparse
+import glob
+import os
+import pickle
+import pandas as pd
+from .store import DEFAULT_ROOT, StockStore
+
+# usage (from the repository root):
+#   python -m games.stocks.convert_stock_data [--source stock_data] [--destination stock_store]
+#
+# one-shot conversion of the per month pickles written by the yahooquery loop in stocks.ipynb into the columnar store
+
+DEFAULT_SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "stock_data"))
+
+
+def read_month_pickles(directory: str) -> pd.DataFrame:
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.pkl"))):
+        with open(path, "rb") as f:
+            frame = pickle.load(f)
+        # yahooquery hands back a dict or a string instead of a frame when a month has no data
+        if isinstance(frame, pd.DataFrame) and len(frame) > 0:
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert stock_data/<TICKER>/<year>_<month>.pkl into the memory mapped columnar store")
+    parser.add_argument("--source", type=str, default=DEFAULT_SOURCE)
+    parser.add_argument("--destination", type=str, default=DEFAULT_ROOT)
+    parser.add_argument("--tickers", type=str, nargs="*", default=None, help="defaults to every ticker directory in source")
+    args = parser.parse_args()
+
+    store = StockStore(args.destination)
+    tickers = args.tickers or sorted(name for name in os.listdir(args.source) if os.path.isdir(os.path.join(args.source, name)))
+    for ticker in tickers:
+        frame = read_month_pickles(os.path.join(args.source, ticker))
+        if len(frame) == 0:
+            print(f"{ticker}: no bars, skipped")
+            continue
+        store.write(ticker, frame)
+        series = store.load(ticker)
+        print(f"{ticker}: {len(frame)} pickled rows -> {len(series)} bars, {list(series.columns)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from typing import Dict, Optional, Sequence
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from .store import DEFAULT_ROOT, StockStore
+
+# windows of minute bars for PricePredictionLightning (stocks.ipynb), built one at a time out of the memory mapped store
+
+
+class PriceWindowDataset(Dataset):
+    # sample i is a (ticker, offset) pair: x is columns[offset:offset + window] as a (len(columns), window) float32
+    # tensor and y is the target column horizon bars after the window, shape (1,)
+    #
+    # samples are numbered ticker after ticker, with num_shards > 1 every process keeps every num_shards-th sample of a
+    # seeded permutation, so shards are disjoint, cover everything together and are the same on every run
+    def __init__(self, tickers: Optional[Sequence[str]] = None, window=5000, horizon=1, columns=("open", "high", "low"), target="close", shard=0, num_shards=1, seed=0, store_root=DEFAULT_ROOT):
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"shard {shard} is not in [0, {num_shards})")
+
+        self.window = window
+        self.horizon = horizon
+        self.columns = list(columns)
+        self.target = target
+        self.store_root = store_root
+        self.shard = shard
+        self.num_shards = num_shards
+        self.seed = seed
+
+        store = StockStore(store_root)
+        tickers = store.tickers if tickers is None else tickers
+        counts = [max(len(store.load(ticker)) - window - horizon + 1, 0) for ticker in tickers]
+        self.tickers = [ticker for ticker, count in zip(tickers, counts) if count > 0]
+        counts = [count for count in counts if count > 0]
+        if not self.tickers:
+            raise FileNotFoundError(f"no ticker in {store_root} has more than {window + horizon} bars, run python -m games.stocks.convert_stock_data first")
+        # first sample number of every ticker
+        self.offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        total = int(np.sum(counts))
+
+        samples = np.arange(total, dtype=np.int64)
+        if num_shards > 1:
+            samples = np.random.default_rng(seed).permutation(samples)[shard::num_shards]
+            samples.sort() # neighbouring windows share pages, keep them together
+        self.samples = samples
+
+        # the memory maps are opened lazily in every process (see __getstate__)
+        self.views: Optional[Dict[str, list]] = None
+
+    def __getstate__(self):
+        # DataLoader workers get the index, not the arrays, and map the same files into the shared page cache
+        state = self.__dict__.copy()
+        state["views"] = None
+        return state
+
+    def open(self):
+        store = StockStore(self.store_root)
+        self.views = {"x": [], "y": []}
+        for ticker in self.tickers:
+            series = store.load(ticker)
+            # (len - window + 1, window) strided views, nothing is read before a sample asks for it
+            self.views["x"].append([np.lib.stride_tricks.sliding_window_view(np.asarray(series[column]), self.window) for column in self.columns])
+            self.views["y"].append(np.asarray(series[self.target]))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def locate(self, index: int):
+        # (ticker index, offset of the window in that ticker) of the index-th sample of this shard
+        sample = self.samples[index]
+        ticker = int(np.searchsorted(self.offsets, sample, side="right")) - 1
+        return ticker, int(sample - self.offsets[ticker])
+
+    def __getitem__(self, index: int):
+        if self.views is None:
+            self.open()
+        ticker, offset = self.locate(index)
+        x = np.empty((len(self.columns), self.window), dtype=np.float32)
+        for row, windows in enumerate(self.views["x"][ticker]):
+            x[row] = windows[offset]
+        y = np.array((self.views["y"][ticker][offset + self.window - 1 + self.horizon], ), dtype=np.float32)
+        return torch.from_numpy(x), torch.from_numpy(y)
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import random
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from .store import DEFAULT_ROOT, DEFAULT_TIMEZONE, PRICE_COLUMNS, StockStore
+
+# usage (from the repository root):
+#   python -m games.stocks.download AAPL MSFT NVDA [--start 2011-01] [--end 2024-12] [--workers 8] [--provider fake]
+#
+# incremental replacement of the yahooquery loop in stocks.ipynb: history is split in (ticker, month) shards, only the
+# shards that were never fetched or were fetched before their month was over are downloaded, on a bounded thread pool
+# with exponential backoff, and the new bars are appended to the columnar store
+#
+# <root>/downloads.json remembers every shard that made it into the store ({ticker: {"2024-03": {...}}}), it is written
+# after the bars, so a run that dies in between only fetches those shards again and the append drops the repeats
+
+MANIFEST = "downloads.json"
+
+
+class Provider:
+    # where the bars come from, fetch returns the 1 minute bars of ticker with start <= time < end as a frame with a
+    # DatetimeIndex (or yahooquery's (symbol, date) MultiIndex) and the price columns, empty when there are none
+    name = "provider"
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class YahooProvider(Provider):
+    name = "yahoo"
+
+    def __init__(self):
+        from yahooquery import Ticker
+        self.Ticker = Ticker
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        frame = self.Ticker(ticker).history(start=start.strftime("%Y-%m-%d"), end=end.strftime("%Y-%m-%d"), interval="1m")
+        if isinstance(frame, pd.DataFrame):
+            return frame
+        # a dict (or a string) of messages instead of a frame, only "no data" means the month is empty
+        message = str(frame)
+        if "No data" in message or "no data" in message:
+            return pd.DataFrame()
+        raise RuntimeError(f"{ticker} {start:%Y-%m}: {message}")
+
+
+class FakeProvider(Provider):
+    # regular trading hours of random walk bars, the same minute always gets the same bar, for offline runs
+    # latency (seconds per call) and failure_rate (share of calls that raise) stand in for the network
+    name = "fake"
+
+    def __init__(self, latency=0.0, failure_rate=0.0, now: Optional[pd.Timestamp] = None, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.now = now
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def day(self, ticker: str, date: pd.Timestamp) -> pd.DataFrame:
+        index = pd.date_range(date + pd.Timedelta(hours=9, minutes=30), periods=390, freq="1min")
+        rng = np.random.default_rng(zlib.crc32(f"{self.seed} {ticker} {date:%Y-%m-%d}".encode()))
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, len(index))) + (zlib.crc32(ticker.encode()) % 100) / 50)
+        open = np.concatenate(([close[0]], close[:-1]))
+        spread = np.abs(rng.normal(0, 5e-4, len(index))) * close
+        return pd.DataFrame({
+            "open": open,
+            "high": np.maximum(open, close) + spread,
+            "low": np.minimum(open, close) - spread,
+            "close": close,
+            "volume": rng.integers(1000, 100000, len(index)).astype(np.float64),
+        }, index=pd.Index(index, name="date"))
+
+    def fetch(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            raise ConnectionError(f"{ticker} {start:%Y-%m}: fake failure")
+        now = pd.Timestamp.now(tz=DEFAULT_TIMEZONE) if self.now is None else self.now
+        end = min(end, now)
+        frames = [self.day(ticker, date) for date in pd.date_range(start.normalize(), end, freq="B", inclusive="left")]
+        if not frames:
+            return pd.DataFrame()
+        frame = pd.concat(frames)
+        return frame[(frame.index >= start) & (frame.index < end)]
+
+
+PROVIDERS = {"yahoo": YahooProvider, "fake": FakeProvider}
+
+
+def month_bounds(month: str, timezone: str = DEFAULT_TIMEZONE) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    start = pd.Timestamp(f"{month}-01", tz=timezone)
+    return start, start + pd.offsets.MonthBegin(1)
+
+
+def months(start: str, end: str) -> List[str]:
+    return [f"{period.year}-{period.month:02d}" for period in pd.period_range(start, end, freq="M")]
+
+
+def load_manifest(root: str) -> Dict[str, Dict[str, dict]]:
+    path = os.path.join(root, MANIFEST)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(root: str, manifest: Dict[str, Dict[str, dict]]):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, MANIFEST)
+    staging = f"{path}.tmp-{os.getpid()}"
+    with open(staging, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(staging, path)
+
+
+class StockDownloader:
+    # settle is how long after the end of a month its bars are taken as final, a shard fetched earlier is stale
+    def __init__(self, provider: Provider, store_root=DEFAULT_ROOT, max_workers=8, retries=4, backoff=1.0, flush_every=24, settle=pd.Timedelta(days=1), now: Optional[pd.Timestamp] = None):
+        self.provider = provider
+        self.store = StockStore(store_root)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.flush_every = flush_every
+        self.settle = settle
+        self.now = now
+        self.manifest = load_manifest(store_root)
+
+    def current_time(self) -> pd.Timestamp:
+        return pd.Timestamp.now(tz=DEFAULT_TIMEZONE) if self.now is None else self.now
+
+    def plan(self, tickers: List[str], start="2011-01", end: Optional[str] = None) -> List[Tuple[str, str]]:
+        # the (ticker, month) shards that are missing or stale, months that have not started yet are left out
+        now = self.current_time()
+        end = end or f"{now.year}-{now.month:02d}"
+        shards = []
+        for ticker in tickers:
+            fetched = self.manifest.get(ticker, {})
+            for month in months(start, end):
+                month_start, month_end = month_bounds(month)
+                if month_start > now:
+                    continue
+                if month in fetched and pd.Timestamp(fetched[month]["fetched_at"]) >= month_end + self.settle:
+                    continue
+                shards.append((ticker, month))
+        return shards
+
+    def fetch(self, ticker: str, month: str) -> pd.DataFrame:
+        # exponential backoff with jitter, the last error is raised once the retries are used up
+        start, end = month_bounds(month)
+        for attempt in range(self.retries + 1):
+            try:
+                frame = self.provider.fetch(ticker, start, end)
+                break
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        if len(frame) == 0:
+            return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], tz=DEFAULT_TIMEZONE, name="date"))
+        return frame
+
+    def flush(self, ticker: str, pending: List[Tuple[str, pd.DataFrame, pd.Timestamp]]) -> int:
+        # one store write for every month fetched so far, then the manifest
+        frames = [frame for _, frame, _ in pending if len(frame) > 0]
+        added = self.store.append(ticker, pd.concat(frames)) if frames else 0
+        fetched = self.manifest.setdefault(ticker, {})
+        for month, frame, fetched_at in pending:
+            fetched[month] = {"fetched_at": fetched_at.isoformat(), "rows": len(frame), "provider": self.provider.name}
+        save_manifest(self.store.root, self.manifest)
+        pending.clear()
+        return added
+
+    def download(self, tickers: List[str], start="2011-01", end: Optional[str] = None, verbose=False) -> dict:
+        shards = self.plan(tickers, start, end)
+        remaining = {ticker: 0 for ticker in tickers}
+        for ticker, _ in shards:
+            remaining[ticker] += 1
+        pending: Dict[str, list] = {ticker: [] for ticker in tickers}
+        summary = {"shards": len(shards), "fetched": 0, "failed": [], "bars": 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, ticker, month): (ticker, month) for ticker, month in shards}
+            for future in as_completed(futures):
+                ticker, month = futures[future]
+                remaining[ticker] -= 1
+                try:
+                    # the fetch time is taken when the bars came in, a month that ends meanwhile stays stale
+                    pending[ticker].append((month, future.result(), self.current_time()))
+                    summary["fetched"] += 1
+                except Exception as exception:
+                    summary["failed"].append((ticker, month, repr(exception)))
+                    if verbose:
+                        print(f"{ticker} {month}: failed, {exception!r}")
+                if pending[ticker] and (remaining[ticker] == 0 or len(pending[ticker]) >= self.flush_every):
+                    added = self.flush(ticker, pending[ticker])
+                    summary["bars"] += added
+                    if verbose:
+                        print(f"{ticker}: +{added} bars, {remaining[ticker]} shards left")
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="download the missing or stale (ticker, month) shards of 1 minute history into the columnar store")
+    parser.add_argument("tickers", type=str, nargs="+")
+    parser.add_argument("--start", type=str, default="2011-01", help="first month, YYYY-MM")
+    parser.add_argument("--end", type=str, default=None, help="last month, YYYY-MM, defaults to the current month")
+    parser.add_argument("--provider", type=str, default="yahoo", choices=list(PROVIDERS))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--destination", type=str, default=DEFAULT_ROOT)
+    args = parser.parse_args()
+
+    downloader = StockDownloader(PROVIDERS[args.provider](), args.destination, max_workers=args.workers, retries=args.retries)
+    start = time.perf_counter()
+    summary = downloader.download(args.tickers, args.start, args.end, verbose=True)
+    print(f"{summary['fetched']}/{summary['shards']} shards, {summary['bars']} new bars, {len(summary['failed'])} failed in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,48 @@
+import time
+from typing import Optional
 import cv2
 import numpy as np
 import gymnasium
 from gymnasium import spaces
 import pygame
+from ..store import DEFAULT_ROOT, StockStore
+from ..feed import Subscription
+
+# actions
+BUY = 0
+SELL = 1
+HOLD = 2
 
 class LiveDataEnv(gymnasium.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 4}
 
 
-    def __init__(self, starting_capital=1000.0, render_mode="rgb_array"): # starting capital is in euros
+    # with a feed (a MarketReplay subscription or FeedClient.subscription) the env streams: reset takes the window from
+    # the store up to the feed's current time, every step trades at the newest price and then takes in whatever
+    # ticks came in meanwhile without waiting for any, so a step can leave the window as it was
+    # the streamed window is copied out of the ring every step, with reuse_obs_buffer it is a read only view of the
+    # ring instead, which the next steps shift under it, only safe if the caller copies what it keeps
+    def __init__(self, starting_capital=1000.0, render_mode="rgb_array", tickers=None, window_size=1000, column="close", fee=0.0, store_root=DEFAULT_ROOT, feed: Optional[Subscription] = None, reuse_obs_buffer=False): # starting capital is in euros
         super(LiveDataEnv, self).__init__()
         self.render_mode = render_mode
+        self.reuse_obs_buffer = reuse_obs_buffer
+        self.screen = None
+        self.clock = None
+        self.width = 600
+        self.height = 400
 
+        self.starting_capital = starting_capital
         self.capital = starting_capital
+        self.holdings = 0.0
+        self.window_size = window_size
+        self.column = column
+        self.fee = fee # fraction of every trade's value lost to the broker
         self.action_space = spaces.Discrete(3) # buy, sell, do nothing
 
         self.observation_space = spaces.Tuple((spaces.Box( # the first box will represent the past stock prices for 1000 datapoints spanning over some time therefore it could 
             low=0,
             high=2**63 - 2, # max (stocks will prob never reach this price)
-            shape=(1000, ), #
+            shape=(window_size, ), #
             dtype=np.float64
         ), spaces.Box(
            low=0,
@@ -26,23 +50,154 @@ class LiveDataEnv(gymnasium.Env):
            shape=(2, ), # represents how much of that stock we currently own[0] and how much capital we have[1]
            dtype=np.float64 
         )))
+
+        # every price series stays a read only view of the memory mapped store, an observation is one row of the
+        # (len - window_size + 1, window_size) strided view over it so stepping never copies or slices a frame
+        store = StockStore(store_root)
+        tickers = store.tickers if tickers is None else tickers
+        self.tickers = [ticker for ticker in tickers if len(store.load(ticker)) > window_size and (feed is None or ticker in feed.tickers)]
+        if not self.tickers:
+            raise FileNotFoundError(f"no ticker in {store_root} has more than {window_size} bars, run python -m games.stocks.convert_stock_data first")
+        self.series = [np.asarray(store.load(ticker)[column]) for ticker in self.tickers]
+        self.windows = [np.lib.stride_tricks.sliding_window_view(prices, window_size) for prices in self.series]
+
+        self.ticker_index = 0
+        self.prices = self.series[0]
+        self.cursor = window_size - 1 # index of the newest price in the window
+        self.value = starting_capital
+
+        self.feed = feed
+        if feed is not None:
+            self.timestamps = [np.asarray(store.load(ticker).timestamps) for ticker in self.tickers]
+            self.feed_ids = [feed.tickers.index(ticker) for ticker in self.tickers]
+            self.feed_time = np.iinfo(np.int64).min # newest bar time seen on the feed, any ticker
+            self.last_timestamp = self.feed_time # newest bar time in the window
+            self.price = 0.0
+            self.latency: Optional[float] = None # seconds from the replay publishing the newest bar to it being observed
+            # window_size bars kept twice back to back, the window is always the contiguous ring[position:position + window_size]
+            self.ring = np.zeros(2 * window_size, dtype=np.float64)
+            self.ring_position = 0
+            # what the observations are taken from, pushes go to the ring
+            self.ring_view = self.ring.view()
+            self.ring_view.setflags(write=False)
         
     def reset(self, seed=None, options=None):
         super().reset(seed=seed, options=options)
+        if self.feed is not None:
+            return self.reset_stream(options)
 
-        
+        # any ticker, any bar with a full window behind it and at least one bar ahead
+        self.ticker_index = int(self.np_random.integers(len(self.series)))
+        self.prices = self.series[self.ticker_index]
+        self.cursor = int(self.np_random.integers(self.window_size - 1, len(self.prices) - 1))
+        self.capital = self.starting_capital
+        self.holdings = 0.0
+        self.value = self.starting_capital
+
+        if self.render_mode == "human":
+            self._render_frame()
+
+        return self._get_obs(), {}  # empty info dict
+
+    def reset_stream(self, options=None):
+        # the ticker of options["ticker"] or any ticker, the window is the last window_size bars the store has up to
+        # the feed's time (or the first window_size bars before anything came in)
+        self.consume()
+        if options is not None and "ticker" in options:
+            self.ticker_index = self.tickers.index(options["ticker"])
+        else:
+            self.ticker_index = int(self.np_random.integers(len(self.series)))
+        self.prices = self.series[self.ticker_index]
+        timestamps = self.timestamps[self.ticker_index]
+        end = max(int(np.searchsorted(timestamps, self.feed_time, side="right")), self.window_size)
+        self.ring[:self.window_size] = self.prices[end - self.window_size:end]
+        self.ring[self.window_size:] = self.ring[:self.window_size]
+        self.ring_position = 0
+        self.last_timestamp = int(timestamps[end - 1])
+        self.price = float(self.prices[end - 1])
+        self.latency = None
+        self.capital = self.starting_capital
+        self.holdings = 0.0
+        self.value = self.starting_capital
+
+        if self.render_mode == "human":
+            self._render_frame()
 
-        return obs, {}  # empty info dict
+        return self._get_obs(), {}
+
+    def push(self, prices: np.ndarray):
+        if len(prices) >= self.window_size:
+            self.ring[:self.window_size] = prices[-self.window_size:]
+            self.ring[self.window_size:] = self.ring[:self.window_size]
+            self.ring_position = 0
+            return
+        positions = (self.ring_position + np.arange(len(prices))) % self.window_size
+        self.ring[positions] = prices
+        self.ring[positions + self.window_size] = prices
+        self.ring_position = (self.ring_position + len(prices)) % self.window_size
+
+    def consume(self) -> int:
+        # takes every batch that is waiting, never blocks, returns how many new bars of the episode's ticker came in
+        batches = self.feed.poll()
+        if not batches:
+            return 0
+        ticks = np.concatenate(batches) if len(batches) > 1 else batches[0]
+        self.feed_time = max(self.feed_time, int(ticks["timestamp"][-1]))
+        ticks = ticks[(ticks["ticker"] == self.feed_ids[self.ticker_index]) & (ticks["timestamp"] > self.last_timestamp)]
+        if len(ticks) == 0:
+            return 0
+        self.push(ticks[self.column])
+        self.last_timestamp = int(ticks["timestamp"][-1])
+        self.price = float(ticks[self.column][-1])
+        self.latency = (time.time_ns() - int(ticks["published"][-1])) / 1e9
+        return len(ticks)
 
     def step(self, action):
+        # trades go through at the newest price of the window, all in or all out
+        price = self.price if self.feed is not None else self.prices[self.cursor]
+        if action == BUY:
+            if self.capital > 0:
+                self.holdings += self.capital * (1 - self.fee) / price
+                self.capital = 0.0
+        elif action == SELL:
+            if self.holdings > 0:
+                self.capital += self.holdings * price * (1 - self.fee)
+                self.holdings = 0.0
+        elif action != HOLD:
+            raise ValueError(
+                f"Received invalid action={action} which is not part of the action space"
+            )
+
+        if self.feed is not None:
+            info = {"ticks": self.consume(), "latency": self.latency}
+            value = self.capital + self.holdings * self.price
+            terminated = self.feed.finished and not self.feed.queue # the feed is over
+        else:
+            info = {}
+            self.cursor += 1
+            value = self.capital + self.holdings * self.prices[self.cursor]
+            terminated = self.cursor == len(self.prices) - 1 # out of history
+        reward = value - self.value
+        self.value = value
+        truncated = False
+
+        if self.render_mode == "human":
+            self._render_frame()
+
         return (
-            obs,
+            self._get_obs(),
             reward,
             terminated,
             truncated,
             info,
         )
 
+    def _get_obs(self):
+        if self.feed is not None:
+            window = self.ring_view[self.ring_position:self.ring_position + self.window_size]
+            return window if self.reuse_obs_buffer else window.copy(), np.array((self.holdings, self.capital))
+        return self.windows[self.ticker_index][self.cursor - self.window_size + 1], np.array((self.holdings, self.capital))
+
     def render(self):
         if self.render_mode == "rgb_array":
             cv2.imshow('Window Name', self._render_frame())
@@ -65,7 +220,12 @@ class LiveDataEnv(gymnasium.Env):
         canvas = pygame.Surface((self.width, self.height))
         canvas.fill((0, 0, 0))
         
-        # render logic in here todo
+        # the price window as a line scaled to the canvas
+        window = self._get_obs()[0]
+        low, high = window.min(), window.max()
+        xs = np.linspace(0, self.width - 1, len(window))
+        ys = (window - low) / max(high - low, 1e-9) * (self.height - 1)
+        pygame.draw.lines(canvas, (230, 0, 0) if self.holdings > 0 else (230, 230, 230), False, np.stack((xs, ys), axis=1).tolist())
 
         self.surf = pygame.transform.flip(canvas, False, True)
         self.screen.blit(self.surf, (0, 0))
@@ -90,4 +250,10 @@ register(
     id='stocks-live-data-v0',
     entry_point='games.stocks.envs.live_data:LiveDataEnv',
     max_episode_steps=None,
-)
\ No newline at end of file
+)
+register(
+    id='stocks-live-data-vec-v0',
+    entry_point='games.stocks.envs.live_data:LiveDataEnv',
+    vector_entry_point='games.stocks.envs.vec_env:StocksVecEnv',
+    max_episode_steps=None,
+)
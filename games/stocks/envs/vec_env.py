@@ -0,0 +1,147 @@
+from typing import Any, List, Optional
+import numpy as np
+import gymnasium
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices
+from ..store import DEFAULT_ROOT, StockStore
+from .live_data import BUY, SELL, HOLD
+
+
+class StocksVecEnv(VecEnv):
+    # num_envs LiveDataEnv episodes (same actions, fee and reward) stepped together as (num_envs,) arrays,
+    # SB3 policies do not take Tuple observations so the (prices, portfolio) pair comes as a Dict
+    def __init__(self, num_envs=64, starting_capital=1000.0, tickers=None, window_size=1000, column="close", fee=0.0, max_episode_steps=None, store_root=DEFAULT_ROOT, seed=None):
+        self.starting_capital = starting_capital
+        self.window_size = window_size
+        self.fee = fee
+        self.max_episode_steps = max_episode_steps
+        self.render_mode = None
+        self.rng = np.random.default_rng(seed)
+
+        store = StockStore(store_root)
+        tickers = store.tickers if tickers is None else tickers
+        self.tickers = [ticker for ticker in tickers if len(store.load(ticker)) > window_size]
+        if not self.tickers:
+            raise FileNotFoundError(f"no ticker in {store_root} has more than {window_size} bars, run python -m games.stocks.convert_stock_data first")
+
+        # every ticker back to back in one array, windows never cross a ticker boundary because an episode's
+        # cursor always has window_size - 1 bars of its own ticker behind it
+        series = [np.asarray(store.load(ticker)[column]) for ticker in self.tickers]
+        self.prices = np.concatenate(series)
+        self.starts = np.cumsum([0] + [len(prices) for prices in series[:-1]])
+        self.ends = self.starts + np.array([len(prices) for prices in series]) - 1
+        self.windows = np.lib.stride_tricks.sliding_window_view(self.prices, window_size)
+
+        self.env_indices = np.arange(num_envs)
+        self.ticker_indices = np.zeros(num_envs, dtype=np.intp)
+        self.cursors = np.zeros(num_envs, dtype=np.intp) # index of the newest price in self.prices
+        self.holdings = np.zeros(num_envs, dtype=np.float64)
+        self.capital = np.full(num_envs, starting_capital, dtype=np.float64)
+        self.values = np.full(num_envs, starting_capital, dtype=np.float64)
+        self.fees_paid = np.zeros(num_envs, dtype=np.float64)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.actions = np.full(num_envs, HOLD, dtype=np.intp)
+
+        observation_space = spaces.Dict({
+            "prices": spaces.Box(low=0, high=2**63 - 2, shape=(window_size, ), dtype=np.float64),
+            "portfolio": spaces.Box(low=0, high=2**63 - 2, shape=(2, ), dtype=np.float64), # holdings, capital
+        })
+        super(StocksVecEnv, self).__init__(num_envs, observation_space, spaces.Discrete(3))
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds)
+        self._reset_seeds()
+        self._reset_options()
+
+        self.reset_envs(self.env_indices)
+        return self.observe(self.env_indices)
+
+    def reset_envs(self, indices: np.ndarray):
+        # LiveDataEnv.reset: any ticker, any bar with a full window behind it and at least one bar ahead
+        tickers = self.rng.integers(0, len(self.tickers), len(indices))
+        lengths = self.ends[tickers] - self.starts[tickers] + 1
+        self.ticker_indices[indices] = tickers
+        self.cursors[indices] = self.starts[tickers] + self.rng.integers(self.window_size - 1, lengths - 1)
+        self.holdings[indices] = 0.0
+        self.capital[indices] = self.starting_capital
+        self.values[indices] = self.starting_capital
+        self.fees_paid[indices] = 0.0
+        self.steps[indices] = 0
+
+    def observe(self, indices: np.ndarray) -> dict:
+        # the one copy per step, the window batch is gathered straight out of the strided view
+        return {
+            "prices": self.windows[self.cursors[indices] - self.window_size + 1],
+            "portfolio": np.stack((self.holdings[indices], self.capital[indices]), axis=1),
+        }
+
+    def step_async(self, actions: np.ndarray):
+        self.actions = np.asarray(actions, dtype=np.intp).reshape(self.num_envs)
+
+    def step_wait(self):
+        if np.any((self.actions < 0) | (self.actions > 2)):
+            raise ValueError(f"Received invalid actions={self.actions} which are not part of the action space")
+
+        # LiveDataEnv.step: all in or all out at the newest price, the fee is taken off the traded value
+        price = self.prices[self.cursors]
+        buying = (self.actions == BUY) & (self.capital > 0)
+        selling = (self.actions == SELL) & (self.holdings > 0)
+        traded = np.where(buying, self.capital, 0.0) + np.where(selling, self.holdings * price, 0.0)
+        self.fees_paid += traded * self.fee
+        self.holdings = np.where(buying, self.holdings + self.capital * (1 - self.fee) / price, self.holdings)
+        self.capital = np.where(buying, 0.0, self.capital)
+        self.capital = np.where(selling, self.capital + self.holdings * price * (1 - self.fee), self.capital)
+        self.holdings = np.where(selling, 0.0, self.holdings)
+
+        self.cursors += 1
+        self.steps += 1
+        values = self.capital + self.holdings * self.prices[self.cursors]
+        rewards = (values - self.values).astype(np.float32)
+        self.values = values
+
+        terminated = self.cursors == self.ends[self.ticker_indices]
+        truncated = ~terminated & (self.steps >= self.max_episode_steps) if self.max_episode_steps is not None else np.zeros(self.num_envs, dtype=bool)
+        dones = terminated | truncated
+        observations = self.observe(self.env_indices)
+
+        infos = [{} for _ in range(self.num_envs)]
+        finished = np.flatnonzero(dones)
+        if len(finished) > 0:
+            for index in finished:
+                infos[index]["terminal_observation"] = {key: value[index].copy() for key, value in observations.items()}
+                infos[index]["TimeLimit.truncated"] = bool(truncated[index])
+                infos[index]["fees_paid"] = float(self.fees_paid[index])
+            self.reset_envs(finished)
+            reset_observations = self.observe(finished)
+            for key, value in reset_observations.items():
+                observations[key][finished] = value
+
+        return observations, rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def get_images(self) -> List[Optional[np.ndarray]]:
+        return [None for _ in range(self.num_envs)]
+
+    def _indices(self, indices: VecEnvIndices) -> List[int]:
+        if indices is None:
+            return list(range(self.num_envs))
+        if isinstance(indices, int):
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        # every episode shares the attributes of the vectorized env
+        return [getattr(self, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type[gymnasium.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._indices(indices)]
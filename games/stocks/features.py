@@ -0,0 +1,188 @@
+import math
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from .store import TickerSeries
+
+# streaming features over the last `window` minute bars, every update costs the same whatever the window
+FEATURES = [
+    "log_return",        # log(close / previous close), 0 on the first bar
+    "close_to_mean",     # close / rolling mean of close - 1
+    "close_cv",          # rolling std of close / rolling mean of close
+    "close_z",           # (close - rolling mean) / rolling std
+    "return_mean",       # rolling mean of log_return
+    "return_std",        # rolling std of log_return
+    "return_z",          # (log_return - rolling mean) / rolling std
+    "close_to_vwap",     # close / rolling vwap - 1, vwap over the typical price (high + low + close) / 3
+    "volume_z",          # (volume - rolling mean) / rolling std
+    "bar_range",         # (high - low) / close
+]
+
+
+class RollingMoments:
+    # sum and sum of squares of the last `window` values in a ring buffer, O(1) per push
+    # values are shifted by the first one seen so the variance does not cancel out on prices far from 0,
+    # and the sums are rebuilt from the ring once per window so rounding errors can not pile up (amortized O(1))
+    def __init__(self, window: int):
+        self.window = window
+        self.ring: List[float] = [0.0] * window
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.position = 0
+        self.shift: Optional[float] = None
+        self.total = 0.0
+        self.squares = 0.0
+        self.pushes = 0
+
+    def push(self, value: float):
+        if self.shift is None:
+            self.shift = value
+        value -= self.shift
+        if self.count == self.window:
+            old = self.ring[self.position]
+            self.total -= old
+            self.squares -= old * old
+        else:
+            self.count += 1
+        self.ring[self.position] = value
+        self.total += value
+        self.squares += value * value
+        self.position = (self.position + 1) % self.window
+
+        self.pushes += 1
+        if self.pushes == self.window:
+            self.pushes = 0
+            values = self.ring[:self.count] if self.count < self.window else self.ring
+            self.total = math.fsum(values)
+            self.squares = math.fsum(value * value for value in values)
+
+    def mean(self) -> float:
+        return self.total / self.count + self.shift
+
+    def std(self) -> float:
+        # population std (ddof=0), exactly 0 for a constant window
+        mean = self.total / self.count
+        variance = self.squares / self.count - mean * mean
+        # what is left of a constant window after rounding
+        if variance <= 1e-12 * (self.squares / self.count + 1e-300):
+            return 0.0
+        return math.sqrt(variance)
+
+
+class RollingSum:
+    def __init__(self, window: int):
+        self.window = window
+        self.ring: List[float] = [0.0] * window
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.position = 0
+        self.total = 0.0
+        self.pushes = 0
+
+    def push(self, value: float):
+        if self.count == self.window:
+            self.total -= self.ring[self.position]
+        else:
+            self.count += 1
+        self.ring[self.position] = value
+        self.total += value
+        self.position = (self.position + 1) % self.window
+
+        self.pushes += 1
+        if self.pushes == self.window:
+            self.pushes = 0
+            self.total = math.fsum(self.ring[:self.count] if self.count < self.window else self.ring)
+
+
+def z_score(value: float, mean: float, std: float) -> float:
+    return (value - mean) / std if std > 0 else 0.0
+
+
+class FeatureEngine:
+    # feed it one bar at a time, update() returns the float32 feature vector of that bar (len(FEATURES) wide),
+    # windows shorter than `window` (the first bars after a reset) use whatever bars there are
+    def __init__(self, window=1000):
+        self.window = window
+        self.closes = RollingMoments(window)
+        self.returns = RollingMoments(window)
+        self.volumes = RollingMoments(window)
+        self.price_volume = RollingSum(window)
+        self.volume = RollingSum(window)
+        self.out = np.zeros(len(FEATURES), dtype=np.float32)
+        self.previous_close: Optional[float] = None
+
+    def reset(self):
+        for rolling in (self.closes, self.returns, self.volumes, self.price_volume, self.volume):
+            rolling.reset()
+        self.previous_close = None
+
+    def update(self, high: float, low: float, close: float, volume: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+        log_return = math.log(close / self.previous_close) if self.previous_close is not None else 0.0
+        self.previous_close = close
+
+        self.closes.push(close)
+        self.returns.push(log_return)
+        self.volumes.push(volume)
+        self.price_volume.push((high + low + close) / 3 * volume)
+        self.volume.push(volume)
+
+        close_mean, close_std = self.closes.mean(), self.closes.std()
+        return_mean, return_std = self.returns.mean(), self.returns.std()
+        vwap = self.price_volume.total / self.volume.total if self.volume.total > 0 else close
+
+        out = self.out if out is None else out
+        out[:] = (
+            log_return,
+            close / close_mean - 1,
+            close_std / close_mean,
+            z_score(close, close_mean, close_std),
+            return_mean,
+            return_std,
+            z_score(log_return, return_mean, return_std),
+            close / vwap - 1,
+            z_score(volume, self.volumes.mean(), self.volumes.std()),
+            (high - low) / close,
+        )
+        return out
+
+    def transform(self, series: TickerSeries, out: Optional[np.ndarray] = None) -> np.ndarray:
+        # streams a whole series through a fresh engine, (len(series), len(FEATURES)) float32
+        self.reset()
+        out = np.empty((len(series), len(FEATURES)), dtype=np.float32) if out is None else out
+        for i, (high, low, close, volume) in enumerate(zip(series["high"].tolist(), series["low"].tolist(), series["close"].tolist(), series["volume"].tolist())):
+            self.update(high, low, close, volume, out=out[i])
+        return out
+
+
+def reference_features(frame: pd.DataFrame, window=1000) -> pd.DataFrame:
+    # the same features computed in one batch with pandas, what FeatureEngine is checked against
+    def rolling(series: pd.Series):
+        return series.rolling(window, min_periods=1)
+
+    def z(value, mean, std):
+        return ((value - mean) / std).where(std > 0, 0.0)
+
+    close, volume = frame["close"], frame["volume"]
+    log_return = np.log(close / close.shift(1)).fillna(0.0)
+    close_mean, close_std = rolling(close).mean(), rolling(close).std(ddof=0)
+    return_mean, return_std = rolling(log_return).mean(), rolling(log_return).std(ddof=0)
+    volume_mean, volume_std = rolling(volume).mean(), rolling(volume).std(ddof=0)
+    volume_sum = rolling(volume).sum()
+    vwap = (rolling((frame["high"] + frame["low"] + close) / 3 * volume).sum() / volume_sum).where(volume_sum > 0, close)
+
+    return pd.DataFrame({
+        "log_return": log_return,
+        "close_to_mean": close / close_mean - 1,
+        "close_cv": close_std / close_mean,
+        "close_z": z(close, close_mean, close_std),
+        "return_mean": return_mean,
+        "return_std": return_std,
+        "return_z": z(log_return, return_mean, return_std),
+        "close_to_vwap": close / vwap - 1,
+        "volume_z": z(volume, volume_mean, volume_std),
+        "bar_range": (frame["high"] - frame["low"]) / close,
+    }, index=frame.index)
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+import websockets
+from .store import DEFAULT_ROOT, StockStore
+
+# usage (from the repository root):
+#   python -m games.stocks.feed [--port 9910] [--speed 60] [--tickers AAPL MSFT]
+#
+# replays the minute bars of the store as if they were coming in live, every ticker merged in time order: all the
+# bars of one minute go out together as one TICK_DTYPE batch, either to in-process subscriptions or over a websocket
+# (first message is {"tickers": [...]} so the ticker ids can be resolved, then one binary message per batch)
+
+TICK_DTYPE = np.dtype([
+    ("ticker", np.uint16), # index into MarketReplay.tickers
+    ("timestamp", np.int64), # bar time, nanoseconds since the epoch (utc)
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.float64),
+    ("published", np.int64), # time.time_ns() when the batch left the replay, for tick to observation latency
+])
+
+
+class Subscription:
+    # non blocking consumer side, batches are queued as they come and poll() takes whatever is there,
+    # with maxlen the oldest batches are dropped (and counted) instead of letting a slow consumer pile them up
+    tickers: List[str]
+
+    def __init__(self, tickers: List[str], ids: Optional[np.ndarray] = None, maxlen: Optional[int] = None, callback: Optional[Callable[[np.ndarray], None]] = None):
+        self.tickers = tickers
+        self.ids = ids
+        self.queue = deque(maxlen=maxlen)
+        self.callback = callback
+        self.event = threading.Event()
+        self.received = 0
+        self.dropped = 0
+        self.finished = False # the feed is over, nothing more will come
+
+    def put(self, batch: np.ndarray):
+        if self.ids is not None:
+            batch = batch[np.isin(batch["ticker"], self.ids)]
+            if len(batch) == 0:
+                return
+        self.received += len(batch)
+        if self.callback is not None:
+            self.callback(batch)
+            return
+        if self.queue.maxlen is not None and len(self.queue) == self.queue.maxlen:
+            self.dropped += len(self.queue[0])
+        self.queue.append(batch)
+        self.event.set()
+
+    def finish(self):
+        self.finished = True
+        if self.callback is not None:
+            self.callback(None)
+        self.event.set()
+
+    def poll(self) -> List[np.ndarray]:
+        self.event.clear()
+        batches = []
+        while self.queue:
+            batches.append(self.queue.popleft())
+        return batches
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        # for consumers that do want to block until something comes in
+        return self.event.wait(timeout)
+
+
+class Feed:
+    # fans the batches out to any number of subscriptions, subscribed tickers are names of self.tickers
+    tickers: List[str]
+    subscribers: List[Subscription]
+
+    def subscribe(self, tickers: Optional[Sequence[str]] = None, maxlen: Optional[int] = None, callback: Optional[Callable[[np.ndarray], None]] = None) -> Subscription:
+        ids = None if tickers is None else np.array([self.tickers.index(ticker) for ticker in tickers], dtype=np.uint16)
+        subscription = Subscription(self.tickers, ids, maxlen, callback)
+        self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self.subscribers:
+            self.subscribers.remove(subscription)
+
+    def deliver(self, batch: np.ndarray):
+        for subscription in list(self.subscribers):
+            subscription.put(batch)
+
+    def finish(self):
+        for subscription in list(self.subscribers):
+            subscription.finish()
+
+
+class MarketReplay(Feed):
+    # speed is how many seconds of market time go by per second, None replays as fast as the subscribers keep up,
+    # gaps longer than max_gap seconds (nights, weekends) take one minute of market time, None keeps them as they are
+    def __init__(self, tickers: Optional[Sequence[str]] = None, speed: Optional[float] = 60.0, start=None, end=None, max_gap: Optional[float] = 3600.0, store_root=DEFAULT_ROOT):
+        store = StockStore(store_root)
+        tickers = store.tickers if tickers is None else tickers
+        self.tickers = [ticker for ticker in tickers if ticker in store.tickers]
+        if not self.tickers:
+            raise FileNotFoundError(f"none of the tickers are in {store_root}")
+        self.speed = speed
+        self.subscribers: List[Subscription] = []
+
+        # every bar of every ticker in one array, sorted by time (ticker order within a minute)
+        parts = []
+        for i, ticker in enumerate(self.tickers):
+            series = store.range(ticker, start, end)
+            part = np.zeros(len(series), dtype=TICK_DTYPE)
+            part["ticker"] = i
+            part["timestamp"] = series.timestamps
+            for column in ("open", "high", "low", "close", "volume"):
+                part[column] = series[column]
+            parts.append(part)
+        ticks = np.concatenate(parts)
+        self.ticks = ticks[np.argsort(ticks["timestamp"], kind="stable")]
+        self.bounds = np.concatenate(([0], np.flatnonzero(np.diff(self.ticks["timestamp"])) + 1, [len(self.ticks)]))
+        # seconds into the replay at which every batch is due at speed 1
+        gaps = np.diff(self.ticks["timestamp"][self.bounds[:-1]]) / 1e9
+        if max_gap is not None:
+            gaps = np.where(gaps > max_gap, 60.0, gaps)
+        self.schedule = np.concatenate(([0.0], np.cumsum(gaps)))
+
+        self.position = 0 # next batch
+        self.clock = int(self.ticks["timestamp"][0]) - 1 # market time of the last published batch
+        self.published = 0
+        self.lag = 0.0 # worst time a batch went out after its schedule
+        self.done = False
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    def publish(self, i: int):
+        batch = self.ticks[self.bounds[i]:self.bounds[i + 1]].copy()
+        batch["published"] = time.time_ns()
+        self.clock = int(batch["timestamp"][0])
+        self.deliver(batch)
+        self.published += len(batch)
+
+    async def run(self):
+        started = time.perf_counter()
+        origin = self.schedule[self.position]
+        while self.position < len(self.bounds) - 1 and not self.stop_event.is_set():
+            if self.speed is None:
+                await asyncio.sleep(0)
+            else:
+                due = started + (self.schedule[self.position] - origin) / self.speed
+                delay = due - time.perf_counter()
+                self.lag = max(self.lag, -delay)
+                # behind schedule it still yields, so the server handlers on this loop get to send
+                await asyncio.sleep(max(delay, 0))
+            self.publish(self.position)
+            self.position += 1
+        self.done = True
+        self.finish()
+
+    def start(self):
+        # for in-process subscribers, the replay runs on its own event loop in a daemon thread
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(), ), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class FeedServer:
+    def __init__(self, replay: MarketReplay, host="localhost", port=9910):
+        self.replay = replay
+        self.host = host
+        self.port = port
+
+    async def handler(self, websocket):
+        await websocket.send(json.dumps({"tickers": self.replay.tickers}))
+        request = json.loads(await websocket.recv())
+        queue = asyncio.Queue()
+        subscription = self.replay.subscribe(request.get("tickers"), callback=queue.put_nowait)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                await websocket.send(batch.tobytes())
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.replay.unsubscribe(subscription)
+
+    async def serve(self, replay_delay=0.0):
+        # replay_delay gives the first clients time to subscribe before the first batch
+        async with websockets.serve(self.handler, self.host, self.port):
+            await asyncio.sleep(replay_delay)
+            await self.replay.run()
+            # the handlers unsubscribe once they sent everything that was queued
+            while self.replay.subscribers:
+                await asyncio.sleep(0.05)
+
+
+class FeedClient(Feed):
+    # the other end of FeedServer, subscribed like a MarketReplay: one connection (for `tickers`, None for every
+    # ticker of the replay) is received on a daemon thread and fanned out to the local subscriptions
+    def __init__(self, tickers: Optional[Sequence[str]] = None, host="localhost", port=9910):
+        self.uri = f"ws://{host}:{port}"
+        self.requested = None if tickers is None else list(tickers)
+        self.tickers = []
+        self.subscribers = []
+        self.connected = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.receive(), ), daemon=True)
+        self.thread.start()
+        if not self.connected.wait(10):
+            raise ConnectionError(f"no market feed at {self.uri}")
+
+    async def receive(self):
+        async with websockets.connect(self.uri, max_size=None) as websocket:
+            self.websocket = websocket
+            self.loop = asyncio.get_running_loop()
+            self.tickers = json.loads(await websocket.recv())["tickers"]
+            await websocket.send(json.dumps({"tickers": self.requested}))
+            self.connected.set()
+            try:
+                async for message in websocket:
+                    self.deliver(np.frombuffer(message, dtype=TICK_DTYPE))
+            except websockets.ConnectionClosed:
+                pass
+            self.finish()
+
+    def close(self):
+        if self.connected.is_set() and self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self.websocket.close(), self.loop)
+        self.thread.join(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay the minute bars of the store as a live market feed")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=9910)
+    parser.add_argument("--speed", type=float, default=60.0, help="market seconds per second, 0 for as fast as possible")
+    parser.add_argument("--tickers", type=str, nargs="*", default=None)
+    parser.add_argument("--start", type=str, default=None)
+    parser.add_argument("--end", type=str, default=None)
+    parser.add_argument("--max-gap", type=float, default=3600.0, help="longer gaps (seconds) are replayed as one minute, 0 keeps them")
+    parser.add_argument("--store", type=str, default=DEFAULT_ROOT)
+    args = parser.parse_args()
+
+    replay = MarketReplay(args.tickers, args.speed or None, args.start, args.end, args.max_gap or None, args.store)
+    print(f"replaying {len(replay.ticks)} bars of {len(replay.tickers)} tickers on ws://{args.host}:{args.port}")
+    started = time.perf_counter()
+    try:
+        asyncio.run(FeedServer(replay, args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - started
+    print(f"published {replay.published} ticks in {elapsed:.1f} s ({replay.published / elapsed:.0f}/s), worst lag {1000 * replay.lag:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
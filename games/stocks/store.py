@@ -0,0 +1,211 @@
+import json
+import os
+import shutil
+import time
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+
+# columnar on disk layout of the minute bars, one directory per ticker:
+#   <root>/<TICKER>/timestamp.npy   int64 nanoseconds since the epoch (utc), sorted and unique
+#   <root>/<TICKER>/<column>.npy    one float64 array per price column, at least as long as timestamp
+#   <root>/<TICKER>/meta.json       columns, row count, timezone of the source data
+# the arrays are opened with np.load(mmap_mode="r"), so every process reading a ticker shares the page cache
+# <root>/<TICKER> is a symlink to a version directory <root>/.versions/<TICKER>/<version>, a write fills a new
+# version and publishes it by renaming a new link over the old one, readers resolve the link once per load
+# only the first meta.json rows of the arrays are bars, appends past the last bar grow the current version's
+# arrays in place and then replace meta.json, so a reader sees either the old rows or the new ones
+
+DEFAULT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "stock_store"))
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+DEFAULT_TIMEZONE = "America/New_York"
+VERSIONS = ".versions"
+
+
+def to_nanoseconds(value, timezone: str = DEFAULT_TIMEZONE) -> int:
+    # ints are taken as nanoseconds already, naive times as times in the store's timezone
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(timezone)
+    return timestamp.value
+
+
+class TickerSeries:
+    # read only minute bars of a single ticker, slicing never copies
+    ticker: str
+    timezone: str
+    timestamps: np.ndarray
+    columns: Dict[str, np.ndarray]
+
+    def __init__(self, ticker: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray], timezone: str = DEFAULT_TIMEZONE):
+        self.ticker = ticker
+        self.timestamps = timestamps
+        self.columns = columns
+        self.timezone = timezone
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def index_range(self, start=None, end=None):
+        # row indices [i, j) of the bars with start <= timestamp < end
+        i = 0 if start is None else int(np.searchsorted(self.timestamps, to_nanoseconds(start, self.timezone), side="left"))
+        j = len(self) if end is None else int(np.searchsorted(self.timestamps, to_nanoseconds(end, self.timezone), side="left"))
+        return i, max(i, j)
+
+    def slice(self, i: int, j: int) -> "TickerSeries":
+        return TickerSeries(self.ticker, self.timestamps[i:j], {name: column[i:j] for name, column in self.columns.items()}, self.timezone)
+
+    def range(self, start=None, end=None) -> "TickerSeries":
+        return self.slice(*self.index_range(start, end))
+
+    def to_frame(self) -> pd.DataFrame:
+        # copies, for inspection and plotting
+        index = pd.to_datetime(np.asarray(self.timestamps), utc=True).tz_convert(self.timezone)
+        return pd.DataFrame({name: np.asarray(column) for name, column in self.columns.items()}, index=pd.Index(index, name="date"))
+
+
+class StockStore:
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self.series: Dict[str, TickerSeries] = {}
+
+    @property
+    def tickers(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, name, "meta.json")))
+
+    def load(self, ticker: str) -> TickerSeries:
+        if ticker not in self.series:
+            directory = os.path.realpath(os.path.join(self.root, ticker))
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+            rows = meta["rows"]
+            timestamps = np.load(os.path.join(directory, "timestamp.npy"), mmap_mode="r")[:rows]
+            columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")[:rows] for name in meta["columns"]}
+            self.series[ticker] = TickerSeries(ticker, timestamps, columns, meta["timezone"])
+        return self.series[ticker]
+
+    def range(self, ticker: str, start=None, end=None) -> TickerSeries:
+        return self.load(ticker).range(start, end)
+
+    def write(self, ticker: str, frame: pd.DataFrame):
+        # frame has a DatetimeIndex (or a (symbol, date) MultiIndex like yahooquery returns) and the price columns,
+        # it becomes a new version of the ticker, published at once so readers never see a half written ticker
+        # (one writer per ticker at a time)
+        frame = normalize_bars(frame)
+        versions = os.path.join(self.root, VERSIONS, ticker)
+        version = os.path.join(versions, f"{time.time_ns()}-{os.getpid()}")
+        os.makedirs(version)
+
+        timezone = str(frame.index.tz) if frame.index.tz is not None else DEFAULT_TIMEZONE
+        np.save(os.path.join(version, "timestamp.npy"), frame.index.asi8.astype(np.int64))
+        columns = [column for column in frame.columns]
+        for column in columns:
+            np.save(os.path.join(version, f"{column}.npy"), frame[column].to_numpy(dtype=np.float64))
+        write_meta(version, {"ticker": ticker, "rows": len(frame), "columns": columns, "timezone": timezone})
+        self.publish(ticker, version)
+        self.series.pop(ticker, None)
+
+    def publish(self, ticker: str, version: str):
+        # points <root>/<TICKER> at version with a single rename, the version it replaces is kept for the readers
+        # that resolved the link just before and every older one is removed
+        link = os.path.join(self.root, ticker)
+        versions = os.path.dirname(version)
+        previous = os.path.realpath(link) if os.path.lexists(link) else None
+        if os.path.isdir(link) and not os.path.islink(link):
+            # a ticker stored before the versions, moved into them first, the only time a reader can miss it
+            previous = os.path.realpath(os.path.join(versions, "0"))
+            os.replace(link, previous)
+        staging = os.path.join(versions, f"link.tmp-{os.getpid()}")
+        if os.path.lexists(staging):
+            os.remove(staging)
+        os.symlink(os.path.relpath(version, self.root), staging)
+        os.replace(staging, link)
+        for name in os.listdir(versions):
+            path = os.path.realpath(os.path.join(versions, name))
+            if path != os.path.realpath(version) and path != previous:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def append(self, ticker: str, frame: pd.DataFrame) -> int:
+        # adds the bars of frame whose minute is not stored yet (stored minutes are never rewritten) and returns
+        # how many, nothing is touched on disk when there is nothing new
+        # bars after the last stored one are appended to the arrays in place, the cost grows with the new bars only,
+        # bars that fall inside the stored history (backfills) rewrite the whole ticker as a new version
+        frame = normalize_bars(frame)
+        self.series.pop(ticker, None)
+        if ticker not in self.tickers or len(self.load(ticker)) == 0:
+            if len(frame) > 0:
+                self.write(ticker, frame)
+            return len(frame)
+
+        series = self.load(ticker)
+        timestamps = frame.index.asi8
+        positions = np.minimum(np.searchsorted(series.timestamps, timestamps), len(series) - 1)
+        new = frame[np.asarray(series.timestamps)[positions] != timestamps].tz_convert(series.timezone)
+        if len(new) == 0:
+            return 0
+        if new.index.asi8[0] <= series.timestamps[-1] or list(new.columns) != list(series.columns) or not self.extend(ticker, new):
+            self.write(ticker, pd.concat([series.to_frame(), new]))
+        self.series.pop(ticker, None)
+        return len(new)
+
+    def extend(self, ticker: str, frame: pd.DataFrame) -> bool:
+        # appends the rows of frame to the current version, the arrays first and meta.json last, False when an
+        # array's header has no room for the longer shape (arrays grown before that only have rows past meta.json)
+        directory = os.path.realpath(os.path.join(self.root, ticker))
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        arrays = {"timestamp": frame.index.asi8.astype(np.int64), **{column: frame[column].to_numpy(dtype=np.float64) for column in meta["columns"]}}
+        for name, values in arrays.items():
+            if not grow_array(os.path.join(directory, f"{name}.npy"), rows, values):
+                return False
+        write_meta(directory, {**meta, "rows": rows + len(frame)})
+        return True
+
+
+def write_meta(directory: str, meta: dict):
+    staging = os.path.join(directory, f"meta.json.tmp-{os.getpid()}")
+    with open(staging, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(staging, os.path.join(directory, "meta.json"))
+
+
+def grow_array(path: str, rows: int, values: np.ndarray) -> bool:
+    # writes values after the first rows of a 1d .npy array and then rewrites its header with the new length in
+    # place, np.save leaves room in the header for that, False (and nothing written) when there is none
+    with open(path, "r+b") as f:
+        major, _ = np.lib.format.read_magic(f)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f) if major == 1 else np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        # magic, version and the header length field (2 bytes in version 1, 4 after)
+        start = 10 if major == 1 else 12
+        header = f"{{'descr': {np.lib.format.dtype_to_descr(dtype)!r}, 'fortran_order': False, 'shape': ({rows + len(values)},), }}"
+        if len(shape) != 1 or shape[0] < rows or len(header) + 1 > offset - start:
+            return False
+        f.seek(offset + rows * dtype.itemsize)
+        f.write(values.astype(dtype).tobytes())
+        f.flush()
+        f.seek(start)
+        f.write(header.ljust(offset - start - 1).encode("latin1") + b"\n")
+    return True
+
+
+def normalize_bars(frame: pd.DataFrame) -> pd.DataFrame:
+    # one row per minute in time order, the last copy of a minute wins
+    if isinstance(frame.index, pd.MultiIndex):
+        frame = frame.droplevel([name for name in frame.index.names if name != "date"])
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is None:
+        index = index.tz_localize(DEFAULT_TIMEZONE)
+    # the store keeps nanoseconds, pandas builds some indexes in other units
+    frame = frame.set_axis(index.as_unit("ns"))
+    frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+    columns = [column for column in PRICE_COLUMNS if column in frame.columns] + sorted(column for column in frame.columns if column not in PRICE_COLUMNS)
+    return frame[columns]
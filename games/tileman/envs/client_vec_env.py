@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+import numpy as np
+import gymnasium
+from gymnasium import spaces
+import websockets
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices
+from . import protocol
+from .packing import packed_space
+from .observation_ring import ObservationRing
+
+
+class LoopThread:
+    # an event loop running in a daemon thread, coroutines are handed to it from the calling thread so
+    # the connections keep being served (keepalives, pings) between calls and no nested loop is needed
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        return self.submit(coroutine).result()
+
+    def gather(self, coroutines) -> Future:
+        async def gather():
+            return await asyncio.gather(*coroutines)
+        return self.submit(gather())
+
+    def create_task(self, coroutine) -> asyncio.Task:
+        async def create_task():
+            return asyncio.create_task(coroutine)
+        return self.run(create_task())
+
+    def cancel(self, task: asyncio.Task):
+        self.loop.call_soon_threadsafe(task.cancel)
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class ClientSession:
+    # one player on a TileServer (or a balancer redirecting to one), self.observation holds the last reply's observation,
+    # with packed the server is asked for bit-packed observations (packing.py) and the buffer holds those bytes,
+    # with ring_slots the server is asked to write them into a shared memory ring (observation_ring.py) and
+    # self.observation is the slot of the last reply, over the socket comes nothing but the slot
+    def __init__(self, uri: str, vision_range: int, packed=False, ring_slots=0):
+        self.uri = uri
+        self.encoding = protocol.PACKED if packed else protocol.PLANES
+        if packed:
+            self.buffer = np.zeros(packed_space(4, vision_range).shape, dtype=np.uint8)
+        else:
+            self.buffer = np.zeros((4, 2 * vision_range + 1, 2 * vision_range + 1), dtype=np.int8)
+        self.observation = self.buffer
+        self.ring_slots = ring_slots
+        self.ring: Optional[ObservationRing] = None
+        self.slots: Optional[np.ndarray] = None
+        self.client: Optional[websockets.ClientConnection] = None
+        self.last_sent = time.monotonic()
+
+    async def connect(self):
+        self.client = await websockets.connect(self.uri)
+        if self.ring_slots:
+            await self.attach()
+
+    async def attach(self) -> bool:
+        # False when the server did not create a ring (it is on another host), the observations keep coming over the socket
+        await self.client.send(protocol.encode_attach(self.ring_slots, self.buffer.nbytes))
+        name = protocol.decode_attached(await self.client.recv())
+        if name is None:
+            return False
+        try:
+            self.ring = ObservationRing(self.ring_slots, self.buffer.nbytes, name)
+        except (OSError, ValueError) as e:
+            # the server has to stop writing to the ring again
+            print(f"could not attach to {name}: {e}")
+            await self.client.send(protocol.encode_attach(0, 0))
+            await self.client.recv()
+            return False
+        self.slots = self.ring.view(self.buffer.shape, self.buffer.dtype)
+        return True
+
+    async def request(self, message: bytes) -> Tuple[float, bool, bool]:
+        self.last_sent = time.monotonic()
+        await self.client.send(message)
+        reply = await self.client.recv()
+        slot = protocol.decode_short(reply, protocol.SLOT_READY) if self.ring is not None else None
+        if slot is not None:
+            _, _, reward, flags = self.ring.read(slot)
+            self.observation = self.slots[slot]
+            return reward, bool(flags & protocol.DONE), bool(flags & protocol.TRUNCATED)
+        _, _, reward, done, truncated = protocol.decode_observation(reply, self.buffer)
+        self.observation = self.buffer
+        return reward, done, truncated
+
+    async def reset(self) -> Tuple[float, bool, bool]:
+        return await self.request(protocol.encode_reset(self.encoding))
+
+    async def step(self, action: int) -> Tuple[float, bool, bool]:
+        return await self.request(protocol.encode_action(action))
+
+    async def keepalive(self, interval: float):
+        # only speaks up when the session was quiet for a whole interval
+        while True:
+            await asyncio.sleep(max(interval - (time.monotonic() - self.last_sent), 0))
+            if time.monotonic() - self.last_sent >= interval:
+                self.last_sent = time.monotonic()
+                try:
+                    await self.client.send(protocol.encode_control(protocol.KEEPALIVE))
+                except websockets.ConnectionClosed:
+                    return
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+        if self.ring is not None:
+            self.observation = self.buffer
+            self.slots = None
+            self.ring.close()
+            self.ring = None
+
+
+class ClientVecEnv(VecEnv):
+    # num_envs players on remote TileServers, every session lives on one background event loop,
+    # step_async sends all the actions at once and step_wait collects the replies that were awaited concurrently
+    # with shared_memory the observations come through shared memory rings when the servers are on this host (ClientSession)
+    def __init__(self, num_envs=4, vision_range=5, host='localhost', port=9909, max_episode_steps=300, keepalive_interval=5.0, packed_observations=False, shared_memory=False, ring_slots=4):
+        self.vision_range = vision_range
+        self.host = host
+        self.port = port
+        self.max_episode_steps = max_episode_steps
+        self.render_mode = None
+
+        self.loop_thread = LoopThread()
+        self.sessions = [ClientSession(f"ws://{host}:{port}", vision_range, packed_observations, ring_slots if shared_memory else 0) for _ in range(num_envs)]
+        self.loop_thread.gather([session.connect() for session in self.sessions]).result()
+        self.keepalive_tasks = []
+        if keepalive_interval is not None:
+            self.keepalive_tasks = [self.loop_thread.create_task(session.keepalive(keepalive_interval)) for session in self.sessions]
+
+        size = 2 * vision_range + 1
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.observations = np.zeros((num_envs, *self.sessions[0].buffer.shape), dtype=self.sessions[0].buffer.dtype)
+        self.pending: Optional[Future] = None
+
+        observation_space = packed_space(4, vision_range) if packed_observations else spaces.Box(low=-1, high=1, shape=(4, size, size), dtype=np.int8)
+        super(ClientVecEnv, self).__init__(num_envs, observation_space, spaces.Discrete(4))
+
+    def reset(self):
+        # seeds are not sent, the server decides where players spawn
+        self._reset_seeds()
+        self._reset_options()
+
+        self.loop_thread.gather([session.reset() for session in self.sessions]).result()
+        self.steps[:] = 0
+        for i, session in enumerate(self.sessions):
+            self.observations[i] = session.observation
+        return self.observations.copy()
+
+    async def step_session(self, session: ClientSession, index: int, action: int):
+        reward, done, _ = await session.step(action)
+        self.steps[index] += 1
+        truncated = not done and self.steps[index] >= self.max_episode_steps
+        info = {}
+        if done or truncated:
+            info["terminal_observation"] = session.observation.copy()
+            info["TimeLimit.truncated"] = truncated
+            await session.reset()
+            self.steps[index] = 0
+        return reward, done or truncated, info
+
+    def step_async(self, actions: np.ndarray):
+        actions = np.asarray(actions).reshape(self.num_envs)
+        self.pending = self.loop_thread.gather([self.step_session(session, i, int(actions[i])) for i, session in enumerate(self.sessions)])
+
+    def step_wait(self):
+        results = self.pending.result()
+        self.pending = None
+
+        rewards = np.array([reward for reward, _, _ in results], dtype=np.float32)
+        dones = np.array([done for _, done, _ in results], dtype=bool)
+        infos = [info for _, _, info in results]
+        for i, session in enumerate(self.sessions):
+            self.observations[i] = session.observation
+        return self.observations.copy(), rewards, dones, infos
+
+    def close(self):
+        if self.loop_thread.loop.is_closed():
+            return
+        for task in self.keepalive_tasks:
+            self.loop_thread.cancel(task)
+        self.loop_thread.gather([session.close() for session in self.sessions]).result()
+        self.loop_thread.close()
+
+    def get_images(self) -> List[Optional[np.ndarray]]:
+        return [None for _ in range(self.num_envs)]
+
+    def _indices(self, indices: VecEnvIndices) -> List[int]:
+        if indices is None:
+            return list(range(self.num_envs))
+        if isinstance(indices, int):
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        # every session shares the attributes of the vectorized env
+        return [getattr(self, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type[gymnasium.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._indices(indices)]
@@ -1,255 +1,470 @@
 import time
 import nest_asyncio
 nest_asyncio.apply()
-from copy import deepcopy
 import cv2
 import numpy as np
 import gymnasium
 from gymnasium import spaces
-from .objects import Direction, Grid, Player, Tile, Vector, Game, Directions
-import pygame
+from .objects import Direction, Grid, Player, Tile, Vector, Game, Directions, calculate_reward, reward_counters
+from . import protocol
+from .tick_scheduler import MissingActionPolicy, TickScheduler
+from .renderer import BoardRenderer, BoardSnapshot
+from .recording import EpisodeRecorder
+from .client_vec_env import ClientSession, LoopThread
+from .packing import pack_observation, packed_space
+from .observation_ring import ObservationRing
+from .profiling import Profiler, exposition, timed
 import asyncio
 import websockets
-import pickle
 import threading
 import subprocess
+import json
+import ipaddress
+from http import HTTPStatus
+from typing import Optional
+
+class ChildServer:
+    process: subprocess.Popen
+    port: int
+    clients: int = 0 # as last reported by the child's health endpoint
+    failed_checks: int = 0
+    ready: bool = False
+    idle_since: Optional[float] = None
+
+    def __init__(self, process: subprocess.Popen, port: int):
+        self.process = process
+        self.port = port
+        # times at which clients were sent here that the child may not have reported yet
+        self.reservations = []
+        self.idle_since = time.monotonic()
+
+    def occupancy(self) -> int:
+        return self.clients + len(self.reservations)
+
 
 class TileServerLoadBalancer:
-    def __init__(self, max_players_per_server=4, grid_size=40, vision_range=5, host='localhost', port=32544):
+    # hands every client an http redirect to a child TileServer so the game traffic never passes through the balancer,
+    # with proxy=True it relays the messages instead (the old behaviour, for clients that cannot follow redirects)
+    def __init__(self, max_players_per_server=4, grid_size=40, vision_range=5, host='localhost', port=32544, proxy=False, health_check_interval=1.0, max_failed_checks=3, idle_timeout=30.0, min_servers=1):
         self.host = host
         self.port = port
         self.grid_size = grid_size
         self.vision_range = vision_range
         self.max_players_per_server = max_players_per_server
         self.next_port = port + 1
-
-        self.servers: dict[subprocess.Popen, tuple[list[websockets.ClientConnection], int]] = {}
+        self.proxy = proxy
+        self.health_check_interval = health_check_interval
+        self.max_failed_checks = max_failed_checks
+        self.idle_timeout = idle_timeout
+        self.min_servers = min_servers
+        # how long a redirected client has to show up in its child's health report
+        self.connect_grace = 0.5
+
+        self.servers: dict[int, ChildServer] = {}
+        self.placement_lock = None
         self.create_new_server() # the default one server
 
     async def start_server(self):
         print(f"Starting load balancer on {self.host}:{self.port}")
-        async with websockets.serve(self.new_client, "0.0.0.0", self.port):
-            await asyncio.Future()
+        self.placement_lock = asyncio.Lock()
+        await asyncio.gather(*[self.wait_until_ready(server) for server in self.servers.values()])
+        async with websockets.serve(self.new_client, "0.0.0.0", self.port, process_request=self.process_request):
+            await self.maintain()
 
     def start(self):
         asyncio.run(self.start_server())
 
-    def get_good_server(self) -> int:
-        for server in self.servers.keys():
-            if len(self.servers[server][0]) < self.max_players_per_server:
-                return self.servers[server][1]
-            
-        # create a new server
-        self.create_new_server()
-        return self.next_port - 1
+    async def get_good_server(self) -> ChildServer:
+        # first fit so the last servers empty out and get reaped, the client is counted right away
+        async with self.placement_lock:
+            for server in self.servers.values():
+                if server.ready and server.occupancy() < self.max_players_per_server:
+                    break
+            else:
+                server = await self.wait_until_ready(self.create_new_server())
+            server.reservations.append(time.monotonic())
+            server.idle_since = None
+            return server
+
+    async def process_request(self, connection, request):
+        if request.path == "/health":
+            return connection.respond(HTTPStatus.OK, json.dumps(self.status()) + "\n")
+        if self.proxy:
+            return None
+
+        server = await self.get_good_server()
+        host = request.headers.get("Host", self.host).rsplit(":", 1)[0]
+        print(f"Redirecting client to ws://{host}:{server.port}")
+        response = connection.respond(HTTPStatus.TEMPORARY_REDIRECT, "")
+        response.headers["Location"] = f"ws://{host}:{server.port}/"
+        return response
 
     async def new_client(self, websocket, path=""):
-        good_server_port = self.get_good_server()
-        
-        print(f"Found good server on ws://{self.host}:{good_server_port}")
-        
-        for _, (clients, port) in self.servers.items():
-            if port == good_server_port:
-                clients.append(websocket)
-                break
-            
-        async with websockets.connect(f"ws://localhost:{good_server_port}") as ws:
+        # only reached with proxy=True
+        server = await self.get_good_server()
+        print(f"Found good server on ws://localhost:{server.port}")
+
+        async with websockets.connect(f"ws://localhost:{server.port}") as ws:
             async def proxy_forward():
                 async for message in websocket:
                     await ws.send(message)
             async def proxy_backward():
                 async for message in ws:
                     await websocket.send(message)
-                    
-            await asyncio.gather(proxy_forward(), proxy_backward())
 
-    def create_new_server(self):
-        server = TileServer.start_popen_process(port=self.next_port)
-        self.servers[server] = ([], self.next_port)
+            # whichever side closes first ends the relay
+            tasks = [asyncio.create_task(proxy_forward()), asyncio.create_task(proxy_backward())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def create_new_server(self) -> ChildServer:
+        process = TileServer.start_popen_process(port=self.next_port)
+        server = ChildServer(process, self.next_port)
+        self.servers[server.port] = server
         self.next_port += 1
-        print(f"Created new child server on port {self.next_port - 1}")
+        print(f"Created new child server on port {server.port}")
+        return server
+
+    async def wait_until_ready(self, server: ChildServer, timeout=30.0) -> ChildServer:
+        deadline = time.monotonic() + timeout
+        while not await self.check_health(server):
+            if server.process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"child server on port {server.port} did not come up")
+            await asyncio.sleep(0.1)
         return server
 
-    def clean_up_servers(self):
-        # if there are any empty servers close them
-        pass
+    async def check_health(self, server: ChildServer) -> bool:
+        started = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection("localhost", server.port), timeout=1.0)
+            writer.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+            response = await asyncio.wait_for(reader.read(), timeout=1.0)
+            writer.close()
+            status = json.loads(response.split(b"\r\n\r\n", 1)[1])
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            server.failed_checks += 1
+            return False
+
+        server.failed_checks = 0
+        server.ready = True
+        server.clients = status["clients"]
+        server.reservations = [reserved for reserved in server.reservations if reserved > started - self.connect_grace]
+        if server.occupancy() == 0:
+            server.idle_since = server.idle_since or time.monotonic()
+        else:
+            server.idle_since = None
+        return True
+
+    async def maintain(self):
+        while True:
+            await asyncio.gather(*[self.check_health(server) for server in self.servers.values() if server.ready])
+            await self.clean_up_servers()
+            await asyncio.sleep(self.health_check_interval)
+
+    async def clean_up_servers(self):
+        # crashed or unresponsive children are killed, empty ones are closed once they were idle for idle_timeout
+        async with self.placement_lock:
+            now = time.monotonic()
+            idle = sorted((server for server in self.servers.values() if server.idle_since is not None and now - server.idle_since > self.idle_timeout), key=lambda server: server.port, reverse=True)
+            reap = [server for server in self.servers.values() if server.process.poll() is not None or server.failed_checks >= self.max_failed_checks]
+            spare = len(self.servers) - len(reap) - self.min_servers
+            reap += [server for server in idle if server not in reap][:max(spare, 0)]
+            for server in reap:
+                print(f"Closing child server on port {server.port}")
+                del self.servers[server.port]
+                server.process.terminate()
+            await asyncio.gather(*[asyncio.to_thread(self.wait_for_exit, server.process) for server in reap])
+
+    @staticmethod
+    def wait_for_exit(process: subprocess.Popen):
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def status(self) -> dict:
+        return {"servers": [{"port": server.port, "clients": server.clients, "occupancy": server.occupancy(), "ready": server.ready} for server in self.servers.values()]}
 
     def close(self):
-        for server in self.servers.keys():
-            server.kill()
+        for server in self.servers.values():
+            server.process.kill()
+
+def is_loopback(address) -> bool:
+    # whether a websocket's remote_address is this host
+    try:
+        host = ipaddress.ip_address(address[0])
+    except (TypeError, IndexError, ValueError):
+        return False
+    if isinstance(host, ipaddress.IPv6Address) and host.ipv4_mapped is not None:
+        host = host.ipv4_mapped
+    return host.is_loopback
 
 class TileServer:
-    def __init__(self, grid_size=20, vision_range=5, host='0.0.0.0', port=9909):
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
+
+    # with record_path every spawn, kill and tick of the game is written there (recording.py), replayable with EpisodeReplayer
+    # with profile every phase of a tick is timed (profiling.py), exposed on GET /metrics and, every profile_interval
+    # seconds, printed as a summary
+    def __init__(self, grid_size=20, vision_range=5, host='0.0.0.0', port=9909, tick_deadline_ms=1000, missing_action_policy=MissingActionPolicy.REPEAT, render_mode=None, seed=None, record_path=None, keyframe_interval=100, profile=False, profile_interval=None):
+        if missing_action_policy not in MissingActionPolicy.ALL:
+            raise ValueError(f"unknown missing action policy {missing_action_policy}, expected one of {MissingActionPolicy.ALL}")
+        if render_mode is not None and render_mode not in self.metadata["render_modes"]:
+            raise ValueError(f"unknown render mode {render_mode}, expected None or one of {self.metadata['render_modes']}")
+
         self.host = host
         self.port = port
         self.grid_size = grid_size
-        self.ignore_task = None
         self.vision_range = vision_range
+        self.missing_action_policy = missing_action_policy
         self.clients: dict[websockets.ClientConnection, dict] = {
             # websocket: {
             #     "player": Player,
-            #     "moved": bool,
-            #     "should_ignore": bool,
-            #     "time_since_last_move": int,
-            #     "is_resetting": bool,
+            #     "observation": np.ndarray,
+            #     "encoding": int, # protocol.PLANES or protocol.PACKED, as asked for by the last reset
+            #     "reward": float, # earned during the ticks the client missed, paid out with its next observation
+            #     "ring": Optional[ObservationRing], # shared memory the observations are written to (protocol.ATTACH)
             # }
         }
-        self.game = Game(grid_size, grid_size)
-        self.checking_for_ignore = False
+        self.game = Game(grid_size, grid_size, seed)
+        self.recorder = EpisodeRecorder(record_path, self.game, keyframe_interval) if record_path is not None else None
+        self.profiler = Profiler() if profile else None
+        self.profile_interval = profile_interval
+        self.game.profiler = self.profiler
+        self.observations = np.empty((0, 4, 2 * vision_range + 1, 2 * vision_range + 1), dtype=np.int8)
+        # bytes of an observation as planes and packed, the only sizes a ring is created for
+        self.observation_sizes = (int(np.prod(self.observations.shape[1:])), int(np.prod(packed_space(4, vision_range).shape)))
+        self.step_id = 0
+        self.scheduler = TickScheduler(tick_deadline_ms, self.send_observations)
+        self.stop = None
         
-        self.width = 600
-        self.height = 600
-        self.grid_tile_size = min(self.width // len(self.game.grid.tiles[0]), self.height // len(self.game.grid.tiles))
-
+        # headless unless asked otherwise, the renderer only ever sees snapshots taken between ticks
+        self.render_mode = render_mode
         self.running = True
-        self.render_thread = threading.Thread(target=self.render_loop)
-        self.render_thread.start()
+        self.render_thread = None
+        self.snapshot = None
+        if self.render_mode is not None:
+            self.grid_tile_size = max(600 // grid_size, 1)
+            self.renderer = BoardRenderer(grid_size, grid_size, self.grid_tile_size)
+            self.render_lock = threading.Lock()
+            self.take_snapshot()
+        if self.render_mode == "human":
+            self.render_thread = threading.Thread(target=self.render_loop, daemon=True)
+            self.render_thread.start()
+
+    def take_snapshot(self):
+        if self.render_mode is not None:
+            with timed(self.profiler, "snapshot"):
+                self.snapshot = BoardSnapshot(self.game)
 
     def render_loop(self):
+        drawn = None
         while self.running:
-            self.render()
-            time.sleep(1/60)
+            snapshot = self.snapshot
+            if snapshot is not drawn:
+                with self.render_lock, timed(self.profiler, "render"):
+                    frame = cv2.cvtColor(self.renderer.draw(snapshot), cv2.COLOR_RGB2BGR)
+                cv2.imshow('Window Name', frame)
+                drawn = snapshot
+            cv2.waitKey(1)
+            time.sleep(1 / self.metadata["render_fps"])
 
     async def handler(self, websocket, path=""):
         print("new client connected")
-        player = self.game.spawn_random_player()
         self.clients[websocket] = {}
-        self.clients[websocket]["player"] = player
-        self.clients[websocket]["moved"] = False
-        self.clients[websocket]["is_resetting"] = False
-        self.clients[websocket]["should_ignore"] = False
+        self.clients[websocket]["player"] = self.game.spawn_random_player()
+        self.clients[websocket]["observation"] = np.empty((4, 2 * self.vision_range + 1, 2 * self.vision_range + 1), dtype=np.int8)
+        self.clients[websocket]["reward"] = 0.0
+        self.clients[websocket]["encoding"] = protocol.PLANES
+        self.clients[websocket]["ring"] = None
+        self.take_snapshot()
         try:
             async for message in websocket:
                 try:
-                    action = pickle.loads(message)
-                except pickle.UnpicklingError:
-                    print(message)
+                    opcode, action = protocol.decode_request(message)
+                except ValueError as e:
+                    print(e)
                     continue
-                await self.process_action(websocket, action)
+                await self.process_action(websocket, opcode, action)
         except websockets.ConnectionClosedError:
             pass
         finally:
-            del self.clients[websocket]
-            player.kill(self.game.grid)
-
-    async def process_action(self, websocket: websockets.ClientConnection, action):
-        if isinstance(action, str) and action == "close":
+            client = self.clients.pop(websocket)
+            self.game.kill_player(client["player"])
+            if client["ring"] is not None:
+                client["ring"].close()
+            self.take_snapshot()
+            await self.scheduler.remove_client(websocket)
+
+    async def process_action(self, websocket: websockets.ClientConnection, opcode: int, action=None):
+        if opcode == protocol.CLOSE:
             self.close()
             return
         
-        if isinstance(action, str) and action == "keepalive":
+        if opcode == protocol.KEEPALIVE:
             return
-        
-        if isinstance(action, str) and action == "reset":
-            self.clients[websocket]["player"].kill(self.game.grid)
-            self.clients[websocket]["player"] = self.game.spawn_random_player()
-            self.clients[websocket]["is_resetting"] = True
-            self.clients[websocket]["moved"] = False
-            self.clients[websocket]["should_ignore"] = False
-            await websocket.send(pickle.dumps(self.game.get_vision(self.clients[websocket]["player"], self.vision_range)))
-            # self.render()
+
+        if opcode == protocol.ATTACH:
+            # the ring is created here and only for a client on this host with the size of an observation,
+            # every other client keeps getting the observations over the socket
+            if self.clients[websocket]["ring"] is not None:
+                self.clients[websocket]["ring"].close()
+                self.clients[websocket]["ring"] = None
+            if action is not None and action[0] > 0 and is_loopback(websocket.remote_address):
+                slots, observation_size = action
+                if observation_size in self.observation_sizes:
+                    try:
+                        self.clients[websocket]["ring"] = ObservationRing(slots, observation_size)
+                    except (OSError, ValueError) as e:
+                        print(f"could not create a ring: {e}")
+            ring = self.clients[websocket]["ring"]
+            await websocket.send(protocol.encode_attached(ring.name if ring is not None else None))
             return
         
-        self.clients[websocket]["is_resetting"] = False
-        self.clients[websocket]["should_ignore"] = False
-        self.clients[websocket]["player"].move_direction = Directions[action]
-        self.clients[websocket]["moved"] = True
-
-        # print(list(self.clients[ws]["should_ignore"] for ws in self.clients))
-        # if most clients have moved place a timer that after some time if no move is done sets ignore to false to the clients that have not moved
+        if opcode == protocol.RESET:
+            with timed(self.profiler, "reset"):
+                self.game.kill_player(self.clients[websocket]["player"])
+                self.clients[websocket]["player"] = self.game.spawn_random_player()
+                self.clients[websocket]["reward"] = 0.0
+                self.clients[websocket]["encoding"] = action
+                self.scheduler.add_client(websocket)
+                observation = self.game.get_vision(self.clients[websocket]["player"], self.vision_range, out=self.clients[websocket]["observation"])
+                if action == protocol.PACKED:
+                    observation = pack_observation(observation)
+                self.take_snapshot()
+                message = self.encode_reply(websocket, protocol.RESET_DONE, observation)
+            await websocket.send(message)
+            return
         
-        async def set_should_ignore():
-            await asyncio.sleep(1)
-
-            for ws in self.clients:
-                if not self.clients[ws]["moved"]:
-                    self.clients[ws]["should_ignore"] = True
-            
-            await self.check_should_update()
-            self.checking_for_ignore = False
+        if action not in Directions:
+            print(f"invalid action {action}")
+            return
 
-        if not self.checking_for_ignore:
-            self.checking_for_ignore = True
-            self.ignore_task = asyncio.create_task(set_should_ignore())
-        else:
-            await self.check_should_update()
-
-    async def check_should_update(self):
-        if all(self.clients[ws]["moved"] or self.clients[ws]["should_ignore"] for ws in self.clients):
-            if self.ignore_task:
-                self.ignore_task.cancel()
-                self.ignore_task = None
-            for ws in self.clients:
-                self.clients[ws]["moved"] = False
-            await self.send_observations()
-
-    async def send_observations(self):
-        before_update = {ws: deepcopy(self.clients[ws]["player"]) for ws in self.clients.keys()}
-
-        self.game.update()
-        # self.render()
-
-        def calculate_reward(before_update_player: Player, player: Player):
-            if not player.is_alive:
-                return -1
-            reward = (player.claim_count - before_update_player.claim_count) * 0.9 + (player.kills - before_update_player.kills) * 5
-            return min(5, max(-5, reward)) # clip between 5 and -5
-
-        data = {ws: (
-            self.game.get_vision(self.clients[ws]["player"], self.vision_range),
-            calculate_reward(before_update[ws], self.clients[ws]["player"]),
-            not self.clients[ws]["player"].is_alive,
-            False, # truncated
-            {},
-        ) for ws in self.clients.keys()}
-        pickled_data = {
-            ws: pickle.dumps(data[ws])
-        for ws in self.clients.keys()}
-        await asyncio.wait([ws.send(pickled_data[ws]) for ws in self.clients.keys() if not self.clients[ws]["is_resetting"] and not self.clients[ws]["should_ignore"]])
+        self.clients[websocket]["player"].move_direction = Directions[action]
+        await self.scheduler.submit(websocket)
+
+    async def send_observations(self, acted: set, stragglers: set):
+        # called by the scheduler once per tick, only the clients that acted are waiting for an observation
+        with timed(self.profiler, "tick"):
+            await self.run_tick(acted, stragglers)
+
+    async def run_tick(self, acted: set, stragglers: set):
+        dropped = []
+        if self.missing_action_policy == MissingActionPolicy.NOOP:
+            for ws in stragglers:
+                self.clients[ws]["player"].move_direction = None
+        elif self.missing_action_policy == MissingActionPolicy.DROP and len(stragglers) > 0:
+            for ws in stragglers:
+                self.scheduler.discard(ws)
+                self.game.kill_player(self.clients[ws]["player"])
+            self.scheduler.metrics.dropped += len(stragglers)
+            dropped, stragglers = list(stragglers), set()
+
+        before_update = {ws: reward_counters(client["player"]) for ws, client in self.clients.items()}
+
+        with timed(self.profiler, "update"):
+            self.game.update()
+        self.step_id += 1
+        self.take_snapshot()
+
+        # stragglers keep what they earn (dying included, once) until they are back
+        for ws in stragglers:
+            if before_update[ws][0]:
+                self.clients[ws]["reward"] += calculate_reward(before_update[ws], self.clients[ws]["player"])
+
+        # one batch for every client instead of a pass over the board per client
+        websockets_in_tick = list(acted)
+        if self.observations.shape[0] < len(websockets_in_tick):
+            self.observations = np.empty((len(websockets_in_tick), *self.observations.shape[1:]), dtype=np.int8)
+        with timed(self.profiler, "observe"):
+            observations = self.game.get_all_visions(self.vision_range, [self.clients[ws]["player"] for ws in websockets_in_tick], out=self.observations[:len(websockets_in_tick)])
+
+        with timed(self.profiler, "encode"):
+            # the clients that asked for packed observations are packed together as well
+            packed_indices = [i for i, ws in enumerate(websockets_in_tick) if self.clients[ws]["encoding"] == protocol.PACKED]
+            packed = dict(zip(packed_indices, pack_observation(observations[packed_indices]))) if packed_indices else {}
+
+            data = []
+            for i, ws in enumerate(websockets_in_tick):
+                reward = self.clients[ws]["reward"] + calculate_reward(before_update[ws], self.clients[ws]["player"])
+                self.clients[ws]["reward"] = 0.0
+                data.append(self.encode_reply(
+                    ws,
+                    protocol.STEP,
+                    packed[i] if i in packed else observations[i],
+                    reward,
+                    not self.clients[ws]["player"].is_alive,
+                ))
+        with timed(self.profiler, "send"):
+            await asyncio.gather(
+                *[ws.send(message) for ws, message in zip(websockets_in_tick, data)],
+                *[ws.close() for ws in dropped],
+            )
+
+    def encode_reply(self, websocket: websockets.ClientConnection, message_type: int, observation: np.ndarray, reward: float = 0.0, done: bool = False) -> bytes:
+        # the whole observation message, or for a client with a ring the observation goes into its next slot
+        # and the message is only the slot
+        ring = self.clients[websocket]["ring"]
+        if ring is not None and observation.nbytes == ring.observation_size:
+            slot = ring.write(message_type, self.step_id, observation, reward, protocol.encode_flags(done, False))
+            return protocol.encode_short(protocol.SLOT_READY, slot)
+        return protocol.encode_observation(message_type, self.step_id, observation, reward, done, False)
+
+    async def process_request(self, connection, request):
+        # plain http GET /health answers with the metrics, used by TileServerLoadBalancer,
+        # GET /metrics with the same and the phase timings in the prometheus text format
+        if request.path == "/health":
+            return connection.respond(HTTPStatus.OK, json.dumps(self.metrics()) + "\n")
+        if request.path == "/metrics":
+            return connection.respond(HTTPStatus.OK, exposition(self.metrics(), self.profiler))
+        return None
+
+    def metrics(self) -> dict:
+        return {"clients": len(self.clients), "players": len(self.game.players), **self.scheduler.metrics.summary()}
 
     async def start_server(self):
         print(f"Starting server at {self.host}:{self.port}")
-        async with websockets.serve(self.handler, self.host, self.port):
-            await asyncio.Future()  # run forever
+        self.stop = asyncio.get_running_loop().create_future()
+        report_task = asyncio.create_task(self.report_profile()) if self.profiler is not None and self.profile_interval else None
+        try:
+            async with websockets.serve(self.handler, self.host, self.port, process_request=self.process_request):
+                await self.stop  # run until closed
+        finally:
+            if report_task is not None:
+                report_task.cancel()
+
+    async def report_profile(self):
+        while True:
+            await asyncio.sleep(self.profile_interval)
+            print(self.profiler.report(), flush=True)
 
     def start(self):
         asyncio.run(self.start_server())
 
     def close(self):
-        if self.loop is not None:
-            self.loop.stop()
-            self.running = False
+        self.running = False
+        self.scheduler.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.stop is not None and not self.stop.done():
+            self.stop.set_result(None)
+        if self.render_thread is not None and self.render_thread is not threading.current_thread():
             self.render_thread.join()
-            self.ignore_task.cancel()
             
     def render(self):
-        cv2.imshow('Window Name', self._render_frame())
-        cv2.waitKey(1)
-
-    def _render_frame(self):
-        canvas = pygame.Surface((self.width, self.height))
-        canvas.fill((0, 0, 0))
-        for y, row in enumerate(self.game.grid.tiles):
-            for x, tile in enumerate(row):
-                pygame.draw.rect(canvas, (0, 0, 0), (x * self.grid_tile_size, y * self.grid_tile_size, self.grid_tile_size, self.grid_tile_size))
-                if tile.claimed:
-                    pygame.draw.rect(canvas, tile.claimer.color, (x * self.grid_tile_size, y * self.grid_tile_size, self.grid_tile_size, self.grid_tile_size))
-                else:
-                    pygame.draw.rect(canvas, (20, 20, 20), (x * self.grid_tile_size, y * self.grid_tile_size, self.grid_tile_size, self.grid_tile_size), 1)
-                if tile.ocupied:
-                    margin = self.grid_tile_size // 5
-                    pygame.draw.rect(canvas, (max(tile.ocupant.color.r - 40, 0), max(tile.ocupant.color.g - 40, 0), max(tile.ocupant.color.b - 40, 0)), (x * self.grid_tile_size + margin, y * self.grid_tile_size + margin, self.grid_tile_size - 2 * margin, self.grid_tile_size - 2 * margin))
-        for player in self.game.players:
-            margin = self.grid_tile_size // 5
-            pygame.draw.rect(canvas, (255, 0, 0), (player.position.x * self.grid_tile_size + margin, player.position.y * self.grid_tile_size + margin, self.grid_tile_size - 2 * margin, self.grid_tile_size - 2 * margin))
-        self.surf = pygame.transform.flip(canvas, False, True)
-        return np.transpose(
-            np.array(pygame.surfarray.pixels3d(canvas)), axes=(1, 0, 2)
-        )
+        # rgb frame of the last snapshot, the human window is kept up to date by the render thread
+        if self.render_mode is None:
+            return None
+        with self.render_lock:
+            return self.renderer.draw(self.snapshot).copy()
 
     @staticmethod
-    def create_server(grid_size=40, vision_range=5, host='0.0.0.0', port=9909):
-        server = TileServer(grid_size, vision_range, host, port)
+    def create_server(grid_size=40, vision_range=5, host='0.0.0.0', port=9909, tick_deadline_ms=1000, missing_action_policy=MissingActionPolicy.REPEAT, render_mode=None):
+        server = TileServer(grid_size, vision_range, host, port, tick_deadline_ms, missing_action_policy, render_mode)
         server.start()
         return server
 
@@ -277,13 +492,18 @@ class ClientPlayerEnv(gymnasium.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 4}
 
 
-    def __init__(self, vision_range=5, host='localhost', port=9909, render_mode="rgb_array"):
+    # with packed_observations the server sends the planes bit-packed (packing.py) and they are handed out that way,
+    # with shared_memory a server on the same host writes them into shared memory instead (observation_ring.py),
+    # reuse_obs_buffer then hands out the slot itself, which stays as it is for ring_slots - 1 more steps
+    def __init__(self, vision_range=5, host='localhost', port=9909, render_mode="rgb_array", reuse_obs_buffer=False, packed_observations=False, shared_memory=False, ring_slots=4):
         super(ClientPlayerEnv, self).__init__()
         
         self.vision_range = vision_range
         self.host = host
         self.port = port
         self.render_mode = render_mode
+        # when set the same observation array is returned and overwritten every step, only safe if the caller copies it
+        self.reuse_obs_buffer = reuse_obs_buffer
         
         self.action_space = spaces.Discrete(4)
         self.observation_space = spaces.Box(
@@ -292,46 +512,41 @@ class ClientPlayerEnv(gymnasium.Env):
             shape=(4, (self.vision_range*2 + 1), (self.vision_range*2 + 1)),
             dtype=np.int8
         )
-        
-        self.loop = asyncio.new_event_loop()
-        self.loop.run_until_complete(self.connect_to_server())
+        if packed_observations:
+            self.observation_space = packed_space(4, self.vision_range)
+        # the connection is served by an event loop in a background thread, so the keepalive runs between steps too
+        self.loop_thread = LoopThread()
+        self.session = ClientSession(f"ws://{self.host}:{self.port}", self.vision_range, packed_observations, ring_slots if shared_memory else 0)
+        self.keepalive_task = None
+        self.loop_thread.run(self.session.connect())
 
         # self.start_keepalive()
     
-    def start_keepalive(self):
-        self.running = True
-
-        async def keepalive():
-            while self.running:
-                await asyncio.sleep(5)
-                try:
-                    await self.client.send(pickle.dumps("keepalive"))
-                except:
-                    return
-
-        self.keep_alive_thread = threading.Thread(target=lambda: asyncio.run(keepalive()))
-        self.keep_alive_thread.start()
-    
-    async def connect_to_server(self):
-        self.client = await websockets.connect(f"ws://{self.host}:{self.port}")
+    def start_keepalive(self, interval=5.0):
+        if self.keepalive_task is None:
+            self.keepalive_task = self.loop_thread.create_task(self.session.keepalive(interval))
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed, options=options)
         
-        # self.loop.run_until_complete(self.client.close())
-        # self.loop.run_until_complete(self.connect_to_server())
-        
-        self.loop.run_until_complete(self.client.send(pickle.dumps("reset")))
-        return pickle.loads(self.loop.run_until_complete(self.client.recv())), {}
+        self.loop_thread.run(self.session.reset())
+        return self._get_obs(), {}
         
     def step(self, action):
-        self.loop.run_until_complete(self.client.send(pickle.dumps(action)))
-        return pickle.loads(self.loop.run_until_complete(self.client.recv()))
+        reward, done, truncated = self.loop_thread.run(self.session.step(int(action)))
+        return self._get_obs(), reward, done, truncated, {}
+
+    def _get_obs(self):
+        return self.session.observation if self.reuse_obs_buffer else self.session.observation.copy()
     
     def close(self):
-        self.loop.run_until_complete(self.client.close())
-        self.running = False
-        self.keep_alive_thread.join()
+        if self.loop_thread.loop.is_closed():
+            return
+        if self.keepalive_task is not None:
+            self.loop_thread.cancel(self.keepalive_task)
+            self.keepalive_task = None
+        self.loop_thread.run(self.session.close())
+        self.loop_thread.close()
     
 from gymnasium.envs.registration import register
 
@@ -339,4 +554,10 @@ register(
     id='tileman-multi-v0',
     entry_point='games.tileman.envs.multi_agent_env:ClientPlayerEnv',
     max_episode_steps=300,
+)
+register(
+    id='tileman-multi-vec-v0',
+    entry_point='games.tileman.envs.multi_agent_env:ClientPlayerEnv',
+    vector_entry_point='games.tileman.envs.client_vec_env:ClientVecEnv',
+    max_episode_steps=300,
 )
\ No newline at end of file
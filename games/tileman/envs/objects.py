@@ -1,19 +1,40 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import pygame
 import uuid
-from copy import deepcopy
-import time
 import random
 import numpy as np
 
+# marks a cell in the grid state planes that is not claimed / not occupied by anyone
+NO_PLAYER = -1
+# up to this many cells a loop over them is cheaper than numpy fancy indexing, which most spawns, trails and
+# deaths on small boards are
+FEW_CELLS = 16
+
+
+def fill_cells(plane: np.ndarray, cells, value: int):
+    # plane[cells] = value for a flat plane and a list or set of cells
+    if len(cells) <= FEW_CELLS:
+        for cell in cells:
+            plane[cell] = value
+    elif isinstance(cells, list):
+        plane[cells] = value
+    else:
+        plane[np.fromiter(cells, dtype=np.intp, count=len(cells))] = value
+
+
 class Vector:
     x: int
     y: int
-    
+
     def __init__(self, x: int, y: int):
         self.x = x
         self.y = y
 
+    def __eq__(self, other):
+        if not isinstance(other, Vector):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y
+
 
 class Direction:
     UP = Vector(0, -1)
@@ -25,275 +46,663 @@ Directions = {
     0: Direction.UP,
     1: Direction.DOWN,
     2: Direction.LEFT,
-    3: Direction.RIGHT 
+    3: Direction.RIGHT
 }
+# (x, y) step of every direction back to the shared Direction vector, and to its action
+DIRECTION_STEPS = {(direction.x, direction.y): direction for direction in Directions.values()}
+DIRECTION_ACTIONS = {(direction.x, direction.y): action for action, direction in Directions.items()}
 
 class Player:
     position: Vector
     color: pygame.Color
-    move_direction: Direction = Direction.DOWN
+    move_direction: Optional[Direction] = Direction.DOWN # None stands still for the tick
     is_alive: bool = True
     id: uuid.UUID
-    
+    # slot of the player in the grid state planes, assigned by Game.add_player
+    index: int = NO_PLAYER
+
     # specific neural network stuff
     kills: int = 0
     claim_count: int = 0
     max_claim_count: int = 0
     steps_survived: int = 0
     moves_since_capture: int = 0
-    
+
     def __init__(self, x: int, y: int):
         self.position = Vector(x, y)
         self.color = pygame.Color(255, 255, 255)
 
         self.id = uuid.uuid4()
 
+        # cells are flat grid indices (y * width + x), the trail is kept in the order it was walked
+        self.trail = []
+        self.territory = set()
+        # (min_x, min_y, max_x, max_y) of every cell claimed since spawning, may be larger than the current territory
+        self.bounds = None
+
     def kill(self, grid: "Grid"):
-        for row in grid.tiles:
-            for tile in row:
-                if tile.ocupant == self:
-                    tile.unoccupy()
-                if tile.claimer == self:
-                    tile.unclaim()
-                    
+        if not self.is_alive:
+            return
+
+        if self.index != NO_PLAYER:
+            grid.remove_occupant(self)
+            grid.clear_cells(self.index, self.trail, self.territory)
+
+        self.trail = []
+        self.territory = set()
         self.is_alive = False
 
-    def get_vision(self, grid: "Grid", vision_range: int = 20):
-        left = self.position.x - vision_range
-        right = self.position.x + vision_range
-        top = self.position.y - vision_range
-        bottom = self.position.y + vision_range
-        
-        vision = []
-        
-        for i in range(top, bottom + 1):
-            for j in range(left, right + 1):
-                if (i < 0 or i >= grid.height) or (j < 0 or j >= grid.width):
-                    vision.append((Tile(0, 0), True))
-                    continue
-                vision.append((deepcopy(grid.tiles[i][j]), False))
-
-        ocupations = []
-        claims = []
-        borders = []
-        
-        for i in range((vision_range*2 + 1)**2):
-            tile = vision[i][0]
-            if tile.claimed:
-                if tile.claimer.id == self.id:
-                    claims.append(-1)
-                else:
-                    claims.append(1)
-            else:
-                claims.append(0)
-            
-            if tile.ocupied:
-                if tile.ocupant.id == self.id:
-                    ocupations.append(-1)
-                else:
-                    ocupations.append(1)
-            else:
-                ocupations.append(0)
+    def get_vision(self, grid: "Grid", vision_range: int = 20, out: Optional[np.ndarray] = None) -> np.ndarray:
+        size = 2 * vision_range + 1
+        if out is None:
+            out = np.empty((3, size, size), dtype=np.int8)
+
+        # the padded board is shifted by vision_range so the window starts at the player position
+        board = grid.padded(vision_range)
+        window = (slice(self.position.y, self.position.y + size), slice(self.position.x, self.position.x + size))
+        board.write_ownership(board.claims[window], self.index, out[0])
+        board.write_ownership(board.trails[window], self.index, out[1])
+        np.copyto(out[2], board.borders[window])
+        return out
+
+
+class PaddedBoard:
+    # copy of the grid state planes padded by vision_range on every side, so every vision window is a plain slice
+    vision_range: int
+    version: int
+    # claims, trails, borders and locations stacked so all of them can be gathered at once
+    planes: np.ndarray
+    # (4, height, width, 2r+1, 2r+1) view of planes, windows[:, y, x] is the vision window of a player at (x, y)
+    windows: np.ndarray
+    claims: np.ndarray
+    trails: np.ndarray
+    borders: np.ndarray
+    # number of registered players standing on each cell
+    locations: np.ndarray
+
+    def __init__(self, width: int, height: int, vision_range: int):
+        self.vision_range = vision_range
+        self.version = -1
+        size = 2 * vision_range + 1
+        self.planes = np.zeros((4, height + 2 * vision_range, width + 2 * vision_range), dtype=np.int16)
+        self.claims, self.trails, self.borders, self.locations = self.planes
+        self.claims.fill(NO_PLAYER)
+        self.trails.fill(NO_PLAYER)
+        self.borders.fill(1)
+        self.borders[vision_range:vision_range + height, vision_range:vision_range + width] = 0
+        self.windows = np.lib.stride_tricks.sliding_window_view(self.planes, (size, size), axis=(1, 2))
+        self._mask = np.empty((size, size), dtype=bool)
+
+    def refresh(self, grid: "Grid"):
+        inner = (slice(self.vision_range, self.vision_range + grid.height), slice(self.vision_range, self.vision_range + grid.width))
+        np.copyto(self.claims[inner], grid.claims)
+        np.copyto(self.trails[inner], grid.trails)
+        self.locations.fill(0)
+        players = [player for player in grid.players if player is not None]
+        xs = np.fromiter((player.position.x for player in players), dtype=np.intp, count=len(players))
+        ys = np.fromiter((player.position.y for player in players), dtype=np.intp, count=len(players))
+        np.add.at(self.locations, (ys + self.vision_range, xs + self.vision_range), 1)
+        self.version = grid.version
 
-            borders.append(1 if vision[i][1] else 0)
-        
-        result = np.array([claims, ocupations, borders]).astype(np.int8)
-        result = result.reshape(3, 2 * vision_range + 1, 2 * vision_range + 1)
-        return result
+    def write_ownership(self, window: np.ndarray, index: int, out: np.ndarray):
+        # -1 for cells belonging to the player, 1 for cells of anyone else and 0 for empty cells
+        np.not_equal(window, NO_PLAYER, out=out)
+        np.equal(window, index, out=self._mask)
+        np.putmask(out, self._mask, -1)
 
 
 class Tile:
+    # read-only view of a single cell of the grid state planes, kept around for rendering
     position: Vector
-    ocupied: bool
-    ocupant: Player
-    claimed: bool
-    claimer: Player
-    
-    def __init__(self, x: int, y: int):
+
+    def __init__(self, grid: "Grid", x: int, y: int):
+        self.grid = grid
         self.position = Vector(x, y)
-        self.ocupied = False
-        self.claimed = False
-        self.ocupant = None
-        self.claimer = None
-
-    def unclaim(self):
-        self.claimed = False
-        self.claimer = None
-        
-    def claim(self, player: Player):
-        self.claimed = True
-        self.claimer = player
-        
-    def unoccupy(self):
-        self.ocupied = False
-        self.ocupant = None
-        
-    def occupy(self, player: Player):
-        self.ocupied = True
-        self.ocupant = player
+
+    @property
+    def ocupied(self) -> bool:
+        return self.grid.trails[self.position.y, self.position.x] != NO_PLAYER
+
+    @property
+    def ocupant(self) -> Optional[Player]:
+        return self.grid.get_player(self.grid.trails[self.position.y, self.position.x])
+
+    @property
+    def claimed(self) -> bool:
+        return self.grid.claims[self.position.y, self.position.x] != NO_PLAYER
+
+    @property
+    def claimer(self) -> Optional[Player]:
+        return self.grid.get_player(self.grid.claims[self.position.y, self.position.x])
 
 
 class Grid:
-    tiles: List[List[Tile]]
     width: int
     height: int
+    # (height, width) planes holding the index of the claiming / trail leaving player or NO_PLAYER
+    claims: np.ndarray
+    trails: np.ndarray
+    # player slots, a player's index points into this list
+    players: List[Optional[Player]]
 
     def __init__(self, width: int, height: int):
-        self.tiles = [[Tile(x, y) for x in range(width)] for y in range(height)]
         self.width = width
         self.height = height
-    
+        self.claims = np.full((height, width), NO_PLAYER, dtype=np.int16)
+        self.trails = np.full((height, width), NO_PLAYER, dtype=np.int16)
+        # flat views of the planes, indexed by the cells in Player.trail / Player.territory
+        self.flat_claims = self.claims.reshape(-1)
+        self.flat_trails = self.trails.reshape(-1)
+        self.players = []
+        # flat cell -> the live players standing on it, kept up to date as players spawn, move and die
+        self.occupants: Dict[int, List[Player]] = {}
+        # bumped whenever the planes or player positions change so the padded boards know when to refresh
+        self.version = 0
+        self._padded = {}
+        self._tiles = None
+
+    @property
+    def tiles(self) -> List[List[Tile]]:
+        if self._tiles is None:
+            self._tiles = [[Tile(self, x, y) for x in range(self.width)] for y in range(self.height)]
+        return self._tiles
+
+    def padded(self, vision_range: int) -> PaddedBoard:
+        board = self._padded.get(vision_range)
+        if board is None:
+            board = self._padded[vision_range] = PaddedBoard(self.width, self.height, vision_range)
+        if board.version != self.version:
+            board.refresh(self)
+        return board
+
     def get_tile(self, x: int, y: int) -> Tile:
         return self.tiles[y][x]
-    
+
     def get_tile_at(self, position: Vector) -> Tile:
         return self.tiles[position.y][position.x]
-    
+
+    def get_player(self, index: int) -> Optional[Player]:
+        if index == NO_PLAYER:
+            return None
+        return self.players[index]
+
+    def in_bounds(self, position: Vector) -> bool:
+        return 0 <= position.x < self.width and 0 <= position.y < self.height
+
+    def set_claims(self, cells: List[int], player: Player) -> Dict[int, int]:
+        # hands the cells to player and keeps the territories of every player involved in sync,
+        # returns how many of the cells were taken from each previous owner (NO_PLAYER for free cells)
+        taken = {}
+        lost = {}
+        owners = [self.flat_claims.item(cell) for cell in cells] if len(cells) <= FEW_CELLS else self.flat_claims[cells].tolist()
+        for cell, owner in zip(cells, owners):
+            if owner == player.index:
+                continue
+            taken[owner] = taken.get(owner, 0) + 1
+            if owner != NO_PLAYER:
+                lost.setdefault(owner, []).append(cell)
+        for owner, owner_cells in lost.items():
+            self.players[owner].territory.difference_update(owner_cells)
+
+        fill_cells(self.flat_claims, cells, player.index)
+        player.territory.update(cells)
+        self.extend_bounds(player, cells)
+        return taken
+
+    def extend_bounds(self, player: Player, cells: List[int]):
+        # the row grows with the cell index, so only the columns need a pass over every cell
+        xs = [cell % self.width for cell in cells]
+        bounds = (min(xs), min(cells) // self.width, max(xs), max(cells) // self.width)
+        if player.bounds is not None:
+            bounds = (min(bounds[0], player.bounds[0]), min(bounds[1], player.bounds[1]), max(bounds[2], player.bounds[2]), max(bounds[3], player.bounds[3]))
+        player.bounds = bounds
+
+    def clear_cells(self, index: int, trail: List[int], territory: set):
+        # empties the trail and territory of a dead player,
+        # only touching the cells the player owns instead of scanning the whole board
+        fill_cells(self.flat_trails, trail, NO_PLAYER)
+        fill_cells(self.flat_claims, territory, NO_PLAYER)
+        self.version += 1
+
+    def register_player(self, player: Player):
+        # reuse the first free slot so the indices stay small
+        for index, slot in enumerate(self.players):
+            if slot is None:
+                self.players[index] = player
+                player.index = index
+                return
+        player.index = len(self.players)
+        self.players.append(player)
+
+    def add_occupant(self, player: Player):
+        self.occupants.setdefault(player.position.y * self.width + player.position.x, []).append(player)
+
+    def remove_occupant(self, player: Player):
+        cell = player.position.y * self.width + player.position.x
+        occupants = self.occupants.get(cell)
+        if occupants is not None and player in occupants:
+            occupants.remove(player)
+            if not occupants:
+                del self.occupants[cell]
+
+    def move_occupant(self, player: Player, position: Vector):
+        cell = player.position.y * self.width + player.position.x
+        occupants = self.occupants.get(cell)
+        if occupants is None or len(occupants) != 1 or occupants[0] is not player:
+            self.remove_occupant(player)
+            player.position = position
+            self.add_occupant(player)
+            return
+        # alone on its cell (nearly always), its list moves along with it
+        del self.occupants[cell]
+        player.position = position
+        cell = position.y * self.width + position.x
+        others = self.occupants.get(cell)
+        if others is None:
+            self.occupants[cell] = occupants
+        else:
+            others.append(player)
+
+    def get_occupants(self, x: int, y: int) -> List[Player]:
+        return self.occupants.get(y * self.width + x, [])
+
+    def rebuild_occupants(self, players: List[Player]):
+        self.occupants = {}
+        for player in players:
+            if player.is_alive:
+                self.add_occupant(player)
+
+    def release_player(self, player: Player):
+        if player.index != NO_PLAYER and self.players[player.index] is player:
+            self.players[player.index] = None
+
+
+class GameSnapshot:
+    # everything Game.update reads or writes: copies of the planes, one tuple of scalars per player (SNAPSHOT_FIELDS)
+    # and copies of the trails and territories, the players themselves are kept by reference so a restore brings
+    # the same Player objects back to where they were
+    claims: np.ndarray
+    trails: np.ndarray
+    # Game.players in order (the first `playing`), then any player only the grid slots still hold,
+    # slots are indices into players (-1 for a free slot)
+    players: List[Player]
+    playing: int
+    slots: List[int]
+    scalars: List[tuple]
+    walked: List[List[int]]
+    territories: List[set]
+
+    def __init__(self, claims: np.ndarray, trails: np.ndarray, players: List[Player], playing: int, slots: List[int], scalars: List[tuple], walked: List[List[int]], territories: List[set]):
+        self.claims = claims
+        self.trails = trails
+        self.players = players
+        self.playing = playing
+        self.slots = slots
+        self.scalars = scalars
+        self.walked = walked
+        self.territories = territories
+
+
+# fields of a GameSnapshot.scalars tuple, a (0, 0) step is a player standing still and a bounds of -1 is no bounds yet
+SNAPSHOT_FIELDS = ["x", "y", "step_x", "step_y", "is_alive", "index", "kills", "claim_count", "max_claim_count", "steps_survived", "moves_since_capture",
+                   "min_x", "min_y", "max_x", "max_y", "r", "g", "b", "a"]
+
+
+def player_scalars(player: Player) -> tuple:
+    # the SNAPSHOT_FIELDS of a player
+    return (
+        player.position.x, player.position.y,
+        *((player.move_direction.x, player.move_direction.y) if player.move_direction is not None else (0, 0)),
+        player.is_alive, player.index, player.kills, player.claim_count, player.max_claim_count, player.steps_survived, player.moves_since_capture,
+        *(player.bounds if player.bounds is not None else (-1, -1, -1, -1)),
+        *player.color,
+    )
+
+
+def set_player_scalars(player: Player, row: tuple):
+    x, y, step_x, step_y, is_alive, index, kills, claim_count, max_claim_count, steps_survived, moves_since_capture, min_x, min_y, max_x, max_y, r, g, b, a = row
+    player.position = Vector(x, y)
+    player.move_direction = DIRECTION_STEPS[(step_x, step_y)] if step_x or step_y else None
+    player.is_alive = bool(is_alive)
+    player.index = index
+    player.kills = kills
+    player.claim_count = claim_count
+    player.max_claim_count = max_claim_count
+    player.steps_survived = steps_survived
+    player.moves_since_capture = moves_since_capture
+    player.bounds = (min_x, min_y, max_x, max_y) if min_x >= 0 else None
+    player.color = pygame.Color(r, g, b, a)
+
 
 class Game:
     grid: Grid
     players: List[Player]
     width: int
     height: int
-  
-    def __init__(self, width: int, height: int):
+    # every random choice of the game comes from here, the same seed and calls give the same game
+    random: random.Random
+    seed: Optional[int]
+    # an EpisodeRecorder (recording.py) told about every spawn, kill and update
+    recorder = None
+    # a profiling.Profiler timing the phases of every update, without one update does no timing at all
+    profiler = None
+
+    def __init__(self, width: int, height: int, seed: Optional[int] = None):
         self.grid = Grid(width, height)
         self.players = []
         self.width = width
         self.height = height
+        self.seed = seed
+        self.random = random.Random(seed)
 
-    def get_vision(self, player: Player, vision_range: int = 20):
-        player_vision = player.get_vision(self.grid, vision_range)
-        player_locations = np.zeros((1, 2 * vision_range + 1, 2 * vision_range + 1), dtype=np.int8)
+    def get_vision(self, player: Player, vision_range: int = 20, out: Optional[np.ndarray] = None) -> np.ndarray:
+        size = 2 * vision_range + 1
+        if out is None:
+            out = np.empty((4, size, size), dtype=np.int8)
+        player.get_vision(self.grid, vision_range, out=out[:3])
 
-        for other_player in self.players:
-            if other_player == player:
-                continue
-            # check if player is outside of the vision range
-            left = player.position.x - vision_range
-            right = player.position.x + vision_range
-            top = player.position.y - vision_range
-            bottom = player.position.y + vision_range
-            
-            if other_player.position.x < left or other_player.position.x > right or other_player.position.y < top or other_player.position.y > bottom:
-                continue
-            
-            player_locations[0][other_player.position.y - top, other_player.position.x - left] = -1
+        # every other player inside the window is marked with -1
+        board = self.grid.padded(vision_range)
+        window = board.locations[player.position.y:player.position.y + size, player.position.x:player.position.x + size]
+        np.not_equal(window, 0, out=out[3])
+        np.negative(out[3], out=out[3])
+        if self.grid.get_player(player.index) is player and window[vision_range, vision_range] == 1:
+            # the only player on the center tile is the player itself
+            out[3, vision_range, vision_range] = 0
+
+        return out
 
-        return np.concatenate((player_vision, player_locations))
+    def get_all_visions(self, vision_range: int = 20, players: Optional[List[Player]] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+        # same observations as get_vision for every player at once, row i belongs to players[i]
+        players = self.players if players is None else players
+        size = 2 * vision_range + 1
+        if out is None:
+            out = np.empty((len(players), 4, size, size), dtype=np.int8)
+
+        board = self.grid.padded(vision_range)
+        xs = np.fromiter((player.position.x for player in players), dtype=np.intp, count=len(players))
+        ys = np.fromiter((player.position.y for player in players), dtype=np.intp, count=len(players))
+        indices = np.fromiter((player.index for player in players), dtype=np.int16, count=len(players))[:, None, None]
+        claims, trails, borders, locations = board.windows[:, ys, xs]
+
+        np.not_equal(claims, NO_PLAYER, out=out[:, 0])
+        np.putmask(out[:, 0], claims == indices, -1)
+        np.not_equal(trails, NO_PLAYER, out=out[:, 1])
+        np.putmask(out[:, 1], trails == indices, -1)
+        np.copyto(out[:, 2], borders)
+        np.not_equal(locations, 0, out=out[:, 3])
+        np.negative(out[:, 3], out=out[:, 3])
+
+        # players that are still on the board are counted on their own center tile
+        registered = np.fromiter((self.grid.get_player(player.index) is player for player in players), dtype=np.int16, count=len(players))
+        out[:, 3, vision_range, vision_range] = np.where(locations[:, vision_range, vision_range] > registered, -1, 0)
+
+        return out
 
     def add_player(self, player: Player):
         self.players.append(player)
+        self.grid.register_player(player)
         # if player is on the border we move him inside by a square
-        if player.position.x == 0:
-            player.position.x += 1
-        if player.position.x == len(self.grid.tiles[0]) - 1:
-            player.position.x -= 1
-        if player.position.y == 0:
-            player.position.y += 1
-        if player.position.y == len(self.grid.tiles) - 1:
-            player.position.y -= 1
-      
+        player.position.x = min(max(player.position.x, 1), self.width - 2)
+        player.position.y = min(max(player.position.y, 1), self.height - 2)
+        self.grid.add_occupant(player)
+
         # mark the 8 tiles around the player as claimed
-        for y in range(-1, 2):
-            for x in range(-1, 2):
-                tile = self.grid.get_tile_at(Vector(player.position.x + x, player.position.y + y))
-                tile.claim(player)
+        self.grid.set_claims([y * self.width + x for y in range(player.position.y - 1, player.position.y + 2) for x in range(player.position.x - 1, player.position.x + 2)], player)
+        self.grid.version += 1
+        if self.recorder is not None:
+            self.recorder.record_spawn(self, player)
+
+    def kill_player(self, player: Player):
+        # kills from outside update (disconnects, resets), the ones update does itself follow from the moves
+        if self.recorder is not None and player.is_alive:
+            self.recorder.record_kill(self, player)
+        player.kill(self.grid)
+
+    def snapshot(self) -> GameSnapshot:
+        # a copy of the two planes and a few scalars per player, far cheaper than deepcopy on the object graph,
+        # which also breaks the game: the copied flat_claims / flat_trails no longer share memory with the planes
+        players = list(self.players)
+        known = {id(player) for player in players}
+        players.extend(player for player in self.grid.players if player is not None and id(player) not in known)
+        rows = {id(player): row for row, player in enumerate(players)}
+        # plain tuples, turning them into an array would cost more than building them
+        scalars = [player_scalars(player) for player in players]
+        return GameSnapshot(
+            self.grid.claims.copy(),
+            self.grid.trails.copy(),
+            players,
+            len(self.players),
+            [rows[id(player)] if player is not None else -1 for player in self.grid.players],
+            scalars,
+            [list(player.trail) for player in players],
+            [player.territory.copy() for player in players],
+        )
+
+    def restore(self, snapshot: GameSnapshot):
+        # writes into the existing planes so the flat views and anything else holding them stay valid,
+        # the snapshot itself is left untouched and can be restored again
+        np.copyto(self.grid.claims, snapshot.claims)
+        np.copyto(self.grid.trails, snapshot.trails)
+        for player, row, walked, territory in zip(snapshot.players, snapshot.scalars, snapshot.walked, snapshot.territories):
+            set_player_scalars(player, row)
+            player.trail = list(walked)
+            player.territory = territory.copy()
+        self.players = snapshot.players[:snapshot.playing]
+        self.grid.players = [snapshot.players[slot] if slot != -1 else None for slot in snapshot.slots]
+        self.grid.rebuild_occupants(self.players)
+        # a new version, never an old one, so no padded board mistakes the restored planes for ones it has seen
+        self.grid.version += 1
 
     def get_max_score(self) -> int:
         return max([player.claim_count for player in self.players]) if len(self.players) > 0 else 0
 
     def spawn_random_player(self, seed=None, depth=0) -> Player:
-        random.seed(seed)
-        player = Player(random.randint(0, self.width - 1), random.randint(0, self.height - 1))
-        for other_player in self.players:
-            if (other_player.position == player.position or self.grid.get_tile_at(player.position).claimed or self.grid.get_tile_at(player.position).ocupied) and depth < 10:
-                player = self.spawn_random_player(seed=seed, depth=depth + 1)
-                self.add_player(player)
-                return player
-                
+        # a seed reseeds the game's generator, the global random module is never touched
+        if seed is not None:
+            self.random.seed(seed)
+        player = Player(self.random.randint(0, self.width - 1), self.random.randint(0, self.height - 1))
+        x, y = player.position.x, player.position.y
+        cell = y * self.width + x
+        taken = self.grid.flat_claims.item(cell) != NO_PLAYER or self.grid.flat_trails.item(cell) != NO_PLAYER or cell in self.grid.occupants
+        if taken and depth < 10:
+            return self.spawn_random_player(depth=depth + 1)
+
         self.add_player(player)
         return player
 
+    def players_near(self, position: Vector, radius: int) -> List[Player]:
+        # the live players within radius cells (a square, like the vision window) from the occupancy index,
+        # looking at the window's cells or at every player, whichever are fewer
+        min_x, max_x = max(position.x - radius, 0), min(position.x + radius, self.width - 1)
+        min_y, max_y = max(position.y - radius, 0), min(position.y + radius, self.height - 1)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.grid.occupants):
+            return [player for occupants in self.grid.occupants.values() for player in occupants
+                    if min_x <= player.position.x <= max_x and min_y <= player.position.y <= max_y]
+        occupants = self.grid.occupants
+        near = []
+        for y in range(min_y, max_y + 1):
+            row = y * self.width
+            for cell in range(row + min_x, row + max_x + 1):
+                if cell in occupants:
+                    near.extend(occupants[cell])
+        return near
+
+    # the per player phases read single cells with .item() on the flat planes, a plain int is much cheaper
+    # to get and compare than a numpy scalar, which is most of a step on small boards
     def update_player_move(self, player: Player):
-        new_position = Vector(player.position.x + player.move_direction.x, player.position.y + player.move_direction.y)
-        player.position = new_position
-        tile = self.grid.get_tile_at(player.position)
-        if tile.claimer != player:
-            tile.occupy(player)
-    
+        position = Vector(player.position.x + player.move_direction.x, player.position.y + player.move_direction.y)
+        self.grid.move_occupant(player, position)
+        cell = position.y * self.width + position.x
+        if self.grid.flat_claims.item(cell) != player.index:
+            self.grid.flat_trails[cell] = player.index
+            player.trail.append(cell)
+
     def update_player_collisions(self, player: Player):
-        new_position = Vector(player.position.x + player.move_direction.x, player.position.y + player.move_direction.y)
-        if new_position.x < 0 or new_position.x >= len(self.grid.tiles[0]) or new_position.y < 0 or new_position.y >= len(self.grid.tiles):
+        x, y = player.position.x + player.move_direction.x, player.position.y + player.move_direction.y
+        if not (0 <= x < self.width and 0 <= y < self.height):
             # out of bounds
             player.kill(self.grid)
             return
-        
-        tile = self.grid.get_tile_at(new_position)
-        if tile.ocupied and not tile.claimed:
-            # either a self kill or enemy kill
-            if tile.ocupant != player:
+
+        cell = y * self.width + x
+        ocupant = self.grid.flat_trails.item(cell)
+        if ocupant == NO_PLAYER:
+            return
+
+        claimer = self.grid.flat_claims.item(cell)
+        # either walking into a trail in the open or a trail left on someone elses land
+        if claimer == NO_PLAYER or claimer != ocupant:
+            if ocupant != player.index:
                 # not a self kill
                 player.kills += 1
-            tile.ocupant.kill(self.grid)
-        
-        if tile.ocupied and tile.claimed and tile.claimer != tile.ocupant:
-            # kill someone that is on someone elses land
-            player.kills += 1
-            tile.ocupant.kill(self.grid)
-  
+            self.grid.players[ocupant].kill(self.grid)
+
+    def capture_cells(self, player: Player, cells: List[int]):
+        for owner, count in self.grid.set_claims(cells, player).items():
+            if owner != NO_PLAYER:
+                # whoever owned the tiles loses them
+                self.grid.players[owner].claim_count -= count
+            player.claim_count += count
+
+    def find_enclosed(self, player: Player, cells: List[int]) -> List[int]:
+        # flood fill every region next to the given cells that is fully surrounded by the players territory,
+        # a region that reaches the edge of the players bounding box is open so no flood ever leaves the box
+        width = self.width
+        min_x, min_y, max_x, max_y = player.bounds
+        territory = player.territory
+        outside = set()
+        enclosed = []
+        filled = set()
+
+        for cell in cells:
+            y, x = divmod(cell, width)
+            for seed_x, seed_y in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if seed_x <= min_x or seed_x >= max_x or seed_y <= min_y or seed_y >= max_y:
+                    continue
+                seed = seed_y * width + seed_x
+                if seed in territory or seed in outside or seed in filled:
+                    continue
+
+                region = {seed}
+                stack = [seed]
+                is_enclosed = True
+                while stack and is_enclosed:
+                    current = stack.pop()
+                    current_y, current_x = divmod(current, width)
+                    if current_x == min_x or current_x == max_x or current_y == min_y or current_y == max_y:
+                        is_enclosed = False
+                        break
+                    for neighbour in (current - 1, current + 1, current - width, current + width):
+                        if neighbour in territory or neighbour in region:
+                            continue
+                        if neighbour in outside:
+                            is_enclosed = False
+                            break
+                        region.add(neighbour)
+                        stack.append(neighbour)
+
+                if is_enclosed:
+                    filled |= region
+                    enclosed.extend(region)
+                else:
+                    outside |= region
+
+        return enclosed
+
     def update_player_claims(self, player: Player):
         player.moves_since_capture += 1
 
-        new_position = Vector(player.position.x + player.move_direction.x, player.position.y + player.move_direction.y)
-    
-        if self.grid.get_tile_at(new_position).claimer == player and self.grid.get_tile_at(player.position).claimer != player:
-            for row in self.grid.tiles:
-                for tile in row:
-                    if tile.ocupant == player:
-                        if tile.claimer != None and tile.claimer != player:
-                            tile.claimer.claim_count -= 1
-                            
-                        # to fill in the spaces in between the claim tiles we need to check for tiles until we find a tile that is going to be claimed (for right and left) then we claim all the tiles in between
-                        tile.claim(player)
-                        tile.unoccupy()
-                        player.claim_count += 1
-                        player.moves_since_capture = 0
-                        
-                        if player.claim_count > player.max_claim_count:
-                            player.max_claim_count = player.claim_count
-            
+        position, direction, claims = player.position, player.move_direction, self.grid.flat_claims
+        cell = position.y * self.width + position.x
+        if claims.item(cell + direction.y * self.width + direction.x) == player.index and claims.item(cell) != player.index:
+            trail = player.trail
+            if not trail:
+                return
+
+            # the trail becomes territory and everything it closes off is filled in
+            player.trail = []
+            fill_cells(self.grid.flat_trails, trail, NO_PLAYER)
+            self.capture_cells(player, trail)
+            enclosed = self.find_enclosed(player, trail)
+            if enclosed:
+                self.capture_cells(player, enclosed)
+
+            player.moves_since_capture = 0
+            if player.claim_count > player.max_claim_count:
+                player.max_claim_count = player.claim_count
+
     def update_player_same_location(self, player: Player):
         # if players are in the same location we check if one of them is on a claim and the one that has claim wins if both are not on a claim both die or both are on a claim that neither of them posses they also both die
-        for other_player in self.players:
-            if other_player == player:
+        # the occupancy index only holds live players, so this is one lookup instead of a pass over every player
+        occupants = self.grid.occupants.get(player.position.y * self.width + player.position.x, [])
+        if len(occupants) == 1 and occupants[0] is player:
+            return
+        others = [other_player for other_player in occupants if other_player is not player]
+        if not others:
+            return
+        if len(others) > 1:
+            # only after crowded spawns, who is met first decides who dies so it is the order of self.players
+            others = [other_player for other_player in self.players if any(other_player is other for other in others)]
+
+        claimer = self.grid.claims[player.position.y, player.position.x]
+        for other_player in others:
+            if not other_player.is_alive:
                 continue
 
-            if other_player.position == player.position:
-                if self.grid.get_tile_at(player.position).claimed and not self.grid.get_tile_at(player.position).claimer == player:
-                    other_player.kill(self.grid)
-                elif self.grid.get_tile_at(player.position).claimed and not self.grid.get_tile_at(player.position).claimer == other_player:
-                    player.kill(self.grid)
-                else:
-                    player.kill(self.grid)
-                    other_player.kill(self.grid)
-  
+            if claimer == player.index:
+                other_player.kill(self.grid)
+            elif claimer == other_player.index:
+                player.kill(self.grid)
+            else:
+                player.kill(self.grid)
+                other_player.kill(self.grid)
+
+            if not player.is_alive:
+                return
+
     def update(self):
+        if self.recorder is not None:
+            self.recorder.record_tick(self)
+
+        collisions, claims, move, same_location = self.update_player_collisions, self.update_player_claims, self.update_player_move, self.update_player_same_location
+        if self.profiler is not None:
+            collisions = self.profiler.wrap("update_collisions", collisions)
+            claims = self.profiler.wrap("update_claims", claims)
+            move = self.profiler.wrap("update_move", move)
+            same_location = self.profiler.wrap("update_same_location", same_location)
+
         for player in self.players:
-            self.update_player_collisions(player)
-        
+            if not player.is_alive or player.move_direction is None:
+                continue
+
+            collisions(player)
+
             if player.is_alive:
                 player.steps_survived += 1
-                
-                self.update_player_claims(player)
-                self.update_player_move(player)
-                self.update_player_same_location(player)
-        
-        self.players = [player for player in self.players if player.is_alive]
-    
-        if len(self.players) == 0:
-            return
 
+                claims(player)
+                move(player)
+                same_location(player)
+
+        if self.profiler is not None:
+            self.profiler.flush()
+
+        alive = [player for player in self.players if player.is_alive]
+        if len(alive) != len(self.players):
+            for player in self.players:
+                if not player.is_alive:
+                    self.grid.release_player(player)
+        self.players = alive
+        self.grid.version += 1
+
+        if len(self.players) > 0:
+            self.update_colors()
+
+        if self.recorder is not None:
+            self.recorder.record_updated(self)
+
+    def update_colors(self):
         max_score = 0
         player_max_score = self.players[0]
         for player in self.players:
@@ -301,6 +710,20 @@ class Game:
                 max_score = player.claim_count
                 player_max_score = player
             player.color = pygame.Color(230, 230, 230)
-    
+
         if max_score > 0:
-            player_max_score.color = pygame.Color(230, 0, 0)
\ No newline at end of file
+            player_max_score.color = pygame.Color(230, 0, 0)
+
+
+def reward_counters(player: Player) -> Tuple[bool, int, int]:
+    # all calculate_reward needs to remember about a player from before an update, no copy of the player
+    return player.is_alive, player.claim_count, player.kills
+
+
+def calculate_reward(before: Tuple[bool, int, int], player: Player) -> float:
+    # reward of a multiplayer agent for one update, before is reward_counters(player) from before it
+    if not player.is_alive:
+        return -1
+    _, claim_count, kills = before
+    reward = (player.claim_count - claim_count) * 0.9 + (player.kills - kills) * 5
+    return min(5, max(-5, reward)) # clip between 5 and -5
@@ -0,0 +1,105 @@
+import uuid
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+import numpy as np
+
+# shared memory transport for TileServer clients on the same host: the client asks for a ring of observation slots
+# (protocol.ATTACH), the server creates it and answers with its name (protocol.ATTACHED) for the client to attach to,
+# from then on the server writes every observation, reward and flags straight into the next slot and only sends
+# the slot index (protocol.SLOT_READY) over the websocket
+# the server never opens a segment it was given the name of, only the ones it created itself
+# layout: slots step ids (uint32), rewards (float32), message types and flags (uint8), then the observations
+# (observation_size bytes each, 64 byte aligned), a slot is only written again `slots` replies later
+
+ALIGNMENT = 64
+# every ring is named RING_PREFIX and a random uuid
+RING_PREFIX = "tileman-ring-"
+
+
+def aligned(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def ring_size(slots: int, observation_size: int) -> int:
+    return aligned(10 * slots) + slots * aligned(observation_size)
+
+
+class ObservationRing:
+    # name=None creates the segment (the server, which also unlinks it), a name attaches to an existing ring (the client)
+    slots: int
+    observation_size: int
+    memory: SharedMemory
+
+    def __init__(self, slots: int, observation_size: int, name: Optional[str] = None):
+        if not 0 < slots <= 255:
+            raise ValueError(f"a ring has 1 to 255 slots, not {slots}")
+        self.slots = slots
+        self.observation_size = observation_size
+        self.owner = name is None
+        if self.owner:
+            self.memory = SharedMemory(name=RING_PREFIX + uuid.uuid4().hex, create=True, size=ring_size(slots, observation_size))
+        else:
+            if not name.startswith(RING_PREFIX):
+                raise ValueError(f"{name} is not an observation ring")
+            self.memory = attach(name)
+            if self.memory.size < ring_size(slots, observation_size):
+                self.memory.close()
+                raise ValueError(f"shared memory {name} is {self.memory.size} bytes, too small for {slots} slots of {observation_size} bytes")
+
+        buffer = self.memory.buf
+        self.step_ids = np.ndarray((slots, ), dtype=np.uint32, buffer=buffer, offset=0)
+        self.rewards = np.ndarray((slots, ), dtype=np.float32, buffer=buffer, offset=4 * slots)
+        self.message_types = np.ndarray((slots, ), dtype=np.uint8, buffer=buffer, offset=8 * slots)
+        self.flags = np.ndarray((slots, ), dtype=np.uint8, buffer=buffer, offset=9 * slots)
+        stride = aligned(observation_size)
+        self.observations = np.ndarray((slots, observation_size), dtype=np.uint8, buffer=buffer, offset=aligned(10 * slots), strides=(stride, 1))
+        self.next_slot = 0
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def view(self, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        # (slots, *shape) typed view of the observation slots, for the reader
+        return np.ndarray((self.slots, *shape), dtype=dtype, buffer=self.memory.buf, offset=aligned(10 * self.slots), strides=(aligned(self.observation_size), *np.empty(shape, dtype=dtype).strides))
+
+    def write(self, message_type: int, step_id: int, observation: np.ndarray, reward: float, flags: int) -> int:
+        # copies the observation into the next slot and returns that slot
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.slots
+        self.observations[slot] = observation.reshape(-1).view(np.uint8)
+        self.step_ids[slot] = step_id & 0xFFFFFFFF
+        self.rewards[slot] = reward
+        self.message_types[slot] = message_type
+        self.flags[slot] = flags
+        return slot
+
+    def read(self, slot: int) -> Tuple[int, int, float, int]:
+        # (message type, step id, reward, flags) of a slot, the observation stays where it is
+        return int(self.message_types[slot]), int(self.step_ids[slot]), float(self.rewards[slot]), int(self.flags[slot])
+
+    def close(self):
+        # the arrays are views of the segment, they have to go before it can be closed
+        self.step_ids = self.rewards = self.message_types = self.flags = self.observations = None
+        try:
+            self.memory.close()
+        except BufferError:
+            # a typed view handed out by view() is still alive somewhere, the mapping goes with it
+            pass
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def attach(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the segment with this process' resource tracker as well,
+        # which would unlink the server's segment once the client exits
+        memory = SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
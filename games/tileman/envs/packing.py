@@ -0,0 +1,103 @@
+from typing import List, Optional, Tuple
+import numpy as np
+import gymnasium
+from gymnasium import spaces
+import torch
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+# bit-packed observations: every cell of an observation plane only ever holds one of a few values, so each plane is
+# split into one bit plane per value (the claims and trails planes into the player's own cells, -1, and everyone
+# else's, 1, borders are 1 and the multiplayer locations plane -1) and the bits are packed 8 to a byte by np.packbits
+#
+# bytes per observation at vision_range=14 (29x29 cells) and for a 1M transition replay buffer, which stores the
+# observation and the next observation of every transition (SB3 ReplayBuffer without optimize_memory_usage):
+#                                   int8 planes   packed     1M transitions int8 / packed
+#   SoloPlayerEnv, TilemanVecEnv    3 -> 2523 B   526 B      5.05 GB / 1.05 GB
+#   TileServer clients              4 -> 3364 B   631 B      6.73 GB / 1.26 GB
+
+# values of every observation plane that get a bit plane, in plane order
+PLANE_VALUES = ((-1, 1), (-1, 1), (1, ), (-1, ))
+
+
+def bit_planes(planes: int) -> List[Tuple[int, int]]:
+    # (plane, value) of every bit plane of an observation with `planes` planes
+    return [(plane, value) for plane, values in enumerate(PLANE_VALUES[:planes]) for value in values]
+
+
+def packed_size(planes: int, vision_range: int) -> int:
+    size = 2 * vision_range + 1
+    return (len(bit_planes(planes)) * size * size + 7) // 8
+
+
+def packed_space(planes: int, vision_range: int) -> spaces.Box:
+    return spaces.Box(low=0, high=255, shape=(packed_size(planes, vision_range), ), dtype=np.uint8)
+
+
+def pack_observation(observation: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    # (..., planes, 2r+1, 2r+1) int8 -> (..., packed_size) uint8, any leading batch dimensions
+    *batch, planes, height, width = observation.shape
+    layout = bit_planes(planes)
+    bits = np.empty((*batch, len(layout), height, width), dtype=bool)
+    for i, (plane, value) in enumerate(layout):
+        np.equal(observation[..., plane, :, :], value, out=bits[..., i, :, :])
+    packed = np.packbits(bits.reshape(*batch, -1), axis=-1)
+    if out is None:
+        return packed
+    np.copyto(out, packed)
+    return out
+
+
+def unpack_observation(packed: np.ndarray, planes: int, vision_range: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    # (..., packed_size) uint8 -> (..., planes, 2r+1, 2r+1) int8, exactly the observation that was packed
+    size = 2 * vision_range + 1
+    layout = bit_planes(planes)
+    batch = packed.shape[:-1]
+    if out is None:
+        out = np.empty((*batch, planes, size, size), dtype=np.int8)
+    bits = np.unpackbits(packed, axis=-1, count=len(layout) * size * size).view(np.int8).reshape(*batch, len(layout), size, size)
+    out.fill(0)
+    # the values are all -1 or 1, so every bit plane is added to or subtracted from its plane
+    for i, (plane, value) in enumerate(layout):
+        (np.add if value > 0 else np.subtract)(out[..., plane, :, :], bits[..., i, :, :], out=out[..., plane, :, :])
+    return out
+
+
+class UnpackObservation(gymnasium.ObservationWrapper):
+    # turns the packed observations of an env back into the int8 planes, for consumers that want the planes
+    # (a replay buffer filled through this wrapper stores the planes again, put it after the buffer instead)
+    def __init__(self, env: gymnasium.Env, planes: int, vision_range: int):
+        super().__init__(env)
+        self.planes = planes
+        self.vision_range = vision_range
+        size = 2 * vision_range + 1
+        self.observation_space = spaces.Box(low=-1, high=1, shape=(planes, size, size), dtype=np.int8)
+
+    def observation(self, observation: np.ndarray) -> np.ndarray:
+        return unpack_observation(observation, self.planes, self.vision_range)
+
+
+class PackedObservationExtractor(BaseFeaturesExtractor):
+    # SB3 features extractor for packed observations: rollout and replay buffers keep the packed bytes and the planes
+    # are only unpacked on the policy's device, then flattened like FlattenExtractor does with the int8 planes
+    #   policy_kwargs=dict(features_extractor_class=PackedObservationExtractor, features_extractor_kwargs=dict(planes=3, vision_range=14))
+    def __init__(self, observation_space: spaces.Box, planes: int = 3, vision_range: int = 14):
+        size = 2 * vision_range + 1
+        if observation_space.shape != (packed_size(planes, vision_range), ):
+            raise ValueError(f"{observation_space.shape} is not the packed shape of {planes} planes at vision range {vision_range}")
+        super().__init__(observation_space, planes * size * size)
+        layout = bit_planes(planes)
+        self.cells = size * size
+        self.bits = len(layout) * self.cells
+        self.register_buffer("shifts", torch.arange(7, -1, -1, dtype=torch.uint8), persistent=False)
+        # (planes, bit planes) matrix that sums the bit planes back into the planes
+        weights = torch.zeros(planes, len(layout))
+        for i, (plane, value) in enumerate(layout):
+            weights[plane, i] = value
+        self.register_buffer("weights", weights, persistent=False)
+
+    def forward(self, observations: torch.Tensor) -> torch.Tensor:
+        # SB3 hands Box observations over as floats of the byte values
+        packed = observations.to(torch.uint8)
+        bits = (packed.unsqueeze(-1) >> self.shifts) & 1
+        bits = bits.flatten(1)[:, :self.bits].reshape(-1, self.weights.shape[1], self.cells)
+        return torch.matmul(self.weights, bits.to(self.weights.dtype)).flatten(1)
@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from gymnasium import spaces
+from .objects import Directions, Game, Player, calculate_reward, reward_counters
+from .packing import pack_observation, packed_space
+from .renderer import BoardRenderer, BoardSnapshot
+
+
+class TilemanParallelEnv:
+    # every agent of one in-process objects.Game stepped together, the PettingZoo ParallelEnv api (dicts keyed by
+    # agent name) on top of step_arrays (one row per agent): the same observations and rewards a TileServer sends
+    # its clients, one Game.update per step and no sockets
+    # with respawn a finished agent is back in the game right away (its last observation in
+    # infos["terminal_observation"], like SB3 vec envs), without it the agent is out until the next reset
+    metadata = {"render_modes": ["rgb_array"], "name": "tileman_parallel_v0"}
+
+    def __init__(self, num_agents=8, grid_size=40, vision_range=5, max_episode_steps=300, respawn=True, packed_observations=False, render_mode=None):
+        if render_mode is not None and render_mode not in self.metadata["render_modes"]:
+            raise ValueError(f"unknown render mode {render_mode}, expected None or one of {self.metadata['render_modes']}")
+        self.grid_size = grid_size
+        self.vision_range = vision_range
+        self.max_episode_steps = max_episode_steps
+        self.respawn = respawn
+        self.packed_observations = packed_observations
+        self.render_mode = render_mode
+
+        self.possible_agents = [f"player_{i}" for i in range(num_agents)]
+        self.agent_indices = {agent: i for i, agent in enumerate(self.possible_agents)}
+        self.agents: List[str] = []
+        size = 2 * vision_range + 1
+        observation_space = packed_space(4, vision_range) if packed_observations else spaces.Box(low=-1, high=1, shape=(4, size, size), dtype=np.int8)
+        self.observation_spaces = {agent: observation_space for agent in self.possible_agents}
+        self.action_spaces = {agent: spaces.Discrete(len(Directions)) for agent in self.possible_agents}
+
+        self.rng = np.random.default_rng()
+        self.game = Game(grid_size, grid_size)
+        # the player of every agent, the agents that are out keep their dead player
+        self.players: List[Optional[Player]] = [None] * num_agents
+        self.active = np.zeros(num_agents, dtype=bool)
+        self.steps = np.zeros(num_agents, dtype=np.int64)
+        self.observations = np.zeros((num_agents, 4, size, size), dtype=np.int8)
+        self.renderer = BoardRenderer(grid_size, grid_size, max(600 // grid_size, 1)) if render_mode is not None else None
+
+    @property
+    def num_agents(self) -> int:
+        return len(self.agents)
+
+    @property
+    def max_num_agents(self) -> int:
+        return len(self.possible_agents)
+
+    def observation_space(self, agent: str) -> spaces.Space:
+        return self.observation_spaces[agent]
+
+    def action_space(self, agent: str) -> spaces.Space:
+        return self.action_spaces[agent]
+
+    def reset(self, seed=None, options=None) -> Tuple[Dict[str, np.ndarray], Dict[str, dict]]:
+        observations = self.reset_arrays(seed)
+        return {agent: observations[i] for i, agent in enumerate(self.possible_agents)}, {agent: {} for agent in self.possible_agents}
+
+    def step(self, actions: Dict[str, int]):
+        # agents without an action stand still, like a TileServer client under MissingActionPolicy.NOOP
+        indices = [self.agent_indices[agent] for agent in self.agents]
+        action_array = np.full(len(self.possible_agents), -1, dtype=np.intp)
+        for agent, action in actions.items():
+            action_array[self.agent_indices[agent]] = action
+        observations, rewards, terminations, truncations, infos = self.step_arrays(action_array)
+
+        stepped = [self.possible_agents[i] for i in indices]
+        self.agents = [agent for agent in self.possible_agents if self.active[self.agent_indices[agent]]]
+        return (
+            {agent: observations[i] for agent, i in zip(stepped, indices)},
+            {agent: float(rewards[i]) for agent, i in zip(stepped, indices)},
+            {agent: bool(terminations[i]) for agent, i in zip(stepped, indices)},
+            {agent: bool(truncations[i]) for agent, i in zip(stepped, indices)},
+            {agent: infos[i] for agent, i in zip(stepped, indices)},
+        )
+
+    def reset_arrays(self, seed=None) -> np.ndarray:
+        # (num_agents, ...) observations of a new game with every agent in it
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.game = Game(self.grid_size, self.grid_size, seed=int(self.rng.integers(2**63)))
+        self.players = [self.game.spawn_random_player() for _ in self.possible_agents]
+        self.active[:] = True
+        self.steps[:] = 0
+        self.agents = list(self.possible_agents)
+        self.observe(np.arange(len(self.possible_agents)))
+        return self.encode(self.observations)
+
+    def step_arrays(self, actions: np.ndarray):
+        # one action per agent (-1 stands still), returns (observations, rewards, terminations, truncations, infos)
+        # with one row per agent, agents that are out get a zero observation and reward and stay terminated
+        actions = np.asarray(actions).reshape(len(self.possible_agents))
+        active = np.flatnonzero(self.active)
+        for i in active:
+            action = int(actions[i])
+            if action != -1 and action not in Directions:
+                raise ValueError(f"invalid action {action} for {self.possible_agents[i]}")
+            self.players[i].move_direction = Directions[action] if action != -1 else None
+        before = [reward_counters(self.players[i]) for i in active]
+
+        self.game.update()
+
+        rewards = np.zeros(len(self.possible_agents), dtype=np.float32)
+        rewards[active] = [calculate_reward(counters, self.players[i]) for counters, i in zip(before, active)]
+        terminations = ~self.active
+        terminations[active] = [not self.players[i].is_alive for i in active]
+        self.steps[active] += 1
+        truncations = self.active & ~terminations & (self.steps >= self.max_episode_steps)
+        self.observe(active)
+        observations = self.encode(self.observations)
+
+        infos = [{} for _ in self.possible_agents]
+        finished = active[terminations[active] | truncations[active]]
+        for i in finished:
+            if truncations[i]:
+                self.game.kill_player(self.players[i])
+            if self.respawn:
+                infos[i]["terminal_observation"] = observations[i].copy()
+                self.players[i] = self.game.spawn_random_player()
+                self.steps[i] = 0
+            else:
+                self.active[i] = False
+        if self.respawn and len(finished) > 0:
+            # the others see the new players with the next step, as the clients of a TileServer do
+            self.observe(finished)
+            observations[finished] = self.encode(self.observations[finished])
+        return observations, rewards, terminations, truncations, infos
+
+    def observe(self, indices: np.ndarray):
+        # the agents that are out are left with a zero observation
+        self.observations[~self.active] = 0
+        indices = indices[self.active[indices]]
+        if len(indices) > 0:
+            self.observations[indices] = self.game.get_all_visions(self.vision_range, [self.players[i] for i in indices])
+
+    def encode(self, observations: np.ndarray) -> np.ndarray:
+        return pack_observation(observations) if self.packed_observations else observations.copy()
+
+    def render(self) -> Optional[np.ndarray]:
+        if self.renderer is None:
+            return None
+        return self.renderer.draw(BoardSnapshot(self.game)).copy()
+
+    def close(self):
+        pass
@@ -0,0 +1,152 @@
+import bisect
+import contextlib
+import threading
+import time
+from typing import Dict, List, Optional
+
+# opt-in timing of the phases of a tick: a Profiler is handed to whatever should be timed (Game.profiler,
+# TileServer(profile=True)) and everything left without one does no timing at all
+# every phase is a histogram of the seconds it took per tick (Game.update's per player phases summed over the
+# players), exposed in the prometheus text format on TileServer's /metrics and summarized by report()
+
+# upper bounds of the histogram buckets in seconds, 10us to 10s
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    bounds: tuple
+    # observations per bucket, the last one for everything above the largest bound
+    counts: List[int]
+    count: int
+    sum: float
+
+    def __init__(self, bounds: tuple = BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket the quantile falls into, the largest bound when it is above all of them
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+
+class PhaseTimer:
+    def __init__(self, profiler: "Profiler", phase: str):
+        self.profiler = profiler
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.observe(self.phase, time.perf_counter() - self.started)
+
+
+class Profiler:
+    # phases are observed from the server's event loop and its render thread, hence the lock
+    histograms: Dict[str, Histogram]
+
+    def __init__(self, bounds: tuple = BUCKETS):
+        self.bounds = bounds
+        self.histograms = {}
+        # seconds of the wrap()ped phases since the last flush
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        # (count, sum) of every phase as of the last report
+        self.reported = {}
+        self.reported_at = self.started
+
+    def observe(self, phase: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = Histogram(self.bounds)
+            histogram.observe(seconds)
+
+    def time(self, phase: str) -> PhaseTimer:
+        return PhaseTimer(self, phase)
+
+    def wrap(self, phase: str, function):
+        # function with its calls timed and summed up until flush(), for the phases that run once per player, which
+        # makes them one observation per tick as well
+        clock = time.perf_counter
+        pending = self.pending
+        pending.setdefault(phase, 0.0)
+
+        def timed_function(*args):
+            started = clock()
+            result = function(*args)
+            pending[phase] += clock() - started
+            return result
+        return timed_function
+
+    def flush(self):
+        for phase, seconds in self.pending.items():
+            self.observe(phase, seconds)
+        self.pending.clear()
+
+    def exposition(self, prefix: str = "tileman") -> str:
+        # the phase histograms in the prometheus text format, bucket counts are cumulative there
+        name = f"{prefix}_phase_seconds"
+        lines = [f"# HELP {name} seconds spent in each phase of a tick", f"# TYPE {name} histogram"]
+        with self.lock:
+            for phase, histogram in sorted(self.histograms.items()):
+                seen = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    seen += count
+                    lines.append(f'{name}_bucket{{phase="{phase}",le="{bound}"}} {seen}')
+                lines.append(f'{name}_bucket{{phase="{phase}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{phase="{phase}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{phase="{phase}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        # one line per phase for the time since the last report: how often it ran, the mean and total time
+        # and its share of the wall time, then the p50 / p99 since the start (bucket bounds)
+        now = time.perf_counter()
+        wall = max(now - self.reported_at, 1e-9)
+        lines = [f"{'phase':<24} {'calls':>7} {'mean ms':>9} {'total ms':>10} {'% wall':>7} {'p50 ms':>8} {'p99 ms':>8}"]
+        with self.lock:
+            for phase, histogram in sorted(self.histograms.items(), key=lambda item: -item[1].sum):
+                count, total = self.reported.get(phase, (0, 0.0))
+                calls, seconds = histogram.count - count, histogram.sum - total
+                mean = 1000 * seconds / calls if calls > 0 else 0.0
+                lines.append(f"{phase:<24} {calls:>7} {mean:>9.3f} {1000 * seconds:>10.1f} {100 * seconds / wall:>6.1f}% {1000 * histogram.quantile(0.5):>8.3f} {1000 * histogram.quantile(0.99):>8.3f}")
+                self.reported[phase] = (histogram.count, histogram.sum)
+        self.reported_at = now
+        return f"profile of the last {wall:.1f}s\n" + "\n".join(lines)
+
+
+NOT_TIMED = contextlib.nullcontext()
+
+
+def timed(profiler: Optional[Profiler], phase: str):
+    # with timed(profiler, phase): ... times the block, or does nothing without a profiler
+    return profiler.time(phase) if profiler is not None else NOT_TIMED
+
+
+def exposition(metrics: Dict[str, float], profiler: Optional[Profiler] = None, prefix: str = "tileman") -> str:
+    # a TileServer.metrics() dict as prometheus gauges, followed by the phase histograms when there is a profiler
+    lines = []
+    for key, value in metrics.items():
+        if isinstance(value, (bool, int, float)):
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {float(value)}")
+    text = "\n".join(lines) + "\n"
+    return text + profiler.exposition(prefix) if profiler is not None else text
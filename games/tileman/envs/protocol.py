@@ -0,0 +1,115 @@
+import struct
+from typing import Any, Optional, Tuple
+import numpy as np
+
+# fixed layout binary messages between TileServer and ClientPlayerEnv, nothing on the socket is ever unpickled
+
+# client -> server opcodes, ACTION is followed by a single action byte, RESET by an optional encoding byte,
+# ATTACH by the slots and observation size of the observation_ring.ObservationRing it asks for (0 slots to go back
+# to the socket), the others are sent on their own
+ACTION = 0
+RESET = 1
+KEEPALIVE = 2
+CLOSE = 3
+ATTACH = 4
+
+# server -> client message types
+STEP = 0
+RESET_DONE = 1
+# answer to ATTACH, followed by 1 and the name of the ring the server created (0 when it did not, a remote client)
+ATTACHED = 2
+# the observation is in the client's ring, followed by the slot
+SLOT_READY = 3
+
+# observation encodings a client asks for with RESET, the int8 planes unless it says otherwise
+PLANES = 0
+PACKED = 1 # packing.pack_observation
+
+# bits of the flags byte
+DONE = 1
+TRUNCATED = 2
+
+ACTION_MESSAGE = struct.Struct("<BB")
+ATTACH_MESSAGE = struct.Struct("<BBI")
+# ATTACHED and SLOT_READY, type and one byte
+SHORT_MESSAGE = struct.Struct("<BB")
+# message type, step id, reward, flags, followed by the raw observation bytes (int8 planes or packed uint8)
+HEADER = struct.Struct("<BIfB")
+
+
+def encode_action(action: int) -> bytes:
+    return ACTION_MESSAGE.pack(ACTION, int(action))
+
+
+def encode_control(opcode: int) -> bytes:
+    return bytes((opcode,))
+
+
+def encode_reset(encoding: int = PLANES) -> bytes:
+    # a plain RESET for the planes, so servers that predate the encodings still understand it
+    return encode_control(RESET) if encoding == PLANES else bytes((RESET, encoding))
+
+
+def encode_attach(slots: int, observation_size: int) -> bytes:
+    return ATTACH_MESSAGE.pack(ATTACH, slots, observation_size)
+
+
+def encode_attached(name: Optional[str]) -> bytes:
+    return encode_short(ATTACHED, 0) if name is None else encode_short(ATTACHED, 1) + name.encode()
+
+
+def decode_attached(message) -> Optional[str]:
+    # the name of the ring in an ATTACHED message, None when the server did not create one
+    if len(message) > SHORT_MESSAGE.size and message[0] == ATTACHED and message[1] == 1:
+        return bytes(message[SHORT_MESSAGE.size:]).decode()
+    return None
+
+
+def decode_request(message) -> Tuple[int, Any]:
+    # returns (opcode, action), action is the encoding for RESET, (slots, observation size) for ATTACH
+    # and None for the other control messages, an ATTACH naming a ring of its own (older clients) is None as well
+    if not isinstance(message, (bytes, bytearray, memoryview)) or len(message) == 0:
+        raise ValueError(f"malformed request {message!r}")
+    opcode = message[0]
+    if opcode == ACTION:
+        if len(message) != ACTION_MESSAGE.size:
+            raise ValueError(f"malformed action request {bytes(message)!r}")
+        return opcode, message[1]
+    if opcode in (RESET, KEEPALIVE, CLOSE) and len(message) == 1:
+        return opcode, PLANES if opcode == RESET else None
+    if opcode == RESET and len(message) == 2 and message[1] in (PLANES, PACKED):
+        return opcode, message[1]
+    if opcode == ATTACH and len(message) == ATTACH_MESSAGE.size:
+        _, slots, observation_size = ATTACH_MESSAGE.unpack_from(message)
+        return opcode, (slots, observation_size)
+    if opcode == ATTACH and len(message) > ATTACH_MESSAGE.size:
+        return opcode, None
+    raise ValueError(f"unknown request {bytes(message)!r}")
+
+
+def encode_flags(done: bool, truncated: bool) -> int:
+    return (DONE if done else 0) | (TRUNCATED if truncated else 0)
+
+
+def encode_observation(message_type: int, step_id: int, observation: np.ndarray, reward: float = 0.0, done: bool = False, truncated: bool = False) -> bytes:
+    return HEADER.pack(message_type, step_id & 0xFFFFFFFF, reward, encode_flags(done, truncated)) + observation.tobytes()
+
+
+def encode_short(message_type: int, value: int) -> bytes:
+    return SHORT_MESSAGE.pack(message_type, value)
+
+
+def decode_short(message, message_type: int) -> Optional[int]:
+    # the byte of an ATTACHED or SLOT_READY message, None when message is something else
+    if len(message) == SHORT_MESSAGE.size and message[0] == message_type:
+        return message[1]
+    return None
+
+
+def decode_observation(message, out: np.ndarray) -> Tuple[int, int, float, bool, bool]:
+    # copies the observation into out and returns (message type, step id, reward, done, truncated)
+    if len(message) != HEADER.size + out.nbytes:
+        raise ValueError(f"expected a {HEADER.size + out.nbytes} byte observation message, got {len(message)} bytes")
+    message_type, step_id, reward, flags = HEADER.unpack_from(message)
+    np.copyto(out, np.frombuffer(message, dtype=out.dtype, offset=HEADER.size).reshape(out.shape))
+    return message_type, step_id, reward, bool(flags & DONE), bool(flags & TRUNCATED)
@@ -0,0 +1,259 @@
+import struct
+import uuid
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .objects import DIRECTION_ACTIONS, Directions, Game, GameSnapshot, Player, SNAPSHOT_FIELDS
+
+# append-only binary log of a tileman game, EpisodeReplayer re-simulates it through objects.Game
+#   file header: MAGIC, width, height, seed of the game (-1 for none), keyframe interval
+#   then records, each a (type, payload length) header followed by the payload:
+#     SPAWN     agent, x, y     a player was added at (x, y), already moved off the border by Game.add_player
+#     KILL      agent           a kill from outside Game.update (disconnect, reset)
+#     TICK      tick, actions   Game.update ran, one action byte per player in Game.players order (STANDING_STILL for None)
+#     KEYFRAME  zlib compressed state right after a tick (encode_keyframe), only there to seek quickly
+# agents are numbered in the order they spawned, a file is readable while it is still written (a torn last record is
+# left out) and a few bytes per player per tick is all it grows by between keyframes
+
+MAGIC = b"TMREC\x01"
+FILE_HEADER = struct.Struct("<6sHHqI")
+RECORD = struct.Struct("<BI")
+SPAWN_RECORD = struct.Struct("<IHH")
+KILL_RECORD = struct.Struct("<I")
+TICK_RECORD = struct.Struct("<I")
+# tick, players, how many of them are in Game.players, grid slots
+KEYFRAME_HEADER = struct.Struct("<IHHH")
+
+SPAWN = 0
+KILL = 1
+TICK = 2
+KEYFRAME = 3
+
+STANDING_STILL = 4
+
+
+def encode_keyframe(tick: int, game: Game, agents: Dict[uuid.UUID, int]) -> bytes:
+    # the planes, the grid slots, agent and scalars of every player and the trails, territories are left out
+    # because they are exactly the cells of the claims plane holding the player's index
+    snapshot = game.snapshot()
+    scalars = np.array(snapshot.scalars, dtype=np.int32).reshape(len(snapshot.players), len(SNAPSHOT_FIELDS))
+    walked = [cell for trail in snapshot.walked for cell in trail]
+    return zlib.compress(b"".join((
+        KEYFRAME_HEADER.pack(tick, len(snapshot.players), snapshot.playing, len(snapshot.slots)),
+        snapshot.claims.tobytes(),
+        snapshot.trails.tobytes(),
+        np.array(snapshot.slots, dtype=np.int16).tobytes(),
+        np.array([agents[player.id] for player in snapshot.players], dtype=np.uint32).tobytes(),
+        scalars.tobytes(),
+        np.array([len(trail) for trail in snapshot.walked], dtype=np.uint32).tobytes(),
+        np.array(walked, dtype=np.int32).tobytes(),
+    )))
+
+
+def decode_keyframe(payload, width: int, height: int) -> Tuple[int, GameSnapshot, List[int]]:
+    # (tick, snapshot of new Player objects, agent of every snapshot player)
+    data = zlib.decompress(payload)
+    tick, count, playing, slot_count = KEYFRAME_HEADER.unpack_from(data)
+    offset = KEYFRAME_HEADER.size
+
+    def take(dtype, length):
+        nonlocal offset
+        array = np.frombuffer(data, dtype=dtype, count=length, offset=offset)
+        offset += array.nbytes
+        return array
+
+    claims = take(np.int16, width * height).reshape(height, width).copy()
+    trails = take(np.int16, width * height).reshape(height, width).copy()
+    slots = take(np.int16, slot_count).tolist()
+    agents = take(np.uint32, count).tolist()
+    scalars = [tuple(row) for row in take(np.int32, count * len(SNAPSHOT_FIELDS)).reshape(count, len(SNAPSHOT_FIELDS)).tolist()]
+    lengths = take(np.uint32, count)
+    cells = take(np.int32, int(lengths.sum())).tolist()
+    ends = np.cumsum(lengths).tolist()
+    walked = [cells[end - length:end] for end, length in zip(ends, lengths.tolist())]
+
+    index_field, alive_field = SNAPSHOT_FIELDS.index("index"), SNAPSHOT_FIELDS.index("is_alive")
+    flat_claims = claims.reshape(-1)
+    territories = [set(np.flatnonzero(flat_claims == row[index_field]).tolist()) if row[alive_field] else set() for row in scalars]
+    players = [Player(0, 0) for _ in range(count)]
+    return tick, GameSnapshot(claims, trails, players, playing, slots, scalars, walked, territories), agents
+
+
+class EpisodeRecorder:
+    # attaches itself to the game (Game.recorder) and writes every spawn, outside kill and update as it happens,
+    # a game that already has players starts with a keyframe
+    def __init__(self, path: str, game: Game, keyframe_interval=100):
+        self.path = path
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(MAGIC, game.width, game.height, game.seed if game.seed is not None else -1, keyframe_interval))
+        self.agents: Dict[uuid.UUID, int] = {}
+        self.tick = 0
+        game.recorder = self
+        if game.players:
+            for player in game.players:
+                self.agents[player.id] = len(self.agents)
+            self.write(KEYFRAME, encode_keyframe(self.tick, game, self.agents))
+
+    def write(self, record_type: int, payload: bytes):
+        self.file.write(RECORD.pack(record_type, len(payload)))
+        self.file.write(payload)
+
+    def agent(self, player: Player) -> Optional[int]:
+        return self.agents.get(player.id)
+
+    def record_spawn(self, game: Game, player: Player):
+        self.agents[player.id] = len(self.agents)
+        self.write(SPAWN, SPAWN_RECORD.pack(self.agents[player.id], player.position.x, player.position.y))
+
+    def record_kill(self, game: Game, player: Player):
+        if player.id in self.agents:
+            self.write(KILL, KILL_RECORD.pack(self.agents[player.id]))
+
+    def record_tick(self, game: Game):
+        actions = bytes(DIRECTION_ACTIONS[(player.move_direction.x, player.move_direction.y)] if player.move_direction is not None else STANDING_STILL for player in game.players)
+        self.write(TICK, TICK_RECORD.pack(self.tick + 1) + actions)
+
+    def record_updated(self, game: Game):
+        self.tick += 1
+        if self.keyframe_interval and self.tick % self.keyframe_interval == 0:
+            self.write(KEYFRAME, encode_keyframe(self.tick, game, self.agents))
+            self.file.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if self.game.recorder is self:
+            self.game.recorder = None
+
+
+class EpisodeReplayer:
+    # the state at tick t is the game after its t-th update and everything recorded before the next one (players
+    # joining or leaving in between), seek(t) starts from the last keyframe at or before t
+    def __init__(self, path: str):
+        self.path = path
+        self.refresh()
+        self.rewind()
+
+    def refresh(self):
+        # (re)reads the file, picks up whatever was appended since
+        with open(self.path, "rb") as f:
+            self.data = f.read()
+        magic, self.width, self.height, seed, self.keyframe_interval = FILE_HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a tileman recording")
+        self.seed = seed if seed >= 0 else None
+
+        # (type, payload offset, payload length) of every complete record
+        self.records: List[Tuple[int, int, int]] = []
+        # record index of every tick, tick t is self.ticks[t - 1]
+        self.ticks: List[int] = []
+        # tick -> record index of its keyframe
+        self.keyframes: Dict[int, int] = {}
+        offset = FILE_HEADER.size
+        while offset + RECORD.size <= len(self.data):
+            record_type, length = RECORD.unpack_from(self.data, offset)
+            if offset + RECORD.size + length > len(self.data):
+                break
+            if record_type == TICK:
+                self.ticks.append(len(self.records))
+            elif record_type == KEYFRAME:
+                self.keyframes[len(self.ticks)] = len(self.records)
+            self.records.append((record_type, offset + RECORD.size, length))
+            offset += RECORD.size + length
+
+    @property
+    def length(self) -> int:
+        return len(self.ticks)
+
+    def rewind(self):
+        self.game = Game(self.width, self.height, self.seed)
+        self.agents: Dict[int, Player] = {}
+        self.tick = 0
+        self.position = 0 # next record
+        self.advance()
+
+    def payload(self, index: int):
+        _, offset, length = self.records[index]
+        return memoryview(self.data)[offset:offset + length]
+
+    def apply(self, index: int):
+        record_type = self.records[index][0]
+        payload = self.payload(index)
+        if record_type == SPAWN:
+            agent, x, y = SPAWN_RECORD.unpack(payload)
+            player = Player(x, y)
+            self.game.add_player(player)
+            self.agents[agent] = player
+        elif record_type == KILL:
+            agent, = KILL_RECORD.unpack(payload)
+            self.game.kill_player(self.agents[agent])
+        elif record_type == TICK:
+            tick, = TICK_RECORD.unpack_from(payload)
+            actions = bytes(payload[TICK_RECORD.size:])
+            if len(actions) != len(self.game.players):
+                raise ValueError(f"tick {tick} has {len(actions)} actions for {len(self.game.players)} players, the replay diverged from the recording")
+            for player, action in zip(self.game.players, actions):
+                player.move_direction = Directions[action] if action != STANDING_STILL else None
+            self.game.update()
+            self.tick = tick
+        elif record_type == KEYFRAME and self.position == 0:
+            # a recording that starts in the middle of a game
+            self.load_keyframe(index)
+
+    def advance(self):
+        # applies records up to (not including) the next tick
+        while self.position < len(self.records) and self.records[self.position][0] != TICK:
+            self.apply(self.position)
+            self.position += 1
+
+    def step(self) -> bool:
+        # one tick forward, False at the end of the recording
+        if self.position >= len(self.records):
+            return False
+        self.apply(self.position)
+        self.position += 1
+        self.advance()
+        return True
+
+    def load_keyframe(self, index: int):
+        tick, snapshot, agents = decode_keyframe(self.payload(index), self.width, self.height)
+        self.game = Game(self.width, self.height, self.seed)
+        self.game.restore(snapshot)
+        self.agents = {agent: player for agent, player in zip(agents, snapshot.players)}
+        self.tick = tick
+
+    def seek(self, tick: int):
+        if not 0 <= tick <= self.length:
+            raise IndexError(f"tick {tick} is not in the recording, it has {self.length} ticks")
+        keyframe = max((keyframe for keyframe in self.keyframes if keyframe <= tick), default=None)
+        if tick < self.tick or (keyframe is not None and keyframe > self.tick):
+            if keyframe is None or keyframe == 0:
+                self.rewind()
+            else:
+                self.load_keyframe(self.keyframes[keyframe])
+                self.position = self.keyframes[keyframe] + 1
+                self.advance()
+        while self.tick < tick:
+            self.step()
+
+    def player(self, agent: int) -> Optional[Player]:
+        # None before the agent spawned and once it is gone from the game
+        player = self.agents.get(agent)
+        return player if player is not None and player.is_alive else None
+
+    def observation(self, agent: int, vision_range=5, out: Optional[np.ndarray] = None) -> np.ndarray:
+        # what the server sent the agent at this tick, the first three planes are the solo env's observation
+        player = self.player(agent)
+        if player is None:
+            raise KeyError(f"agent {agent} is not in the game at tick {self.tick}")
+        return self.game.get_vision(player, vision_range, out=out)
+
+    def observations(self, vision_range=5) -> Tuple[List[int], np.ndarray]:
+        # every agent in the game at once, (agents, (len(agents), 4, 2r+1, 2r+1))
+        agents = [agent for agent, player in self.agents.items() if player.is_alive]
+        return agents, self.game.get_all_visions(vision_range, [self.agents[agent] for agent in agents])
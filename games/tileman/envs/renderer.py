@@ -0,0 +1,82 @@
+from typing import Optional
+import numpy as np
+from .objects import Game, NO_PLAYER
+
+UNCLAIMED_BODY = (0, 0, 0)
+UNCLAIMED_EDGE = (20, 20, 20)
+PLAYER_COLOR = (255, 0, 0)
+# trails are drawn in the owner's color darkened by this much
+TRAIL_SHADE = 40
+
+# zones of a tile: the 1 pixel edge, the body and the inner square (trails and players)
+EDGE = 0
+BODY = 1
+INNER = 2
+
+
+class BoardSnapshot:
+    # copy of everything a frame is drawn from, taken on the game thread between ticks so the
+    # renderer never reads a board that is half way through an update
+    claims: np.ndarray
+    trails: np.ndarray
+    positions: np.ndarray
+    colors: np.ndarray
+
+    def __init__(self, game: Game):
+        self.claims = game.grid.claims.copy()
+        self.trails = game.grid.trails.copy()
+        live = [player for player in game.players if player.is_alive]
+        self.positions = np.array([(player.position.y, player.position.x) for player in live], dtype=np.intp).reshape(-1, 2)
+        # one row per player slot plus a last row that NO_PLAYER (-1) indexes into
+        slots = game.grid.players
+        self.colors = np.zeros((len(slots) + 1, 3), dtype=np.uint8)
+        for index, player in enumerate(slots):
+            if player is not None:
+                self.colors[index] = (player.color.r, player.color.g, player.color.b)
+
+
+class BoardRenderer:
+    # builds the TileServer frame with array lookups instead of a pygame.draw.rect per tile, every tile gets an
+    # (edge, body, inner) color triple and a (tile_size, tile_size) zone map picks one of them per pixel
+    # only the tiles whose colors changed since the previous frame are written again
+    def __init__(self, width: int, height: int, tile_size: int):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+
+        margin = tile_size // 5
+        self.zones = np.full((tile_size, tile_size), BODY, dtype=np.intp)
+        self.zones[[0, -1], :] = EDGE
+        self.zones[:, [0, -1]] = EDGE
+        self.zones[margin:tile_size - margin, margin:tile_size - margin] = INNER
+
+        self.frame = np.zeros((height * tile_size, width * tile_size, 3), dtype=np.uint8)
+        # (height, tile_size, width, tile_size, 3) view, tile (y, x) is tiles[y, :, x, :]
+        self.tiles = self.frame.reshape(height, tile_size, width, tile_size, 3)
+        self.tile_colors: Optional[np.ndarray] = None
+
+    def colors(self, snapshot: BoardSnapshot) -> np.ndarray:
+        colors = np.empty((self.height, self.width, 3, 3), dtype=np.uint8)
+        claimed = snapshot.claims != NO_PLAYER
+        claim_colors = snapshot.colors[snapshot.claims]
+        colors[:, :, BODY] = np.where(claimed[..., None], claim_colors, np.array(UNCLAIMED_BODY, dtype=np.uint8))
+        colors[:, :, EDGE] = np.where(claimed[..., None], claim_colors, np.array(UNCLAIMED_EDGE, dtype=np.uint8))
+
+        colors[:, :, INNER] = colors[:, :, BODY]
+        ys, xs = np.nonzero(snapshot.trails != NO_PLAYER)
+        trail_colors = snapshot.colors[snapshot.trails[ys, xs]]
+        colors[ys, xs, INNER] = np.maximum(trail_colors, TRAIL_SHADE) - TRAIL_SHADE
+        colors[snapshot.positions[:, 0], snapshot.positions[:, 1], INNER] = PLAYER_COLOR
+        return colors
+
+    def draw(self, snapshot: BoardSnapshot) -> np.ndarray:
+        colors = self.colors(snapshot)
+        if self.tile_colors is None:
+            # (height, width, tile_size, tile_size, 3) -> (height, tile_size, width, tile_size, 3)
+            self.tiles[:] = colors[:, :, self.zones].transpose(0, 2, 1, 3, 4)
+        else:
+            ys, xs = np.nonzero((colors != self.tile_colors).any(axis=(2, 3)))
+            if len(ys) > 0:
+                self.tiles[ys, :, xs, :] = colors[ys, xs][:, self.zones]
+        self.tile_colors = colors
+        return self.frame
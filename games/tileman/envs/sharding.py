@@ -0,0 +1,649 @@
+import asyncio
+import bisect
+import heapq
+import multiprocessing
+import random
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import websockets
+from .objects import Directions, Game, Grid, NO_PLAYER, PaddedBoard, Player, calculate_reward, player_scalars, reward_counters, set_player_scalars
+from . import protocol
+from .multi_agent_env import TileServer
+from .packing import pack_observation
+from .profiling import timed
+from .tick_scheduler import MissingActionPolicy
+
+# one large tileman board split into vertical strips, every strip owned by a worker process (a Region) that advances
+# the players standing on it with the plain objects.Game rules, the ShardedWorld coordinator routes what the regions
+# tell each other and hands every region copies of its neighbours' edge columns (the halo) once a tick
+# a region sees the board around its strip as it was at the end of the previous tick: a move across a strip edge
+# can walk into a trail its neighbour's players left earlier in the same tick without noticing, everything else
+# (captures over the edge, kills, players walking across) is settled at the end of the tick exactly as one Game would
+
+# messages, (kind, target, ...) where the target is a region for the ones about that region's cells and a player index
+# for the ones about a player, which go to whichever region owns the player by then,
+# a region applies a batch in this order whatever order it was sent in
+MIGRATE = 0  # (MIGRATE, region, index, scalars, trail, territory) the player walked into the region
+CLAIM = 1  # (CLAIM, region, index, cells) the player captured these cells of the region
+CLEAR = 2  # (CLEAR, region, index, cells) the player died, its trail and territory cells there are emptied
+LOST = 3  # (LOST, index, cells) someone else captured these cells of the player
+COUNT = 4  # (COUNT, index, delta) change of the player's claim_count
+KILL = 5  # (KILL, index)
+REMOVE = 6  # (REMOVE, index) killed and forgotten, the index is free for a new player
+
+# the reward_counters of a player in another process, enough of a player for calculate_reward
+Counters = namedtuple("Counters", ["is_alive", "claim_count", "kills"])
+
+
+class RemoteTerritory:
+    def __init__(self, player: "RemotePlayer"):
+        self.player = player
+
+    def difference_update(self, cells: List[int]):
+        self.player.region.outbox.append((LOST, self.player.index, list(cells)))
+
+
+class RemotePlayer:
+    # stands in the grid slot of a player another region owns, what the game does to it turns into messages
+    is_alive = True
+
+    def __init__(self, region: "Region", index: int):
+        self.region = region
+        self.index = index
+        self.territory = RemoteTerritory(self)
+
+    @property
+    def claim_count(self) -> int:
+        return 0
+
+    @claim_count.setter
+    def claim_count(self, value: int):
+        # the game only ever does claim_count -= count (Game.capture_cells), from 0 that is the change
+        if value != 0:
+            self.region.outbox.append((COUNT, self.index, value))
+
+    def kill(self, grid: Grid):
+        self.region.outbox.append((KILL, self.index))
+
+
+class RegionBoard(PaddedBoard):
+    # only the strip and its halo are refreshed, no window of a player on the strip reaches further
+    def refresh(self, grid: "RegionGrid"):
+        region = grid.region
+        r = self.vision_range
+        x0, x1 = max(region.x0 - region.halo, 0), min(region.x1 + region.halo, grid.width)
+        np.copyto(self.claims[r:r + grid.height, r + x0:r + x1], grid.claims[:, x0:x1])
+        np.copyto(self.trails[r:r + grid.height, r + x0:r + x1], grid.trails[:, x0:x1])
+        self.locations[:, r + x0:r + x1] = 0
+        heads = [(player.position.x, player.position.y) for player in region.game.players] + grid.halo_heads
+        if heads:
+            xs, ys = np.array(heads, dtype=np.intp).T
+            np.add.at(self.locations, (ys + r, xs + r), 1)
+        self.version = grid.version
+
+
+class RegionGrid(Grid):
+    # the whole board, of which the region only keeps its strip (and the halo around it) up to date
+    def __init__(self, region: "Region", width: int, height: int, capacity: int):
+        super().__init__(width, height)
+        self.region = region
+        self.proxies = [RemotePlayer(region, index) for index in range(capacity)]
+        self.players = list(self.proxies)
+        # (x, y) of the neighbours' players in the halo
+        self.halo_heads = []
+
+    def padded(self, vision_range: int) -> PaddedBoard:
+        board = self._padded.get(vision_range)
+        if board is None:
+            board = self._padded[vision_range] = RegionBoard(self.width, self.height, vision_range)
+        if board.version != self.version:
+            board.refresh(self)
+        return board
+
+    def register_player(self, player: Player):
+        # the coordinator hands out the indices, they are the same in every region
+        self.players[player.index] = player
+
+    def release_player(self, player: Player):
+        if player.index != NO_PLAYER and self.players[player.index] is player:
+            self.players[player.index] = self.proxies[player.index]
+
+    def split(self, cells: List[int]) -> Dict[int, List[int]]:
+        # cells by the region owning them
+        region = self.region
+        columns = [cell % self.width for cell in cells]
+        if not columns or (region.x0 <= min(columns) and max(columns) < region.x1):
+            return {region.number: list(cells)} if columns else {}
+        regions = {}
+        for cell, x in zip(cells, columns):
+            regions.setdefault(region.region_of(x), []).append(cell)
+        return regions
+
+    def set_claims(self, cells: List[int], player: Player) -> Dict[int, int]:
+        region = self.region
+        regions = self.split(cells)
+        local = regions.pop(region.number, [])
+        if not regions:
+            return super().set_claims(cells, player)
+
+        taken = super().set_claims(local, player) if local else {}
+        # other regions' cells count as free here, the region they are on takes them off their previous owners (CLAIM)
+        for number, remote in regions.items():
+            remote = [cell for cell in remote if cell not in player.territory]
+            if remote:
+                region.outbox.append((CLAIM, number, player.index, remote))
+                player.territory.update(remote)
+                taken[NO_PLAYER] = taken.get(NO_PLAYER, 0) + len(remote)
+        self.extend_bounds(player, cells)
+        return taken
+
+    def clear_cells(self, index: int, trail: List[int], territory: set):
+        # only the cells still holding the player, a migrant killed as it arrives may have been walked over already
+        trails, territories = self.split(trail), self.split(territory)
+        for number in trails.keys() | territories.keys():
+            cells = trails.get(number, []) + territories.get(number, [])
+            if number == self.region.number:
+                self.region.on_clear(number, index, cells)
+            else:
+                self.region.outbox.append((CLEAR, number, index, cells))
+
+
+class Region:
+    # one worker's strip [x0, x1) of the board, a Game over the whole board whose players are the ones on the strip
+    number: int
+    x0: int
+    x1: int
+    # columns of the neighbours mirrored on either side
+    halo: int
+
+    def __init__(self, width: int, height: int, edges: List[int], number: int, vision_range: int, capacity: int, seed: int):
+        self.edges = edges
+        self.number = number
+        self.x0, self.x1 = edges[number], edges[number + 1]
+        self.vision_range = vision_range
+        self.halo = vision_range + 1
+        self.outbox = []
+        self.sent_edges = None
+        self.sent_version = None
+        # the neighbours' edges last received
+        self.halos = [None, None]
+        self.game = Game(width, height, seed)
+        self.grid = self.game.grid = RegionGrid(self, width, height, capacity)
+        # players that died on the strip, kept for their last observation until they are removed
+        self.dead: Dict[int, Player] = {}
+        self.handlers = {
+            MIGRATE: self.on_migrate,
+            CLAIM: self.on_claim,
+            CLEAR: self.on_clear,
+            LOST: self.on_lost,
+            COUNT: self.on_count,
+            KILL: self.on_kill,
+            REMOVE: self.on_remove,
+        }
+
+    def region_of(self, x: int) -> int:
+        return bisect.bisect_right(self.edges, x) - 1
+
+    def local(self, index: int) -> Optional[Player]:
+        player = self.grid.players[index]
+        return player if isinstance(player, Player) else None
+
+    def spawn(self, indices: List[int], observe: bool):
+        # like Game.spawn_random_player but on the strip, with the 3x3 start territory inside it
+        grid = self.grid
+        players = []
+        for index in indices:
+            for _ in range(11):
+                x, y = self.game.random.randint(self.x0 + 1, self.x1 - 2), self.game.random.randint(1, grid.height - 2)
+                if grid.claims[y, x] == NO_PLAYER and grid.trails[y, x] == NO_PLAYER and len(grid.get_occupants(x, y)) == 0:
+                    break
+            player = Player(x, y)
+            player.index = index
+            self.game.add_player(player)
+            players.append(player)
+        # observations refresh the padded board, respawns seen with the next tick do without
+        observations = self.game.get_all_visions(self.vision_range, players) if observe else None
+        return observations, [reward_counters(player) for player in players]
+
+    def tick(self, actions: List[Tuple[int, Optional[int]]]):
+        for index, action in actions:
+            player = self.local(index)
+            if player is not None:
+                player.move_direction = Directions[action] if action is not None else None
+        playing = self.game.players
+        self.game.update()
+        self.collect(playing)
+
+        # players whose head left the strip go to the region they walked into, with everything they own
+        staying = []
+        for player in self.game.players:
+            if self.x0 <= player.position.x < self.x1:
+                staying.append(player)
+                continue
+            self.grid.remove_occupant(player)
+            self.grid.release_player(player)
+            self.outbox.append((MIGRATE, self.region_of(player.position.x), player.index, player_scalars(player), player.trail, list(player.territory)))
+        self.game.players = staying
+
+    def deliver(self, messages: list):
+        messages.sort(key=lambda message: message[0])
+        removed = []
+        for kind, *message in messages:
+            self.handlers[kind](*message)
+            if kind == REMOVE:
+                removed.append(message[0])
+        self.collect(self.game.players)
+        for index in removed:
+            self.dead.pop(index, None)
+
+    def collect(self, players: List[Player]):
+        for player in players:
+            if not player.is_alive:
+                self.grid.release_player(player)
+                self.dead[player.index] = player
+        self.game.players = [player for player in self.game.players if player.is_alive]
+
+    def on_migrate(self, number: int, index: int, scalars: tuple, trail: List[int], territory: List[int]):
+        player = Player(0, 0)
+        set_player_scalars(player, scalars)
+        player.trail = trail
+        player.territory = set(territory)
+        self.grid.register_player(player)
+        self.game.players.append(player)
+        self.grid.add_occupant(player)
+        cell = player.position.y * self.grid.width + player.position.x
+        if trail and trail[-1] == cell:
+            self.grid.flat_trails[cell] = index
+        self.grid.version += 1
+        self.game.update_player_same_location(player)
+
+    def on_claim(self, number: int, index: int, cells: List[int]):
+        lost = {}
+        for cell, owner in zip(cells, self.grid.flat_claims[cells].tolist()):
+            if owner != NO_PLAYER and owner != index:
+                lost.setdefault(owner, []).append(cell)
+        for owner, owner_cells in lost.items():
+            self.grid.players[owner].territory.difference_update(owner_cells)
+            self.grid.players[owner].claim_count -= len(owner_cells)
+        self.grid.flat_claims[cells] = index
+        self.clear_plane(self.grid.flat_trails, index, cells)
+        self.grid.version += 1
+
+    def on_clear(self, number: int, index: int, cells: List[int]):
+        # only the cells nobody else took in the meantime
+        self.clear_plane(self.grid.flat_trails, index, cells)
+        self.clear_plane(self.grid.flat_claims, index, cells)
+        self.grid.version += 1
+
+    def clear_plane(self, plane: np.ndarray, index: int, cells: List[int]):
+        cells = np.asarray(cells, dtype=np.intp)
+        plane[cells[plane[cells] == index]] = NO_PLAYER
+
+    def on_lost(self, index: int, cells: List[int]):
+        player = self.local(index)
+        if player is not None:
+            player.territory.difference_update(cells)
+
+    def on_count(self, index: int, delta: int):
+        player = self.local(index)
+        if player is not None:
+            player.claim_count += delta
+
+    def on_kill(self, index: int):
+        player = self.local(index)
+        if player is not None:
+            player.kill(self.grid)
+
+    def on_remove(self, index: int):
+        # deliver forgets the player once it is collected
+        self.on_kill(index)
+
+    def observe(self, left: Optional[tuple], right: Optional[tuple], indices: List[int]):
+        # takes in the neighbours' edges (None for the same as last time), returns the observations of the given
+        # players (alive or dead on the strip) and the reward counters of every player on the strip
+        grid, halo = self.grid, self.halo
+        # written every time, moves and captures over the edge write into the halo as well
+        self.halos = [left or self.halos[0], right or self.halos[1]]
+        grid.halo_heads = []
+        for edge, columns in zip(self.halos, (slice(self.x0 - halo, self.x0), slice(self.x1, self.x1 + halo))):
+            if edge is not None:
+                claims, trails, heads = edge
+                grid.claims[:, columns] = claims
+                grid.trails[:, columns] = trails
+                grid.halo_heads += heads
+        grid.version += 1
+
+        players = [self.local(index) or self.dead[index] for index in indices]
+        size = 2 * self.vision_range + 1
+        observations = self.game.get_all_visions(self.vision_range, players) if players else np.empty((0, 4, size, size), dtype=np.int8)
+        counters = {player.index: reward_counters(player) for player in self.game.players}
+        counters.update((index, reward_counters(player)) for index, player in self.dead.items())
+        return observations, counters
+
+    def edges_out(self) -> Optional[Tuple[tuple, tuple]]:
+        # (claims, trails, heads) of the first and of the last `halo` columns of the strip,
+        # None when they did not change since they were last sent
+        grid, halo = self.grid, self.halo
+        if grid.version == self.sent_version:
+            return None
+        self.sent_version = grid.version
+        edges = []
+        for columns in (slice(self.x0, self.x0 + halo), slice(self.x1 - halo, self.x1)):
+            heads = [(player.position.x, player.position.y) for player in self.game.players if columns.start <= player.position.x < columns.stop]
+            edges.append((grid.claims[:, columns].copy(), grid.trails[:, columns].copy(), heads))
+        if self.sent_edges is not None and all(np.array_equal(edge[0], sent[0]) and np.array_equal(edge[1], sent[1]) and edge[2] == sent[2] for edge, sent in zip(edges, self.sent_edges)):
+            return None
+        self.sent_edges = edges
+        return tuple(edges)
+
+    def board(self):
+        # the strip's columns and everything about the players on it, for checks and rendering
+        columns = slice(self.x0, self.x1)
+        players = {player.index: (player_scalars(player), list(player.trail), set(player.territory)) for player in self.game.players}
+        return self.grid.claims[:, columns].copy(), self.grid.trails[:, columns].copy(), players
+
+
+def serve_region(connection, inherited: list, *args):
+    # worker process: one command at a time, every reply carries the region's messages and its edges
+    # the coordinator's ends of this and the earlier workers' pipes came along with the fork, closing them lets
+    # every worker see the coordinator go away
+    for other in inherited:
+        other.close()
+    region = Region(*args)
+    commands = {"spawn": region.spawn, "tick": region.tick, "deliver": region.deliver, "observe": region.observe, "board": region.board}
+    while True:
+        try:
+            command, payload = connection.recv()
+        except EOFError:
+            break
+        if command == "close":
+            break
+        # cpu time, a worker waiting for a core while the others run is not busy
+        started = time.process_time()
+        result = commands[command](*payload)
+        outbox, region.outbox = region.outbox, []
+        edges = region.edges_out()
+        connection.send((result, outbox, edges, time.process_time() - started))
+    connection.close()
+
+
+class ShardedWorld:
+    # the coordinator: starts a Region per worker process, keeps track of which region owns which player and
+    # routes the messages between them until none are left
+    width: int
+    height: int
+    vision_range: int
+    # strip k is columns [edges[k], edges[k + 1])
+    edges: List[int]
+    # region of every player index in use, the region a dead player died on until it is removed
+    owners: Dict[int, int]
+    # calculate_reward counters of every player as of the last tick
+    counters: Dict[int, Tuple[bool, int, int]]
+    # seconds every worker spent on commands, and the sum over all calls of the longest of them: with a core per
+    # worker the workers take about parallel_time, on fewer cores they take up to sum(busy_time)
+    busy_time: List[float]
+    parallel_time: float
+
+    def __init__(self, width: int, height: int, workers: int = 2, vision_range: int = 5, capacity: int = 1024, seed: Optional[int] = None):
+        self.edges = [width * k // workers for k in range(workers + 1)]
+        if min(x1 - x0 for x0, x1 in zip(self.edges, self.edges[1:])) < max(vision_range + 1, 4):
+            raise ValueError(f"{width} columns are too few for {workers} regions with vision range {vision_range}")
+        if capacity > np.iinfo(np.int16).max:
+            raise ValueError(f"at most {np.iinfo(np.int16).max} players fit the grid planes, not {capacity}")
+        self.width = width
+        self.height = height
+        self.vision_range = vision_range
+        self.random = random.Random(seed)
+        self.owners = {}
+        self.counters = {}
+        self.free = list(range(capacity))
+        self.borders = [None] * workers
+        # the edges each region was last sent
+        self.halos = [(None, None)] * workers
+        self.busy_time = [0.0] * workers
+        self.parallel_time = 0.0
+
+        self.connections = []
+        self.processes = []
+        for number in range(workers):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve_region, args=(child, self.connections + [connection], width, height, self.edges, number, vision_range, capacity, self.random.getrandbits(64)), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    @property
+    def workers(self) -> int:
+        return len(self.connections)
+
+    def call(self, commands: Dict[int, tuple]) -> Tuple[Dict[int, object], list]:
+        # every region works on its command at the same time, returns the results and all the messages they sent
+        for number, command in commands.items():
+            self.connections[number].send(command)
+        results, messages, longest = {}, [], 0.0
+        for number in commands:
+            results[number], outbox, edges, busy = self.connections[number].recv()
+            if edges is not None:
+                self.borders[number] = edges
+            messages += outbox
+            self.busy_time[number] += busy
+            longest = max(longest, busy)
+        self.parallel_time += longest
+        return results, messages
+
+    def exchange(self, commands: Dict[int, tuple]) -> Dict[int, object]:
+        results, messages = self.call(commands)
+        while messages:
+            # moves first so the messages about a player reach the region it just walked into
+            for message in messages:
+                if message[0] == MIGRATE:
+                    self.owners[message[2]] = message[1]
+            inboxes = {}
+            for message in messages:
+                number = message[1] if message[0] <= CLEAR else self.owners.get(message[1])
+                if number is not None:
+                    inboxes.setdefault(number, []).append(message)
+            _, messages = self.call({number: ("deliver", (inbox, )) for number, inbox in inboxes.items()})
+        return results
+
+    def spawn(self, count: int = 1, observe: bool = True) -> Tuple[List[int], Optional[np.ndarray]]:
+        # new players, each on a random strip (weighted by its width), returns their indices and observations
+        # (None without observe)
+        if len(self.free) < count:
+            raise RuntimeError(f"{len(self.owners)} of {len(self.owners) + len(self.free)} player indices are in use, no room for {count} more")
+        indices = [heapq.heappop(self.free) for _ in range(count)]
+        requests = {}
+        for index in indices:
+            number = bisect.bisect_right(self.edges, self.random.randrange(self.width)) - 1
+            self.owners[index] = number
+            requests.setdefault(number, []).append(index)
+        results = self.exchange({number: ("spawn", (spawned, observe)) for number, spawned in requests.items()})
+
+        rows = {}
+        for number, (observations, counters) in results.items():
+            self.counters.update(zip(requests[number], counters))
+            if observe:
+                rows.update(zip(requests[number], observations))
+        return indices, np.stack([rows[index] for index in indices]) if observe else None
+
+    def kill(self, *indices: int):
+        # the players stay dead where they are until they are removed
+        self.exchange(self.deliveries([(KILL, index) for index in indices]))
+
+    def remove(self, *indices: int):
+        self.exchange(self.deliveries([(REMOVE, index) for index in indices]))
+        for index in indices:
+            del self.owners[index]
+            self.counters.pop(index, None)
+            heapq.heappush(self.free, index)
+
+    def deliveries(self, messages: list) -> Dict[int, tuple]:
+        # deliver commands taking messages about players to their regions
+        inboxes = {}
+        for message in messages:
+            inboxes.setdefault(self.owners[message[1]], []).append(message)
+        return {number: ("deliver", (inbox, )) for number, inbox in inboxes.items()}
+
+    def step(self, actions: Dict[int, Optional[int]], observe: List[int]) -> np.ndarray:
+        # one tick: actions by player index (None stands still, players without one keep their direction),
+        # returns the observations of the players in observe, in that order
+        commands = {number: ("tick", ([], )) for number in range(self.workers)}
+        for index, action in actions.items():
+            commands[self.owners[index]][1][0].append((index, action))
+        self.exchange(commands)
+
+        requests = {number: [] for number in range(self.workers)}
+        for index in observe:
+            requests[self.owners[index]].append(index)
+        commands = {}
+        for number in range(self.workers):
+            # the right edge of the left neighbour and the left edge of the right one
+            left = self.borders[number - 1][1] if number > 0 else None
+            right = self.borders[number + 1][0] if number < self.workers - 1 else None
+            sent, self.halos[number] = self.halos[number], (left, right)
+            commands[number] = ("observe", (left if left is not sent[0] else None, right if right is not sent[1] else None, requests[number]))
+        results, _ = self.call(commands)
+
+        rows = {}
+        for number, (observations, counters) in results.items():
+            self.counters.update(counters)
+            rows.update(zip(requests[number], observations))
+        size = 2 * self.vision_range + 1
+        return np.stack([rows[index] for index in observe]) if observe else np.empty((0, 4, size, size), dtype=np.int8)
+
+    def board(self) -> Tuple[np.ndarray, np.ndarray, dict]:
+        # the whole claims and trails planes and, by index, (scalars, trail, territory) of every live player
+        results, _ = self.call({number: ("board", ()) for number in range(self.workers)})
+        claims = np.concatenate([results[number][0] for number in range(self.workers)], axis=1)
+        trails = np.concatenate([results[number][1] for number in range(self.workers)], axis=1)
+        players = {}
+        for number in range(self.workers):
+            players.update(results[number][2])
+        return claims, trails, players
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(("close", ()))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+        self.processes = []
+
+
+class ShardedTileServer(TileServer):
+    # a TileServer over a ShardedWorld for boards too large for one process, the same protocol for the clients
+    # (ClientPlayerEnv, ClientVecEnv, packed observations and shared memory rings included), no rendering or recording
+    # with profile the whole world step is one phase, the time the workers spent on it is in the metrics
+    def __init__(self, grid_size=1000, vision_range=5, host='0.0.0.0', port=9909, tick_deadline_ms=1000, missing_action_policy=MissingActionPolicy.REPEAT, workers=2, capacity=1024, seed=None, profile=False, profile_interval=None):
+        # the workers are forked before the server has any threads or sockets
+        self.world = ShardedWorld(grid_size, grid_size, workers, vision_range, capacity, seed)
+        super().__init__(grid_size, vision_range, host, port, tick_deadline_ms, missing_action_policy, profile=profile, profile_interval=profile_interval)
+        # the game lives in the regions
+        self.game = None
+
+    async def handler(self, websocket, path=""):
+        print("new client connected")
+        (index, ), _ = self.world.spawn(observe=False)
+        self.clients[websocket] = {"index": index, "action": None, "reward": 0.0, "encoding": protocol.PLANES, "ring": None}
+        try:
+            async for message in websocket:
+                try:
+                    opcode, action = protocol.decode_request(message)
+                except ValueError as e:
+                    print(e)
+                    continue
+                await self.process_action(websocket, opcode, action)
+        except websockets.ConnectionClosedError:
+            pass
+        finally:
+            client = self.clients.pop(websocket)
+            self.world.remove(client["index"])
+            if client["ring"] is not None:
+                client["ring"].close()
+            await self.scheduler.remove_client(websocket)
+
+    async def process_action(self, websocket: websockets.ClientConnection, opcode: int, action=None):
+        client = self.clients[websocket]
+        if opcode == protocol.RESET:
+            with timed(self.profiler, "reset"):
+                self.world.remove(client["index"])
+                (client["index"], ), (observation, ) = self.world.spawn()
+                client["action"] = None
+                client["reward"] = 0.0
+                client["encoding"] = action
+                self.scheduler.add_client(websocket)
+                if action == protocol.PACKED:
+                    observation = pack_observation(observation)
+                message = self.encode_reply(websocket, protocol.RESET_DONE, observation)
+            await websocket.send(message)
+            return
+
+        if opcode != protocol.ACTION:
+            await super().process_action(websocket, opcode, action)
+            return
+
+        if action not in Directions:
+            print(f"invalid action {action}")
+            return
+
+        client["action"] = action
+        await self.scheduler.submit(websocket)
+
+    async def run_tick(self, acted: set, stragglers: set):
+        # the clients that acted move as they asked, with REPEAT the stragglers keep their direction
+        actions = {self.clients[ws]["index"]: self.clients[ws]["action"] for ws in acted}
+        dropped = []
+        if self.missing_action_policy == MissingActionPolicy.NOOP:
+            actions.update((self.clients[ws]["index"], None) for ws in stragglers)
+        elif self.missing_action_policy == MissingActionPolicy.DROP and len(stragglers) > 0:
+            for ws in stragglers:
+                self.scheduler.discard(ws)
+            self.world.kill(*[self.clients[ws]["index"] for ws in stragglers])
+            self.scheduler.metrics.dropped += len(stragglers)
+            dropped, stragglers = list(stragglers), set()
+
+        before_update = {ws: self.world.counters[client["index"]] for ws, client in self.clients.items()}
+
+        websockets_in_tick = list(acted)
+        with timed(self.profiler, "step"):
+            observations = self.world.step(actions, [self.clients[ws]["index"] for ws in websockets_in_tick])
+        self.step_id += 1
+
+        for ws in stragglers:
+            if before_update[ws][0]:
+                self.clients[ws]["reward"] += calculate_reward(before_update[ws], Counters(*self.world.counters[self.clients[ws]["index"]]))
+
+        with timed(self.profiler, "encode"):
+            packed_indices = [i for i, ws in enumerate(websockets_in_tick) if self.clients[ws]["encoding"] == protocol.PACKED]
+            packed = dict(zip(packed_indices, pack_observation(observations[packed_indices]))) if packed_indices else {}
+
+            data = []
+            for i, ws in enumerate(websockets_in_tick):
+                after = Counters(*self.world.counters[self.clients[ws]["index"]])
+                reward = self.clients[ws]["reward"] + calculate_reward(before_update[ws], after)
+                self.clients[ws]["reward"] = 0.0
+                data.append(self.encode_reply(ws, protocol.STEP, packed[i] if i in packed else observations[i], reward, not after.is_alive))
+        with timed(self.profiler, "send"):
+            await asyncio.gather(
+                *[ws.send(message) for ws, message in zip(websockets_in_tick, data)],
+                *[ws.close() for ws in dropped],
+            )
+
+    def metrics(self) -> dict:
+        # busy is the cpu time of all the workers together, parallel what the step would take with a core per worker
+        alive = sum(counters[0] for counters in self.world.counters.values())
+        return {"clients": len(self.clients), "players": alive, "workers": self.world.workers, "workers_busy_seconds": sum(self.world.busy_time), "workers_parallel_seconds": self.world.parallel_time, **self.scheduler.metrics.summary()}
+
+    def close(self):
+        super().close()
+        self.world.close()
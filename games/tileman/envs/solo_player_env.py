@@ -2,16 +2,23 @@ import cv2
 import numpy as np
 import gymnasium
 from gymnasium import spaces
+import os
 from .objects import Direction, Grid, Player, Tile, Vector, Game, Directions
+from .recording import EpisodeRecorder
+from .packing import pack_observation, packed_space
 import pygame
 
 class SoloPlayerEnv(gymnasium.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 4}
 
 
-    def __init__(self, grid_size=10, vision_range=14, render_mode="rgb_array"):
+    # with record_dir every episode is recorded to record_dir/episode_<n>.tmrec (recording.py)
+    # with packed_observations the planes come bit-packed (packing.py), about a fifth of the int8 planes
+    def __init__(self, grid_size=10, vision_range=14, render_mode="rgb_array", reuse_obs_buffer=False, record_dir=None, keyframe_interval=100, packed_observations=False):
         super(SoloPlayerEnv, self).__init__()
         self.render_mode = render_mode
+        # when set the same observation array is returned and overwritten every step, only safe if the caller copies it
+        self.reuse_obs_buffer = reuse_obs_buffer
 
         self.vision_range = vision_range
         self.grid_size = grid_size
@@ -19,6 +26,10 @@ class SoloPlayerEnv(gymnasium.Env):
         self.player = self.game.spawn_random_player()
 
         self.steps = 0
+        self.record_dir = record_dir
+        self.keyframe_interval = keyframe_interval
+        self.recorder = None
+        self.episodes = 0
 
         self.width = 600
         self.height = 600
@@ -35,17 +46,29 @@ class SoloPlayerEnv(gymnasium.Env):
             shape=(3, self.vision_range*2 + 1, self.vision_range*2 + 1),
             dtype=np.int8
         )
+        self.obs_buffer = np.zeros(self.observation_space.shape, dtype=np.int8)
+        self.packed_observations = packed_observations
+        if packed_observations:
+            self.observation_space = packed_space(3, self.vision_range)
+            self.packed_buffer = np.zeros(self.observation_space.shape, dtype=np.uint8)
         
     def reset(self, seed=None, options=None):
         super().reset(seed=seed, options=options)
         self.steps = 0
-        self.game = Game(self.grid_size, self.grid_size)
-        self.player = self.game.spawn_random_player(seed=seed)
+        # the game's own generator is seeded from the env's, so reset(seed=...) replays the same episodes
+        self.game = Game(self.grid_size, self.grid_size, seed=int(self.np_random.integers(2**63)))
+        if self.record_dir is not None:
+            if self.recorder is not None:
+                self.recorder.close()
+            os.makedirs(self.record_dir, exist_ok=True)
+            self.recorder = EpisodeRecorder(os.path.join(self.record_dir, f"episode_{self.episodes:06d}.tmrec"), self.game, self.keyframe_interval)
+            self.episodes += 1
+        self.player = self.game.spawn_random_player()
 
         if self.render_mode == "human":
             self._render_frame()
 
-        return self.player.get_vision(self.game.grid, self.vision_range), {}  # empty info dict
+        return self._get_obs(), {}  # empty info dict
 
     def step(self, action):
         if action not in Directions:
@@ -76,13 +99,19 @@ class SoloPlayerEnv(gymnasium.Env):
             self._render_frame()
 
         return (
-            self.player.get_vision(self.game.grid, self.vision_range),
+            self._get_obs(),
             reward,
             terminated,
             truncated,
             info,
         )
 
+    def _get_obs(self):
+        observation = self.player.get_vision(self.game.grid, self.vision_range, out=self.obs_buffer)
+        if self.packed_observations:
+            observation = pack_observation(observation, out=self.packed_buffer)
+        return observation if self.reuse_obs_buffer else observation.copy()
+
     def render(self):
         if self.render_mode == "rgb_array":
             cv2.imshow('Window Name', self._render_frame())
@@ -132,6 +161,8 @@ class SoloPlayerEnv(gymnasium.Env):
             )
         
     def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
         if self.screen is not None:
             pygame.display.quit()
             pygame.quit()
@@ -143,4 +174,10 @@ register(
     id='tileman-solo-v0',
     entry_point='games.tileman.envs.solo_player_env:SoloPlayerEnv',
     max_episode_steps=300,
-)
\ No newline at end of file
+)
+register(
+    id='tileman-solo-vec-v0',
+    entry_point='games.tileman.envs.solo_player_env:SoloPlayerEnv',
+    vector_entry_point='games.tileman.envs.vec_env:TilemanVecEnv',
+    max_episode_steps=300,
+)
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set
+import numpy as np
+
+
+class MissingActionPolicy:
+    # what happens to the player of a client that did not send an action before the tick deadline
+    REPEAT = "repeat"  # keeps moving in the last direction it was given
+    NOOP = "noop"  # stands still for the tick
+    DROP = "drop"  # the client is disconnected
+
+    ALL = (REPEAT, NOOP, DROP)
+
+
+class TickMetrics:
+    # latencies of the last `window` ticks, counters since the start
+    def __init__(self, window=1024):
+        self.latencies = deque(maxlen=window)
+        self.ticks = 0
+        self.deadline_ticks = 0
+        self.stragglers = 0
+        self.last_stragglers = 0
+        self.dropped = 0
+
+    def record(self, latency: float, stragglers: int, hit_deadline: bool):
+        self.latencies.append(latency)
+        self.ticks += 1
+        self.deadline_ticks += hit_deadline
+        self.stragglers += stragglers
+        self.last_stragglers = stragglers
+
+    def summary(self) -> Dict[str, float]:
+        latencies = np.fromiter(self.latencies, dtype=np.float64, count=len(self.latencies)) * 1000
+        p50, p90, p99 = np.percentile(latencies, (50, 90, 99)) if len(latencies) > 0 else (0.0, 0.0, 0.0)
+        return {
+            "ticks": self.ticks,
+            "deadline_ticks": self.deadline_ticks,
+            "tick_latency_p50_ms": float(p50),
+            "tick_latency_p90_ms": float(p90),
+            "tick_latency_p99_ms": float(p99),
+            "tick_latency_max_ms": float(latencies.max()) if len(latencies) > 0 else 0.0,
+            "stragglers": self.stragglers,
+            "last_tick_stragglers": self.last_stragglers,
+            "dropped": self.dropped,
+        }
+
+
+class TickScheduler:
+    # lock-step barrier over the connected clients, a tick runs as soon as every client of the tick sent its action
+    # or once deadline_ms passed since the first action of the tick, whichever comes first
+    # on_tick(acted, stragglers) is awaited with the clients that did and did not act in time
+    def __init__(self, deadline_ms: float, on_tick: Callable[[Set[Hashable], Set[Hashable]], Awaitable[None]]):
+        self.deadline = deadline_ms / 1000
+        self.on_tick = on_tick
+        # clients take part from their first reset or action on, a client that connected but never played holds up nobody
+        self.waiting: Set[Hashable] = set()  # still expected to act this tick
+        self.acted: Set[Hashable] = set()
+        self.tick_started: Optional[float] = None
+        self.deadline_task: Optional[asyncio.Task] = None
+        self.metrics = TickMetrics()
+
+    def add_client(self, client: Hashable):
+        if client not in self.acted:
+            self.waiting.add(client)
+
+    def discard(self, client: Hashable):
+        self.waiting.discard(client)
+        self.acted.discard(client)
+
+    async def remove_client(self, client: Hashable):
+        self.discard(client)
+        if self.tick_started is not None and len(self.waiting) == 0:
+            await self.run_tick(hit_deadline=False)
+
+    async def submit(self, client: Hashable):
+        self.waiting.discard(client)
+        self.acted.add(client)
+
+        if self.tick_started is None:
+            self.tick_started = time.perf_counter()
+            self.deadline_task = asyncio.create_task(self.wait_for_deadline())
+
+        if len(self.waiting) == 0:
+            await self.run_tick(hit_deadline=False)
+
+    async def wait_for_deadline(self):
+        await asyncio.sleep(self.deadline)
+        self.deadline_task = None
+        await self.run_tick(hit_deadline=True)
+
+    async def run_tick(self, hit_deadline: bool):
+        if self.deadline_task is not None:
+            self.deadline_task.cancel()
+            self.deadline_task = None
+
+        # the next tick's state is in place before anything is awaited, so actions arriving while
+        # the observations are being sent already count towards the next tick
+        acted, stragglers, started = self.acted, self.waiting, self.tick_started
+        self.waiting = acted | stragglers
+        self.acted = set()
+        self.tick_started = None
+
+        await self.on_tick(acted, stragglers)
+        # from the first action of the tick until its observations are out
+        self.metrics.record(time.perf_counter() - started, len(stragglers), hit_deadline)
+
+    def close(self):
+        if self.deadline_task is not None:
+            self.deadline_task.cancel()
+            self.deadline_task = None
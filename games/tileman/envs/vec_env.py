@@ -0,0 +1,204 @@
+from typing import Any, List
+import numpy as np
+import gymnasium
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices
+from .objects import Directions
+from .packing import pack_observation, packed_space
+
+# cell states of the stacked boards, with a single player per board there is no need to store who owns a cell
+EMPTY = 0
+CLAIM = 1
+TRAIL = 2
+BORDER = 3
+
+# board colors used by get_images, indexed by cell state
+PALETTE = np.array([
+    (0, 0, 0),
+    (230, 230, 230),
+    (190, 190, 190),
+    (20, 20, 20),
+], dtype=np.uint8)
+
+
+class TilemanVecEnv(VecEnv):
+    # num_envs independent solo tileman games (the rules of Game.update with a single player, like SoloPlayerEnv)
+    # stepped together as array operations on one stacked (num_envs, grid_size, grid_size) board
+    metadata = {"render_modes": ["rgb_array"], "render_fps": 4}
+
+    def __init__(self, num_envs=64, grid_size=10, vision_range=14, max_episode_steps=300, render_mode="rgb_array", seed=None, packed_observations=False):
+        self.grid_size = grid_size
+        self.vision_range = vision_range
+        self.max_episode_steps = max_episode_steps
+        self.render_mode = render_mode
+        self.rng = np.random.default_rng(seed)
+
+        # the boards live inside a padded array so out of bounds moves and vision windows need no special casing
+        self.padding = max(vision_range, 1)
+        padded_size = grid_size + 2 * self.padding
+        self.padded = np.full((num_envs, padded_size, padded_size), BORDER, dtype=np.int8)
+        self.boards = self.padded[:, self.padding:self.padding + grid_size, self.padding:self.padding + grid_size]
+        self.boards.fill(EMPTY)
+        size = 2 * vision_range + 1
+        self.windows = np.lib.stride_tricks.sliding_window_view(self.padded, (size, size), axis=(1, 2))
+
+        self.env_indices = np.arange(num_envs)
+        self.xs = np.zeros(num_envs, dtype=np.intp)
+        self.ys = np.zeros(num_envs, dtype=np.intp)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.claim_counts = np.zeros(num_envs, dtype=np.int64)
+        self.moves = np.array([(Directions[action].x, Directions[action].y) for action in range(len(Directions))], dtype=np.intp)
+        self.actions = np.zeros(num_envs, dtype=np.intp)
+        self.observations = np.zeros((num_envs, 3, size, size), dtype=np.int8)
+
+        # with packed_observations the planes are handed out bit-packed like SoloPlayerEnv's (packing.py)
+        self.packed_observations = packed_observations
+        observation_space = packed_space(3, vision_range) if packed_observations else spaces.Box(low=-1, high=1, shape=(3, size, size), dtype=np.int8)
+        super(TilemanVecEnv, self).__init__(num_envs, observation_space, spaces.Discrete(len(Directions)))
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds)
+        self._reset_seeds()
+        self._reset_options()
+
+        self.reset_envs(self.env_indices)
+        self.observe(self.env_indices, self.observations)
+        return self.encode(self.observations)
+
+    def reset_envs(self, indices: np.ndarray):
+        # Game.spawn_random_player + add_player: random tile moved off the border with the 3x3 around it claimed
+        self.boards[indices] = EMPTY
+        self.xs[indices] = np.clip(self.rng.integers(0, self.grid_size, len(indices)), 1, self.grid_size - 2)
+        self.ys[indices] = np.clip(self.rng.integers(0, self.grid_size, len(indices)), 1, self.grid_size - 2)
+        offsets = np.arange(-1, 2)
+        rows = (self.ys[indices][:, None] + offsets)[:, :, None]
+        columns = (self.xs[indices][:, None] + offsets)[:, None, :]
+        self.boards[indices[:, None, None], rows, columns] = CLAIM
+        self.steps[indices] = 0
+        self.claim_counts[indices] = 0
+
+    def observe(self, indices: np.ndarray, out: np.ndarray):
+        # same planes as Player.get_vision: own claims, own trail (both -1) and the border (1)
+        top = self.ys[indices] + self.padding - self.vision_range
+        left = self.xs[indices] + self.padding - self.vision_range
+        windows = self.windows[indices, top, left]
+        np.equal(windows, CLAIM, out=out[:, 0])
+        np.negative(out[:, 0], out=out[:, 0])
+        np.equal(windows, TRAIL, out=out[:, 1])
+        np.negative(out[:, 1], out=out[:, 1])
+        np.equal(windows, BORDER, out=out[:, 2])
+
+    def capture(self, indices: np.ndarray) -> np.ndarray:
+        # Game.update_player_claims: the trail becomes territory and every region it closes off is filled in
+        boards = self.boards[indices]
+        trail = boards == TRAIL
+        boards[trail] = CLAIM
+
+        # grow the free cells in from the board edge, whatever cannot be reached is enclosed
+        free = boards != CLAIM
+        reached = np.zeros_like(free)
+        reached[:, 0] = free[:, 0]
+        reached[:, -1] = free[:, -1]
+        reached[:, :, 0] |= free[:, :, 0]
+        reached[:, :, -1] |= free[:, :, -1]
+        while True:
+            grown = reached.copy()
+            grown[:, 1:] |= reached[:, :-1]
+            grown[:, :-1] |= reached[:, 1:]
+            grown[:, :, 1:] |= reached[:, :, :-1]
+            grown[:, :, :-1] |= reached[:, :, 1:]
+            grown &= free
+            if np.array_equal(grown, reached):
+                break
+            reached = grown
+        enclosed = free & ~reached
+        boards[enclosed] = CLAIM
+
+        self.boards[indices] = boards
+        return trail.sum(axis=(1, 2)) + enclosed.sum(axis=(1, 2))
+
+    def step_async(self, actions: np.ndarray):
+        self.actions = np.asarray(actions, dtype=np.intp).reshape(self.num_envs)
+
+    def step_wait(self):
+        moves = self.moves[self.actions]
+        new_xs = self.xs + moves[:, 0]
+        new_ys = self.ys + moves[:, 1]
+        target = self.padded[self.env_indices, new_ys + self.padding, new_xs + self.padding]
+        current = self.padded[self.env_indices, self.ys + self.padding, self.xs + self.padding]
+
+        # Game.update_player_collisions: walking off the board or into your own trail
+        dead = (target == BORDER) | (target == TRAIL)
+        alive = ~dead
+
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        capturing = np.flatnonzero(alive & (target == CLAIM) & (current != CLAIM))
+        if len(capturing) > 0:
+            captured = self.capture(capturing)
+            self.claim_counts[capturing] += captured
+            rewards[capturing] = captured
+
+        # Game.update_player_move: the player leaves a trail everywhere outside of its territory
+        moving = np.flatnonzero(alive)
+        self.xs[moving] = new_xs[moving]
+        self.ys[moving] = new_ys[moving]
+        cells = self.boards[moving, self.ys[moving], self.xs[moving]]
+        self.boards[moving, self.ys[moving], self.xs[moving]] = np.where(cells == CLAIM, CLAIM, TRAIL)
+        self.steps += 1
+
+        # Player.kill wipes the trail and territory
+        self.boards[dead] = EMPTY
+        rewards[dead] = -1.0
+
+        truncated = alive & (self.steps >= self.max_episode_steps)
+        dones = dead | truncated
+        self.observe(self.env_indices, self.observations)
+
+        infos = [{} for _ in range(self.num_envs)]
+        finished = np.flatnonzero(dones)
+        if len(finished) > 0:
+            for index in finished:
+                infos[index]["terminal_observation"] = self.encode(self.observations[index])
+                infos[index]["TimeLimit.truncated"] = bool(truncated[index])
+            self.reset_envs(finished)
+            reset_observations = np.empty((len(finished), *self.observations.shape[1:]), dtype=np.int8)
+            self.observe(finished, reset_observations)
+            self.observations[finished] = reset_observations
+
+        return self.encode(self.observations), rewards, dones, infos
+
+    def encode(self, observations: np.ndarray) -> np.ndarray:
+        # a copy of the planes, or their packed bytes
+        return pack_observation(observations) if self.packed_observations else observations.copy()
+
+    def close(self):
+        pass
+
+    def get_images(self) -> List[np.ndarray]:
+        tile_size = max(600 // self.grid_size, 1)
+        frames = PALETTE[self.boards]
+        frames[self.env_indices, self.ys, self.xs] = (230, 0, 0)
+        frames = frames.repeat(tile_size, axis=1).repeat(tile_size, axis=2)
+        return list(frames)
+
+    def _indices(self, indices: VecEnvIndices) -> List[int]:
+        if indices is None:
+            return list(range(self.num_envs))
+        if isinstance(indices, int):
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        # every game shares the attributes of the vectorized env
+        return [getattr(self, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type[gymnasium.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._indices(indices)]
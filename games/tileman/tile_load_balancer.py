@@ -1,7 +1,22 @@
 from envs.multi_agent_env import TileServerLoadBalancer
+import argparse
+import signal
+import sys
 
 # fuck this shit
 
 if __name__ == "__main__":
-    balancer = TileServerLoadBalancer()
-    balancer.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=32544)
+    parser.add_argument("--max-players-per-server", type=int, default=4)
+    parser.add_argument("--idle-timeout", type=float, default=30.0)
+    parser.add_argument("--proxy", action="store_true", help="relay the game traffic instead of redirecting clients to the child servers")
+    args = parser.parse_args()
+
+    # terminating the balancer takes its child servers down with it
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    balancer = TileServerLoadBalancer(max_players_per_server=args.max_players_per_server, port=args.port, proxy=args.proxy, idle_timeout=args.idle_timeout)
+    try:
+        balancer.start()
+    finally:
+        balancer.close()
@@ -1,9 +1,34 @@
 from envs.multi_agent_env import TileServer
-import sys
+from envs.sharding import ShardedTileServer
+from envs.tick_scheduler import MissingActionPolicy
+import argparse
 
 # fuck this shit
 
 if __name__ == "__main__":
-    port = sys.argv[1] if len(sys.argv) > 1 else 9909
-    server = TileServer(port=port)
-    server.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("port", type=int, nargs="?", default=9909)
+    parser.add_argument("--grid-size", type=int, default=20)
+    parser.add_argument("--vision-range", type=int, default=5)
+    parser.add_argument("--tick-deadline-ms", type=float, default=1000)
+    parser.add_argument("--missing-action-policy", choices=MissingActionPolicy.ALL, default=MissingActionPolicy.REPEAT)
+    parser.add_argument("--render-mode", choices=TileServer.metadata["render_modes"], default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", type=str, default=None, help="file to record the game to, see envs/recording.py")
+    parser.add_argument("--workers", type=int, default=0, help="split the board across this many worker processes, see envs/sharding.py")
+    parser.add_argument("--profile", action="store_true", help="time every phase of a tick, served on GET /metrics, see envs/profiling.py")
+    parser.add_argument("--profile-interval", type=float, default=None, help="with --profile print a summary of the phase timings every this many seconds")
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        if args.record is not None or args.render_mode is not None:
+            parser.error("a sharded server can neither record nor render")
+        server = ShardedTileServer(grid_size=args.grid_size, vision_range=args.vision_range, port=args.port, tick_deadline_ms=args.tick_deadline_ms, missing_action_policy=args.missing_action_policy, workers=args.workers, seed=args.seed, profile=args.profile, profile_interval=args.profile_interval)
+    else:
+        server = TileServer(grid_size=args.grid_size, vision_range=args.vision_range, port=args.port, tick_deadline_ms=args.tick_deadline_ms, missing_action_policy=args.missing_action_policy, render_mode=args.render_mode, seed=args.seed, record_path=args.record, profile=args.profile, profile_interval=args.profile_interval)
+    try:
+        server.start()
+    finally:
+        if server.recorder is not None:
+            server.recorder.close()
+        print(server.metrics())